@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Evaluating queries over columnar data with :class:plyse.columnar.ColumnarEvaluator, needs numpy.
+
+    python -m benchmarks.columnar [rows]
+"""
+import sys
+from timeit import default_timer
+
+import numpy
+
+from plyse.columnar import ColumnarEvaluator
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+
+QUERIES = [
+    ('int', 'age:30'),
+    ('range', 'age:20..40'),
+    ('and', 'age:20..40 and status:"open" and -score:0..10'),
+    ('or', 'status:"open" or status:"new" or age:3 or age:90..99'),
+    ('repeated', '(age:20..40 and status:"open") or (age:20..40 and status:"new") or -age:20..40'),
+    ('partial', 'name:pet'),
+]
+
+
+def build_columns(rows, seed=7):
+    rnd = numpy.random.RandomState(seed)
+
+    return {
+        'age': rnd.randint(0, 100, rows),
+        'score': rnd.randint(0, 1000, rows),
+        'status': numpy.array(['open', 'new', 'closed', 'pending'])[rnd.randint(0, 4, rows)],
+        'name': numpy.array(['peter', 'mary', 'john', 'paul', 'peterson'])[rnd.randint(0, 5, rows)],
+    }
+
+
+def main(rows=2000000, repeat=20):
+    parser = QueryParser(GrammarFactory.build_default(engine='regex'))
+    evaluator = ColumnarEvaluator(build_columns(rows))
+
+    print("%d rows" % rows)
+    print("%-10s %10s %8s" % ('query', 'matches', 'ms'))
+
+    for name, query_string in QUERIES:
+        tree = parser.parse(query_string).query_as_tree
+        matches = int(evaluator.mask(tree).sum())  # warms up the lower case string columns
+
+        start = default_timer()
+        for _ in range(repeat):
+            evaluator.mask(tree)
+        elapsed = (default_timer() - start) / repeat
+
+        print("%-10s %10d %8.2f" % (name, matches, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
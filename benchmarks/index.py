@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Searching documents with :class:plyse.index.InvertedIndex against filtering them with :meth:Query.compile_predicate.
+
+    python -m benchmarks.index [documents]
+"""
+import sys
+from timeit import default_timer
+
+from plyse.grammar import GrammarFactory
+from plyse.index import InvertedIndex
+from plyse.parser import QueryParser
+
+from .predicate import build_records
+
+QUERIES = [
+    ('term', 'name:peter'),
+    ('rare and', 'name:mary and age:3 and status:"open"'),
+    ('range', 'age:20..40 and tags:"red"'),
+    ('or', 'status:"open" or status:"new" or age:3'),
+    ('not', 'hello and -(status:"closed" or age:90..99)'),
+]
+
+
+def main(amount=1000000, repeat=5):
+    parser = QueryParser(GrammarFactory.build_default(engine='regex'))
+    records = build_records(amount)
+
+    start = default_timer()
+    index = InvertedIndex()
+    index.add_many(records)
+    print("%d documents, indexed in %.1f s" % (amount, default_timer() - start))
+    print("%-10s %8s %10s %10s" % ('query', 'matches', 'index ms', 'scan ms'))
+
+    for name, query_string in QUERIES:
+        query = parser.parse(query_string)
+        predicate = query.compile_predicate()
+
+        start = default_timer()
+        for _ in range(repeat):
+            matches = index.search(query)
+        search_time = (default_timer() - start) / repeat
+
+        start = default_timer()
+        scanned = [doc_id for doc_id, record in enumerate(records) if predicate(record)]
+        scan_time = default_timer() - start
+        assert scanned == matches, name
+
+        print("%-10s %8d %10.1f %10.1f" % (name, len(matches), search_time * 1000, scan_time * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
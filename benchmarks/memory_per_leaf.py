@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Memory taken by the query tree per leaf, dict based nodes against the compact ones (see :mod:plyse.compact_tree).
+
+Only the tree is measured: the grammar parse result is built beforehand, like the parser gets it from the grammar,
+with fresh strings for every term (as pyparsing produces them) and then turned into a tree by
+:meth:QueryParser.parse_elements under tracemalloc.
+
+    python -m benchmarks.memory_per_leaf [leaves]
+"""
+import gc
+import sys
+import tracemalloc
+from timeit import default_timer
+
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+from plyse.term_parser import Term
+
+FIELDS = ['name', 'age', 'city', 'tag', 'created']
+
+
+def _fresh(s):
+    return ''.join(list(s))
+
+
+def build_elements(leaves):
+    elements = []
+
+    for i in range(leaves):
+        if elements:
+            elements.append('AND' if i % 3 else 'OR')
+
+        term = Term(field=_fresh(FIELDS[i % len(FIELDS)]), field_type=_fresh(Term.ATTRIBUTE),
+                    val='value%s' % i, val_type=_fresh(Term.PARTIAL_STRING))
+        elements.append(['NOT', term] if i % 4 == 0 else term)
+
+    return elements
+
+
+def measure(parser, elements):
+    gc.collect()
+    tracemalloc.start()
+
+    start = default_timer()
+    tree = parser.parse_elements(elements)
+    elapsed = default_timer() - start
+
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return tree, size, elapsed
+
+
+def main(leaves=100000):
+    grammar = GrammarFactory.build_default()
+    elements = build_elements(leaves)
+
+    print("%d leaves, python %s" % (leaves, sys.version.split()[0]))
+    print("%-8s %14s %16s %10s" % ('nodes', 'tree bytes', 'bytes per leaf', 'build ms'))
+
+    for name, compact in [('dict', False), ('compact', True)]:
+        tree, size, elapsed = measure(QueryParser(grammar, compact=compact), elements)
+        print("%-8s %14d %16.1f %10.1f" % (name, size, float(size) / leaves, elapsed * 1000))
+        del tree
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Node count of query trees before and after :meth:Query.normalize, and the time it takes.
+
+    python -m benchmarks.normalize
+"""
+from timeit import default_timer
+
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+
+QUERIES = [
+    ('id list', ' or '.join('id:%d' % i for i in range(50))),
+    ('repeated terms', 'name:a or name:a or (age:3 and age:3) or name:a'),
+    ('double negation', 'name:a and --b and --(c or d)'),
+    ('de morgan', '-(-name:a or -name:b or -name:c) and -(-x and -y)'),
+    ('mixed', 'status:"open" or status:"new" or (owner:5 and --team:x) or status:"open" or ' +
+              ' or '.join('tag:"t%d"' % i for i in range(20))),
+]
+
+
+def count_nodes(query):
+    return sum(1 for _ in query.query_as_tree.walk())
+
+
+def main(repeat=200):
+    parser = QueryParser(GrammarFactory.build_default(engine='regex'))
+
+    print("%-16s %8s %8s %12s" % ('query', 'nodes', 'normal', 'normalize ms'))
+
+    for name, query_string in QUERIES:
+        query = parser.parse(query_string)
+        normalized = query.normalize()
+
+        start = default_timer()
+        for _ in range(repeat):
+            query.normalize()
+        elapsed = (default_timer() - start) / repeat
+
+        print("%-16s %8d %8d %12.3f" % (name, count_nodes(query), count_nodes(normalized), elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Filtering in-memory records with :meth:Query.compile_predicate against walking the query tree for every record.
+
+    python -m benchmarks.predicate [records]
+"""
+import random
+import sys
+from timeit import default_timer
+
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+from plyse.term_parser import Term
+
+QUERIES = [
+    ('term', 'name:peter'),
+    ('and', 'name:peter and age:20..40 and status:"open"'),
+    ('or', 'status:"open" or status:"new" or age:3 or tags:"red"'),
+    ('nested', '(name:peter or name:mary) and -(status:"closed" or age:90..99) and hello'),
+]
+
+NAMES = ['peter', 'mary', 'john', 'paul', 'anna', 'mark', 'peterson', 'maryann']
+STATUSES = ['open', 'new', 'closed', 'pending']
+TAGS = ['red', 'green', 'blue']
+
+
+def build_records(amount, seed=7):
+    rnd = random.Random(seed)
+
+    return [{'name': rnd.choice(NAMES), 'age': rnd.randint(0, 99), 'status': rnd.choice(STATUSES),
+             'tags': rnd.sample(TAGS, 2), 'default': rnd.choice(('hello world', 'bye'))}
+            for _ in range(amount)]
+
+
+def naive_match(node, record):
+    """
+    Walks the tree for the record, dispatching on the value type of every term
+    """
+    if node.is_leaf:
+        value, val, val_type = record.get(node[Term.FIELD]), node[Term.VAL], node[Term.VAL_TYPE]
+        values = value if isinstance(value, list) else [value]
+
+        if val_type == Term.PARTIAL_STRING:
+            return any(v is not None and val.lower() in str(v).lower() for v in values)
+
+        if val_type.endswith(Term.RANGE % ''):
+            return any(v is not None and val[0] <= v <= val[1] for v in values)
+
+        return any(v == val for v in values)
+
+    if node.type == 'not':
+        return not naive_match(node.children[0], record)
+
+    if node.type == 'and':
+        return all(naive_match(child, record) for child in node.children)
+
+    return any(naive_match(child, record) for child in node.children)
+
+
+def timed(function):
+    start = default_timer()
+    result = function()
+
+    return result, default_timer() - start
+
+
+def main(amount=1000000):
+    parser = QueryParser(GrammarFactory.build_default(engine='regex'))
+    records = build_records(amount)
+
+    print("%d records" % amount)
+    print("%-8s %8s %10s %12s %8s" % ('query', 'matches', 'naive s', 'compiled s', 'speedup'))
+
+    for name, query_string in QUERIES:
+        query = parser.parse(query_string)
+        tree = query.query_as_tree
+
+        naive, naive_time = timed(lambda: sum(1 for r in records if naive_match(tree, r)))
+        compiled, compiled_time = timed(lambda: sum(1 for r in filter(query.compile_predicate(), records)))
+        assert naive == compiled, (name, naive, compiled)
+
+        print("%-8s %8d %10.3f %12.3f %7.1fx" % (name, compiled, naive_time, compiled_time,
+                                                naive_time / compiled_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,333 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of the parser and query tree hot paths: grammar builds, parsing by amount of terms and nesting depth,
+building trees out of parse results, stacking and combining queries, walking trees and stringifying them.
+
+Every benchmark runs its function in a loop long enough to be timed reliably (at least --min-time seconds) several
+times (--repeat), and reports the best and the median time per call. The queries are fixed, so two runs measure the
+same work. Results can be saved as a JSON baseline and later runs compared against it, a benchmark slower than the
+baseline by more than --threshold is a regression and makes the run exit with status 1:
+
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.25] [--filter parse]
+"""
+import argparse
+import gc
+import json
+import platform
+import re
+import sys
+from collections import namedtuple
+from timeit import default_timer
+
+import plyse
+from plyse.grammar import Grammar, GrammarFactory
+from plyse.parser import QueryParser
+
+BASELINE_VERSION = 1
+
+# the grammar of plyse/plyse_config.yaml, so the suite doesn't need pyyaml
+CONF = {
+    'term_parser': {'class': 'plyse.term_parser.TermParser', 'integer_as_string': False, 'default_fields': [],
+                    'aliases': {}},
+    'operators': [
+        {'not': {'implicit': False, 'symbols': ['not', '-', '!']}},
+        {'and': {'implicit': False, 'symbols': ['and', '+']}},
+        {'or': {'implicit': True, 'symbols': ['or']}},
+    ],
+    'keywords': {'is': ['important', 'critical']},
+    'term': {
+        'field': {'class': 'plyse.expressions.primitives.Field', 'precedence': 10, 'parse_method': 'field_parse'},
+        'values': [
+            {'class': 'plyse.expressions.primitives.PartialString', 'precedence': 3,
+             'parse_method': 'partial_string_parse'},
+            {'class': 'plyse.expressions.primitives.QuotedString', 'precedence': 2,
+             'parse_method': 'quoted_string_parse'},
+            {'class': 'plyse.expressions.primitives.Integer', 'precedence': 4, 'parse_method': 'integer_parse'},
+            {'class': 'plyse.expressions.primitives.IntegerRange', 'precedence': 5,
+             'range_parse_method': 'range_parse', 'item_parse_method': 'integer_parse'},
+        ],
+    },
+}
+
+Benchmark = namedtuple('Benchmark', ['name', 'setup'])  # setup builds the function to time, out of the timed part
+
+Result = namedtuple('Result', ['best', 'median', 'number'])  # seconds per call, and calls per timed loop
+
+TERMS = ['name:peter%d', 'age:%d..99', 'status:"open%d"', 'hello%d', 'is:critical', 'id:%d']
+
+
+def build_query(terms):
+    """
+    Query string with :terms terms of every value type, joined by alternating operators with some negations
+    """
+    parts = []
+
+    for i in range(terms):
+        term = TERMS[i % len(TERMS)]
+        term = term % i if '%d' in term else term
+
+        if parts:
+            parts.append('or' if i % 3 == 0 else 'and')
+
+        parts.append('-' + term if i % 5 == 4 else term)
+
+    return ' '.join(parts)
+
+
+def build_nested_query(depth):
+    """
+    Query string with :depth levels of parenthesis, two terms per level
+    """
+    query = 'name:peter and age:1..10'
+
+    for level in range(depth):
+        query = 'status:"s%d" %s (%s)' % (level, 'or' if level % 2 else 'and', query)
+
+    return query
+
+
+def _parser(engine=None):
+    return QueryParser(GrammarFactory.build_default(engine=engine))
+
+
+def _build_default():
+    return lambda: GrammarFactory.build_default().compile()
+
+
+def _build_from_conf():
+    return lambda: GrammarFactory.build_from_conf(CONF).compile()
+
+
+def _grammar_parse(query_string, engine=None):
+    def setup():
+        grammar = GrammarFactory.build_default(engine=engine).compile()
+        return lambda: grammar.parse(query_string)
+
+    return setup
+
+
+def _parser_parse(query_string, engine=None):
+    def setup():
+        parser = _parser(engine)
+        return lambda: parser.parse(query_string)
+
+    return setup
+
+
+def _parse_elements(query_string):
+    def setup():
+        parser = _parser()
+        elements = GrammarFactory.build_default().parse(query_string)
+        return lambda: parser.parse_elements(elements)
+
+    return setup
+
+
+def _chain(method, length):
+    def setup():
+        parser = _parser()
+        queries = [parser.parse(build_query(4 + i % 3)) for i in range(length)]
+
+        def run():
+            query = queries[0]
+            for other in queries[1:]:
+                query = getattr(query, method)(other)
+            return query
+
+        return run
+
+    return setup
+
+
+def _tree(method, terms):
+    def setup():
+        tree = _parser().parse(build_query(terms)).query_as_tree
+        return getattr(tree, method)
+
+    return setup
+
+
+def _stringify(terms):
+    def setup():
+        parser = _parser()
+        query = parser.parse(build_query(terms))
+        return lambda: parser.stringify(query)
+
+    return setup
+
+
+def build_benchmarks():
+    benchmarks = [
+        Benchmark('grammar.build_default', _build_default),
+        Benchmark('grammar.build_from_conf', _build_from_conf),
+    ]
+
+    for terms in (1, 8, 32):
+        benchmarks.append(Benchmark('grammar.parse/terms=%d' % terms, _grammar_parse(build_query(terms))))
+    for depth in (2, 8):
+        benchmarks.append(Benchmark('grammar.parse/depth=%d' % depth, _grammar_parse(build_nested_query(depth))))
+    for engine in (Grammar.PRECEDENCE_CLIMBING, Grammar.REGEX):
+        benchmarks.append(Benchmark('grammar.parse/terms=32/%s' % engine, _grammar_parse(build_query(32), engine)))
+
+    for terms in (1, 8, 32):
+        benchmarks.append(Benchmark('parser.parse/terms=%d' % terms, _parser_parse(build_query(terms))))
+    for depth in (2, 8):
+        benchmarks.append(Benchmark('parser.parse/depth=%d' % depth, _parser_parse(build_nested_query(depth))))
+    benchmarks.append(Benchmark('parser.parse/terms=32/regex', _parser_parse(build_query(32), Grammar.REGEX)))
+
+    for terms in (8, 128):
+        benchmarks.append(Benchmark('parser.parse_elements/terms=%d' % terms, _parse_elements(build_query(terms))))
+
+    for method in ('stack', 'combine'):
+        benchmarks.append(Benchmark('query.%s/chain=10' % method, _chain(method, 10)))
+
+    for method in ('leaves', 'traverse'):
+        for terms in (8, 128):
+            benchmarks.append(Benchmark('tree.%s/terms=%d' % (method, terms), _tree(method, terms)))
+
+    for terms in (8, 128):
+        benchmarks.append(Benchmark('parser.stringify/terms=%d' % terms, _stringify(terms)))
+
+    return benchmarks
+
+
+def measure(function, repeat=5, min_time=0.05):
+    """
+    Times :function like timeit does: with the garbage collector off, in loops of as many calls as it takes to run for
+    at least :min_time seconds
+
+    :return: :class:Result, seconds per call
+    """
+    number = 1
+
+    while True:
+        elapsed = _timed_loop(function, number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    timings = sorted([elapsed] + [_timed_loop(function, number) for _ in range(repeat - 1)])
+
+    return Result(timings[0] / number, timings[len(timings) // 2] / number, number)
+
+
+def _timed_loop(function, number):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        start = default_timer()
+        for _ in range(number):
+            function()
+        return default_timer() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def run(benchmarks, repeat=5, min_time=0.05, out=sys.stdout):
+    """
+    :return: dict benchmark name -> :class:Result
+    """
+    results = {}
+
+    for benchmark in benchmarks:
+        results[benchmark.name] = result = measure(benchmark.setup(), repeat, min_time)
+        out.write("%-44s %10.2f us %10.2f us %10d\n" % (benchmark.name, result.best * 1e6, result.median * 1e6,
+                                                          result.number))
+        out.flush()
+
+    return results
+
+
+def save_baseline(path, results):
+    baseline = {
+        'version': BASELINE_VERSION,
+        'plyse': plyse.__version__,
+        'python': platform.python_version(),
+        'results': {name: result._asdict() for name, result in results.items()},
+    }
+
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError("'%s' is not a version %d baseline" % (path, BASELINE_VERSION))
+
+    return {name: Result(**result) for name, result in baseline['results'].items()}
+
+
+def compare(baseline, results, threshold=0.25):
+    """
+    Compares the best times of :results against the ones of :baseline
+
+    :return: list of (name, baseline seconds, current seconds, change ratio, status) in the order of :results, status
+             is 'ok', 'faster', 'REGRESSION' or 'new'. Benchmarks only in the baseline are left out
+    """
+    rows = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            rows.append((name, None, result.best, None, 'new'))
+            continue
+
+        change = result.best / baseline[name].best - 1
+        status = 'REGRESSION' if change > threshold else 'faster' if change < -threshold else 'ok'
+        rows.append((name, baseline[name].best, result.best, change, status))
+
+    return rows
+
+
+def format_comparison(rows):
+    lines = ["%-44s %13s %13s %8s  %s" % ('benchmark', 'baseline', 'current', 'change', 'status')]
+
+    for name, base, current, change, status in rows:
+        lines.append("%-44s %13s %10.2f us %8s  %s" % (
+            name, "%10.2f us" % (base * 1e6) if base is not None else '-', current * 1e6,
+            "%+.1f%%" % (change * 100) if change is not None else '-', status))
+
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    arg_parser.add_argument('--filter', help="only run the benchmarks whose name matches this regular expression")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="timed loops per benchmark (default 5)")
+    arg_parser.add_argument('--min-time', type=float, default=0.05, help="min seconds of a timed loop")
+    arg_parser.add_argument('--save', metavar='PATH', help="save the results as a JSON baseline")
+    arg_parser.add_argument('--compare', metavar='PATH', help="compare the results against a JSON baseline")
+    arg_parser.add_argument('--threshold', type=float, default=0.25,
+                            help="slowdown over the baseline that counts as a regression (default 0.25, 25%%)")
+    args = arg_parser.parse_args(argv)
+
+    benchmarks = [b for b in build_benchmarks() if not args.filter or re.search(args.filter, b.name)]
+    baseline = load_baseline(args.compare) if args.compare else None
+
+    print("%-44s %13s %13s %10s" % ('benchmark', 'best', 'median', 'loops'))
+    results = run(benchmarks, args.repeat, args.min_time)
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    if baseline is not None:
+        rows = compare(baseline, results, args.threshold)
+        print("\n" + format_comparison(rows))
+
+        regressions = [row[0] for row in rows if row[4] == 'REGRESSION']
+        if regressions:
+            print("\n%d regression(s) over %.0f%%: %s" % (len(regressions), args.threshold * 100,
+                                                          ", ".join(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
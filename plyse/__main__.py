@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Replays a query log (one query string per line) through the parser and reports throughput, latency percentiles,
+failures and the slowest queries.
+
+    python -m plyse queries.log [--conf plyse_config.yaml] [--workers 4] [--output terms.jsonl]
+
+The exit status is 1 when more than --max-failures queries fail, so it can guard a parser upgrade against a corpus.
+"""
+import argparse
+import io
+import sys
+
+from .replay import (ReplayError, ReplayStats, build_parser, format_report, load_conf, read_log, replay,
+                     result_as_json)
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='python -m plyse', description=__doc__.strip().split('\n\n')[0])
+    arg_parser.add_argument('log', help="query log, one query string per line. '-' reads stdin")
+    arg_parser.add_argument('--conf', help="grammar configuration, YAML or JSON (default grammar if not given)")
+    arg_parser.add_argument('--workers', type=int, default=1, help="parser processes (default 1)")
+    arg_parser.add_argument('--chunksize', type=int, default=100, help="queries sent to a worker at once")
+    arg_parser.add_argument('--cache-size', type=int, default=0, help="parse cache size, 0 parses every query")
+    arg_parser.add_argument('--strict', action='store_true', help="fail the queries that can't be fully parsed")
+    arg_parser.add_argument('--output', help="write the terms of each query (or its error) as JSON lines, '-' "
+                                             "writes them to stdout and the report to stderr")
+    arg_parser.add_argument('--slowest', type=int, default=10, help="amount of slowest queries to report")
+    arg_parser.add_argument('--max-failures', type=int, default=None, help="exit with status 1 above this amount "
+                                                                           "of failed queries")
+    return arg_parser
+
+
+def main(argv=None, stdin=None, stdout=None, stderr=None):
+    stdin, stdout, stderr = stdin or sys.stdin, stdout or sys.stdout, stderr or sys.stderr
+    args = build_arg_parser().parse_args(argv)
+
+    try:
+        conf = load_conf(args.conf) if args.conf else None
+    except (ReplayError, IOError, ValueError) as e:
+        stderr.write("Can't load the configuration: %s\n" % e)
+        return 2
+
+    # the workers build their own parsers, a configuration they can't build is reported once and before replaying
+    try:
+        build_parser(conf)
+    except Exception as e:
+        stderr.write("Can't build the grammar of the configuration: %s: %s\n" % (type(e).__name__, e))
+        return 2
+
+    opened = []  # files opened here, closed whatever happens
+
+    def _open(path, mode):
+        opened.append(io.open(path, mode, encoding='utf-8'))
+        return opened[-1]
+
+    try:
+        try:
+            log_file = stdin if args.log == '-' else _open(args.log, 'r')
+        except IOError as e:
+            stderr.write("Can't open the query log: %s\n" % e)
+            return 2
+
+        try:
+            output = stdout if args.output == '-' else _open(args.output, 'w') if args.output else None
+        except IOError as e:
+            stderr.write("Can't open the output: %s\n" % e)
+            return 2
+
+        report_file = stderr if args.output == '-' else stdout
+        stats = ReplayStats(args.slowest)
+
+        for result in replay(read_log(log_file), conf, args.workers, args.chunksize, args.cache_size, args.strict):
+            stats.add(result)
+
+            if output is not None:
+                output.write(result_as_json(result) + '\n')
+
+        stats.finish()
+    finally:
+        for opened_file in opened:
+            opened_file.close()
+
+    report = stats.report()
+    report_file.write(format_report(report) + '\n')
+
+    return 1 if args.max_failures is not None and report.failures > args.max_failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Canonical form and structural fingerprint of query trees (see :meth:plyse.query.Query.canonical and
+:meth:plyse.query.Query.fingerprint), so semantically equal queries like 'b and a' and 'a + b' get the same key.
+
+The fingerprint of a tree is computed bottom up out of the fingerprints of its subtrees. Chains of the same
+associative operator (AND, OR) add up the fingerprints of their inputs, and addition doesn't care about order or
+nesting, so 'a and (b and c)', '(c and a) and b' and the n-ary 'a and b and c' all get the same fingerprint. The hashes
+are sha1 based, thus stable across processes and python versions, unlike :func:hash.
+"""
+import hashlib
+import numbers
+from collections import namedtuple
+
+from .query_tree import ASSOCIATIVE_TYPES, transform_tree, _chain_operands, _same_or_new
+from .term_parser import Term
+
+_MASK = (1 << 128) - 1
+
+# digest of a subtree and, for AND and OR operators, the sum of the digests of their chain inputs
+NodeDigest = namedtuple('NodeDigest', ['type', 'digest', 'chain_sum'])
+
+
+def _hash(text):
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:32], 16)
+
+
+def _aliased(field, aliases):
+    if isinstance(field, list):
+        return [aliases.get(f, f) for f in field]
+
+    return aliases.get(field, field)
+
+
+def encode_value(value):
+    """
+    Type tagged text encoding of a term value, the same in every python version: strings are text whether they are
+    str, unicode or utf-8 bytes, and ints are ints whether they are int or long. Lists, tuples and dicts are encoded
+    item by item, dicts in key order. Values of any other type fall back to their repr, which isn't stable.
+    """
+    if value is None:
+        return 'n'
+
+    if isinstance(value, bool):
+        return 'b%d' % value
+
+    if isinstance(value, numbers.Integral):
+        return 'i%d;' % value
+
+    if isinstance(value, float):
+        return 'f%s;' % value.hex()
+
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+
+    if isinstance(value, type(u'')):
+        return 's%d:%s' % (len(value), value)
+
+    if isinstance(value, (list, tuple)):
+        return 'l%d:%s' % (len(value), ''.join(encode_value(v) for v in value))
+
+    if isinstance(value, dict):
+        items = sorted((encode_value(k), encode_value(v)) for k, v in value.items())
+        return 'd%d:%s' % (len(items), ''.join(k + v for k, v in items))
+
+    text = repr(value)
+    return 'r%d:%s' % (len(text), text)
+
+
+def term_key(term, aliases=None):
+    """
+    Stable text representation of a term (see :func:encode_value), its fields replaced by the ones they are aliases of
+
+    :param aliases: alias -> field mapping, like :attr:plyse.term_parser.TermParser.aliases
+    """
+    items = dict(term)
+
+    if aliases and Term.FIELD in items:
+        items[Term.FIELD] = _aliased(items[Term.FIELD], aliases)
+
+    return encode_value(items)
+
+
+def leaf_digest(term, aliases=None):
+    return NodeDigest(None, _hash('term:' + term_key(term, aliases)), None)
+
+
+def operator_digest(op_type, children):
+    """
+    Digest of an operator out of the digests of its children, which is what lets a stacked or combined query derive its
+    fingerprint from the fingerprints of its queries
+
+    :param op_type: operator type
+    :param children: :class:NodeDigest of each child
+    :return: :class:NodeDigest
+    """
+    if op_type in ASSOCIATIVE_TYPES:
+        chain_sum = 0
+        for child in children:
+            chain_sum += child.chain_sum if child.type == op_type else child.digest
+
+        chain_sum &= _MASK
+        return NodeDigest(op_type, _hash('%s:%032x' % (op_type, chain_sum)), chain_sum)
+
+    return NodeDigest(op_type, _hash('%s:%s' % (op_type, ','.join('%032x' % c.digest for c in children))), None)
+
+
+def tree_digest(root, aliases=None):
+    """
+    :return: :class:NodeDigest of the tree under :root, walked without recursion
+    """
+    if root is None:
+        return NodeDigest(None, _hash('empty'), None)
+
+    digests = {}  # by node id, the tree keeps the nodes alive
+
+    def _digest(node):
+        if id(node) not in digests:
+            digests[id(node)] = leaf_digest(node, aliases)
+
+        return digests[id(node)]
+
+    def _operator(node, children):
+        digests[id(node)] = operator_digest(node.type, [_digest(child) for child in children])
+        return node
+
+    return _digest(transform_tree(root, _operator))
+
+
+def fingerprint(root, aliases=None):
+    """
+    Structural fingerprint of the tree under :root, as an hex string
+
+    :param aliases: alias -> field mapping, like :attr:plyse.term_parser.TermParser.aliases
+    """
+    return '%032x' % tree_digest(root, aliases).digest
+
+
+def canonical(root, aliases=None):
+    """
+    Canonical version of the tree under :root: chains of AND and OR operators merged into n-ary ones, with their
+    inputs sorted (terms first, in field and value order, then operators by type and fingerprint) and fields replaced
+    by the ones they are aliases of. Equal queries get the same canonical tree.
+
+    :param aliases: alias -> field mapping, like :attr:plyse.term_parser.TermParser.aliases
+    :return: new root, sharing the subtrees that didn't change with :root
+    """
+    digests = {}  # of every operator of the canonical tree, by node id
+    nodes = []  # keeps the nodes alive while their ids are keys
+
+    def _digest(node):
+        return digests[id(node)] if id(node) in digests else leaf_digest(node, aliases)
+
+    def _sort_key(node):
+        return (0, term_key(node, aliases), 0) if node.is_leaf else (1, node.type, digests[id(node)].digest)
+
+    def _canonical_leaf(node):
+        if not aliases or Term.FIELD not in node:
+            return node
+
+        field = _aliased(node[Term.FIELD], aliases)
+        return node if field == node[Term.FIELD] else node.__class__(dict(node, **{Term.FIELD: field}))
+
+    def _canonical(node, children):
+        children = [_canonical_leaf(child) if child.is_leaf else child for child in children]
+
+        if node.type in ASSOCIATIVE_TYPES:
+            children.sort(key=_sort_key)
+
+        canonical_node = _same_or_new(node, children)
+        digests[id(canonical_node)] = operator_digest(canonical_node.type, [_digest(child) for child in children])
+        nodes.append(canonical_node)
+
+        return canonical_node
+
+    if root is not None and root.is_leaf:
+        return _canonical_leaf(root)
+
+    return transform_tree(root, _canonical, _chain_operands)
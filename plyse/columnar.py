@@ -0,0 +1,295 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Vectorized evaluation of queries over columnar data, a dict of NumPy arrays with one entry per field (see
+:meth:plyse.query.Query.mask). Needs numpy, which is an optional dependency (``pip install plyse[numpy]``).
+
+Every term becomes a boolean mask computed with array operations, and the masks are combined with ``&``, ``|`` and
+``~`` following the tree. Masks are written into buffers taken from a pool and given back once their operator has
+used them, so evaluating a query only allocates a handful of arrays whatever its size. Equal terms are evaluated
+once.
+"""
+from .canonical import term_key
+from .query_tree import And, Not, POST_ORDER, flatten_tree, walk_tree
+from .term_parser import Term
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ColumnarError(Exception):
+    pass
+
+
+_NUMERIC_KINDS = 'iufb'
+_STRING_KINDS = 'USO'
+_ENCODED_KINDS = 'US'  # fixed width strings
+
+
+class ColumnarEvaluator(object):
+    """
+    Evaluates queries over a set of columns, all of the same length. Terms are matched against the column of their
+    field:
+
+      - attribute fields use the column of the same name, nested fields (address:zip) the one keyed by the tuple of
+        their names, and terms with several default fields match if any of those columns does. Terms on fields without
+        a column match no row
+      - ints, quoted strings and keyword values match equal values, value sets (see :class:plyse.normalizer.Normalizer)
+        any of their values
+      - ranges and comparisons match numeric columns only
+      - partial strings are case insensitive substrings, where '*' is a wildcard, and match string columns (fixed
+        width or object arrays of strings) only
+
+    Fixed width string columns get encoded once per evaluator, into their distinct values and the position of the
+    value of each row among them, so string terms are matched against the distinct values only. The encoded columns
+    and the pool of mask buffers are kept by the evaluator, keep one around to run several queries over the same
+    columns. Evaluators aren't thread safe.
+    """
+
+    _exact_types = (Term.INT, Term.EXACT_STRING, Term.KEYWORD_VALUE)
+    _string_types = (Term.PARTIAL_STRING, Term.EXACT_STRING, Term.KEYWORD_VALUE, Term.SET % Term.EXACT_STRING,
+                     Term.SET % Term.KEYWORD_VALUE)
+
+    _comparisons = {
+        Term.GREATER_THAN: 'greater',
+        Term.GREATER_EQUAL_THAN: 'greater_equal',
+        Term.LOWER_THAN: 'less',
+        Term.LOWER_EQUAL_THAN: 'less_equal',
+    }
+
+    def __init__(self, columns):
+        """
+        :param columns: dict of field -> 1-dimensional numpy array
+        """
+        if numpy is None:
+            raise ColumnarError("Evaluating queries over columns needs numpy")
+
+        lengths = set(len(column) for column in columns.values())
+        if len(lengths) > 1:
+            raise ColumnarError("Columns have different lengths: %s" % sorted(lengths))
+
+        self._columns = {field: numpy.asarray(column) for field, column in columns.items()}
+        self._size = lengths.pop() if lengths else 0
+        self._encoded_columns = {}
+        self._lower_columns = {}
+        self._pool = []
+
+    @property
+    def size(self):
+        return self._size
+
+    def mask(self, root):
+        """
+        :param root: root :class:TreeNode of the query tree
+        :return: boolean numpy array, True for the rows matching the query. Every row matches an empty query (None
+                 root)
+        """
+        if root is None:
+            return numpy.ones(self._size, dtype=bool)
+
+        tree = flatten_tree(root)
+        uses = {}  # how many times each term appears, by term key
+
+        for leaf in tree.iter_leaves() if not tree.is_leaf else [tree]:
+            key = term_key(leaf)
+            uses[key] = uses.get(key, 0) + 1
+
+        term_masks = {}
+        results = []  # (mask, owned) of the evaluated nodes, owned masks can be written in place
+
+        # in post order the children of an operator are the last results when it comes up
+        for node in walk_tree(tree, POST_ORDER):
+            if node.is_leaf:
+                key = term_key(node)
+
+                if uses[key] == 1:
+                    results.append((self._term_mask(node, self._buffer()), True))
+                    continue
+
+                # a repeated term is evaluated once and its mask is shared by every use, so none of them owns it:
+                # writing it in place would change the inputs of the uses still waiting to be combined
+                if key not in term_masks:
+                    term_masks[key] = self._term_mask(node, self._buffer())
+
+                results.append((term_masks[key], False))
+
+            else:
+                inputs = results[-len(node.children):]
+                del results[-len(node.children):]
+                results.append(self._combine(node, inputs))
+
+        mask, owned = results.pop()
+        result = mask if owned else mask.copy()
+
+        # shared masks were only read, they go back to the pool once every use is combined
+        self._pool.extend(term_masks.values())
+
+        return result
+
+    def _buffer(self):
+        return self._pool.pop() if self._pool else numpy.empty(self._size, dtype=bool)
+
+    def _combine(self, node, inputs):
+        if node.type == Not.type:
+            mask, owned = inputs[0]
+            target = mask if owned else self._buffer()
+            numpy.logical_not(mask, out=target)
+
+            return target, True
+
+        owned = [mask for mask, is_owned in inputs if is_owned]
+        target = owned[0] if owned else self._buffer()
+        combine = numpy.logical_and if node.type == And.type else numpy.logical_or
+
+        if not owned:
+            numpy.copyto(target, inputs[0][0])
+
+        for mask, _ in inputs:
+            if mask is not target:
+                combine(target, mask, out=target)
+
+        self._pool.extend(mask for mask in owned[1:])
+
+        return target, True
+
+    def _term_mask(self, term, out):
+        columns = self._term_columns(term)
+
+        if not columns:
+            out.fill(False)
+            return out
+
+        self._column_mask(columns[0], term, out)
+
+        if len(columns) > 1:
+            other = self._buffer()
+            for column in columns[1:]:
+                numpy.logical_or(out, self._column_mask(column, term, other), out=out)
+
+            self._pool.append(other)
+
+        return out
+
+    def _term_columns(self, term):
+        field = term.get(Term.FIELD)
+
+        if not isinstance(field, list):
+            fields = [field]
+        elif term.get(Term.FIELD_TYPE) == Term.DEFAULT:
+            fields = field
+        else:
+            fields = [tuple(field)]
+
+        return [f for f in fields if f in self._columns]
+
+    def _column_mask(self, field, term, out):
+        column = self._columns[field]
+        val, val_type = term.get(Term.VAL), term.get(Term.VAL_TYPE)
+        kind = column.dtype.kind
+
+        if kind in _ENCODED_KINDS and val_type in self._string_types:
+            self._encoded_mask(field, val, val_type, out)
+
+        elif val_type == Term.PARTIAL_STRING:
+            if kind not in _STRING_KINDS:
+                out.fill(False)
+            else:
+                out[...] = _partial_string_table(self._lower_column(field), val)
+
+        elif val_type in self._comparisons or (val_type and val_type.endswith(Term.RANGE % '')):
+            if kind not in _NUMERIC_KINDS or not _numeric(val):
+                out.fill(False)
+            elif val_type in self._comparisons:
+                getattr(numpy, self._comparisons[val_type])(column, val, out=out)
+            else:
+                high = self._buffer()
+                numpy.greater_equal(column, val[0], out=out)
+                out &= numpy.less_equal(column, val[1], out=high)
+                self._pool.append(high)
+
+        elif val_type and val_type.endswith(Term.SET % ''):
+            values = [v for v in val if _comparable(kind, v)]
+            out[...] = numpy.isin(column, values) if values else False
+
+        elif val_type in self._exact_types:
+            if _comparable(kind, val):
+                numpy.equal(column, val, out=out)
+            else:
+                out.fill(False)
+
+        else:
+            raise ColumnarError("Don't know how to match '%s' values" % val_type)
+
+        return out
+
+    def _encoded_mask(self, field, val, val_type, out):
+        """
+        String terms on fixed width string columns are matched against the distinct values of the column, and the
+        rows get the result of their value out of the column codes (see :meth:_encoded)
+        """
+        values, codes = self._encoded(field)
+
+        if val_type == Term.PARTIAL_STRING:
+            numpy.take(_partial_string_table(numpy.char.lower(values), val), codes, out=out)
+
+        elif val_type in self._exact_types:
+            position = numpy.searchsorted(values, val) if isinstance(val, str) else len(values)
+
+            if position < len(values) and values[position] == val:
+                numpy.equal(codes, position, out=out)
+            else:
+                out.fill(False)
+
+        else:
+            strings = [v for v in val if isinstance(v, str)]
+            numpy.take(numpy.isin(values, strings) if strings else numpy.zeros(len(values), dtype=bool), codes,
+                       out=out)
+
+    def _encoded(self, field):
+        """
+        :return: sorted distinct values of the column and the position of the value of each row among them
+        """
+        if field not in self._encoded_columns:
+            self._encoded_columns[field] = numpy.unique(self._columns[field].astype(str), return_inverse=True)
+
+        return self._encoded_columns[field]
+
+    def _lower_column(self, field):
+        if field not in self._lower_columns:
+            column = self._columns[field]
+            strings = ['' if value is None else str(value) for value in column]
+            self._lower_columns[field] = numpy.char.lower(numpy.array(strings, dtype=str))
+
+        return self._lower_columns[field]
+
+
+def _partial_string_table(lower, val):
+    parts = [part for part in val.lower().split('*') if part]
+
+    if not parts:
+        return numpy.ones(len(lower), dtype=bool)
+
+    # every part has to be found after the end of the previous one
+    found = numpy.char.find(lower, parts[0])
+    matches = found >= 0
+
+    for previous, part in zip(parts, parts[1:]):
+        found = numpy.char.find(lower, part, numpy.where(matches, found + len(previous), 0))
+        matches &= found >= 0
+
+    return matches
+
+
+def _numeric(value):
+    values = value if isinstance(value, list) else [value]
+    return all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+
+
+def _comparable(kind, value):
+    # strings and numbers never match each other, like in python
+    if kind == 'O':
+        return True
+
+    return _numeric(value) if kind in _NUMERIC_KINDS else isinstance(value, str)
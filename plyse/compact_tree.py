@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compact query tree nodes, an opt-in alternative to the dict based ones of :mod:plyse.query_tree
+(see :class:plyse.parser.QueryParser 's compact argument).
+
+Nodes are :__slots__ classes: an operand keeps its term keys as attributes and an operator just its inputs, neither
+of them carries a dict. Field names and field and value types are interned, so the thousands of leaves of a big
+query (or of many queries) share the same few strings. Operands are read only :class:Mapping 's, code that reads
+them as dicts keeps working, and like frozen nodes copying them is the way to get a modifiable
+:class:plyse.query_tree.Operand.
+"""
+import sys
+from copy import copy, deepcopy
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # python 2
+    from collections import Mapping
+
+from .query_tree import (FrozenNodeError, NotOperatorError, OperatorFactoryError, OperatorNode, Operand, And, Or, Not,
+                         PRE_ORDER, freeze_value, freeze_tree, flatten_tree, binarize_tree, balance_tree, walk_tree,
+                         iter_tree_leaves, find_node)
+from .term_parser import Term
+
+_intern = getattr(sys, 'intern', None) or intern  # builtin in python 2
+
+
+def intern_string(value):
+    """
+    Interned :value if it's a string, the value itself otherwise (ej: the list of fields of a multi field term)
+    """
+    return _intern(value) if type(value) is str else value
+
+
+class CompactNode(object):
+    """
+    Freezing primitives of :class:plyse.query_tree.TreeNode for slotted nodes
+    """
+    __slots__ = ()
+
+    @property
+    def is_frozen(self):
+        return self._frozen
+
+    def freeze(self):
+        return freeze_tree(self)
+
+    def flatten(self):
+        return flatten_tree(self)
+
+    def binarize(self):
+        return binarize_tree(self)
+
+    def balance(self):
+        return balance_tree(self)
+
+    def walk(self, order=PRE_ORDER, ignore_negated=False):
+        return walk_tree(self, order, ignore_negated)
+
+    def iter_leaves(self, ignore_negated=False):
+        return iter_tree_leaves(self, ignore_negated)
+
+    def find(self, predicate, order=PRE_ORDER, ignore_negated=False):
+        return find_node(self, predicate, order, ignore_negated)
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise FrozenNodeError("Frozen tree nodes can't be modified, make a copy of the node instead")
+
+
+class CompactOperand(CompactNode, Mapping):
+    """
+    Leaf holding a term. The term keys (:Term.FIELD, :Term.FIELD_TYPE, :Term.VAL and :Term.VAL_TYPE) are slots, any other
+    key a custom term parser adds goes to a dict that only exists for those terms. Keys the term doesn't have are left
+    unset. It is created frozen.
+    """
+    __slots__ = (Term.FIELD, Term.FIELD_TYPE, Term.VAL, Term.VAL_TYPE, '_extra')
+
+    _keys = (Term.FIELD, Term.FIELD_TYPE, Term.VAL, Term.VAL_TYPE)
+    _interned_keys = (Term.FIELD, Term.FIELD_TYPE, Term.VAL_TYPE)
+    _frozen = True
+
+    def __init__(self, *args, **kwargs):
+        items = dict(*args, **kwargs)
+
+        for key in self._keys:
+            if key in items:
+                value = items.pop(key)
+                value = intern_string(value) if key in self._interned_keys else value
+                object.__setattr__(self, key, freeze_value(value))
+
+        object.__setattr__(self, '_extra', dict((k, freeze_value(v)) for k, v in items.items()) or None)
+
+    def __getitem__(self, key):
+        if key in self._keys:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+
+        raise KeyError(key)
+
+    def __getattr__(self, name):
+        # only called for unset term keys and for the extra ones
+        if name != '_extra' and self._extra is not None and name in self._extra:
+            return self._extra[name]
+
+        raise AttributeError("Operand doesn't have an attribute named '%s'" % name)
+
+    def __iter__(self):
+        for key in self._keys:
+            if hasattr(self, key):
+                yield key
+
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, name, val):
+        self._check_mutable()
+
+    def __setitem__(self, key, val):
+        self._check_mutable()
+
+    def __delitem__(self, key):
+        self._check_mutable()
+
+    def _freeze_node(self):
+        pass
+
+    @property
+    def is_leaf(self):
+        return True
+
+    @property
+    def children(self, *args, **kwargs):
+        return []
+
+    def leaves(self, *args, **kwargs):
+        return [self]
+
+    def __copy__(self):
+        return copy(Operand(self))
+
+    def __deepcopy__(self, memo):
+        return Operand(deepcopy(dict(self), memo))
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactOperator(OperatorNode, CompactNode):
+    __slots__ = ('_operands', '_frozen')
+
+    def __init__(self, operands=None):
+        self._frozen = False
+        self._operands = [] if not operands else operands
+
+    def __setattr__(self, name, val):
+        if name != '_frozen':
+            self._check_mutable()
+
+        object.__setattr__(self, name, val)
+
+    def _freeze_node(self):
+        self._operands = tuple(self._operands)
+        self._frozen = True
+
+
+class CompactAnd(CompactOperator):
+    __slots__ = ()
+
+    type = And.type
+
+    def has_left_operand(self):
+        return True
+
+    def has_right_operand(self):
+        return True
+
+
+class CompactOr(CompactOperator):
+    __slots__ = ()
+
+    type = Or.type
+
+    def has_left_operand(self):
+        return True
+
+    def has_right_operand(self):
+        return True
+
+
+class CompactNot(CompactOperator):
+    __slots__ = ()
+
+    type = Not.type
+
+    def has_left_operand(self):
+        return False
+
+    def has_right_operand(self):
+        return True
+
+    def add_input(self, operand):
+        self._check_mutable()
+
+        if not self._operands:
+            self._operands.append(operand)
+        else:
+            raise NotOperatorError("Cannot add more than one input to Not Operator")
+
+        return self
+
+
+class CompactOperatorFactory(object):
+
+    @staticmethod
+    def create(op_type, operands=None):
+        if op_type.lower() == Or.type:
+            return CompactOr(operands)
+        elif op_type.lower() == And.type:
+            return CompactAnd(operands)
+        elif op_type.lower() == Not.type:
+            return CompactNot(operands)
+        else:
+            raise OperatorFactoryError("Cannot create an operator of type '%s'" % op_type)
@@ -0,0 +1,264 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compiles query trees into the Elasticsearch/OpenSearch bool query DSL (see :class:ESCompiler and
+:meth:plyse.query.Query.to_es).
+"""
+from .query_tree import And, Not, POST_ORDER, flatten_tree, walk_tree
+from .term_parser import Term
+
+
+class ESCompilerError(Exception):
+    pass
+
+
+_COMPARISONS = {
+    Term.GREATER_THAN: 'gt',
+    Term.GREATER_EQUAL_THAN: 'gte',
+    Term.LOWER_THAN: 'lt',
+    Term.LOWER_EQUAL_THAN: 'lte',
+}
+
+# side of the range each bound sets, a range has at most one bound per side (with two, one overrides the other)
+_SIDES = {'gt': 'lower', 'gte': 'lower', 'lt': 'upper', 'lte': 'upper'}
+
+
+def wildcard_pattern(value):
+    """
+    Wildcard query pattern matching the values that contain :value, where '*' is a wildcard. The other wildcard of the
+    DSL ('?') and its escape character are escaped
+    """
+    return '*' + value.replace('\\', '\\\\').replace('?', '\\?') + '*'
+
+
+def _bool(**clauses):
+    return {'bool': clauses}
+
+
+def _any_of(clauses):
+    if not clauses:
+        # a term without fields (ej: no default fields) matches nothing, an empty should would match everything
+        return {'match_none': {}}
+
+    return clauses[0] if len(clauses) == 1 else _bool(should=clauses, minimum_should_match=1)
+
+
+def _bool_with(clause, keys):
+    """
+    Clauses of :clause if it's a bool query with nothing but (some of) :keys, None otherwise
+    """
+    if len(clause) == 1 and 'bool' in clause and set(clause['bool']) <= keys:
+        return clause['bool']
+
+    return None
+
+
+def _merge_terms(clauses):
+    """
+    Joins the term and terms clauses on the same field into a single terms clause, at the place of the first one. Only
+    right where the clauses are ORed (should and must_not)
+    """
+    merged, by_field = [], {}
+
+    for clause in clauses:
+        kind = 'term' if 'term' in clause else 'terms' if 'terms' in clause else None
+
+        if kind is None or len(clause) != 1 or len(clause[kind]) != 1:
+            merged.append(clause)
+            continue
+
+        (field, value), = clause[kind].items()
+        values = [value] if kind == 'term' else value
+
+        if field not in by_field:
+            by_field[field] = []
+            merged.append(field)
+
+        by_field[field].extend(v for v in values if v not in by_field[field])
+
+    return [_term_clause(c, by_field[c]) if isinstance(c, str) else c for c in merged]
+
+
+def _term_clause(field, values):
+    return {'term': {field: values[0]}} if len(values) == 1 else {'terms': {field: values}}
+
+
+def _merge_ranges(clauses):
+    """
+    Joins the range clauses on the same field that bound different sides (ej: gt and lte) into a single range clause.
+    Only right where the clauses are ANDed (filter)
+    """
+    merged, by_field = [], {}
+
+    for clause in clauses:
+        if 'range' not in clause or len(clause) != 1 or len(clause['range']) != 1:
+            merged.append(clause)
+            continue
+
+        (field, bounds), = clause['range'].items()
+        sides = set(_SIDES[op] for op in bounds)
+        target = next((b for b in by_field.get(field, []) if not sides & set(_SIDES[op] for op in b)), None)
+
+        if target is not None:
+            target.update(bounds)
+        else:
+            by_field.setdefault(field, []).append(bounds)
+            merged.append(clause)
+
+    return merged
+
+
+class ESCompiler(object):
+    """
+    Turns query trees into an Elasticsearch/OpenSearch bool query where no clause is scored, so every clause is
+    eligible for the node query cache and the bitsets of frequent filters get reused across queries:
+
+      - AND puts its inputs under 'filter', and the negated ones under 'must_not'
+      - OR puts its inputs under 'should', with minimum_should_match 1 (should clauses of a filter context aren't
+        scored either)
+      - NOT puts its input under 'must_not', and NOT of an OR lists the inputs of the OR under 'must_not'
+
+    Nested bool queries of the same kind are flattened into their parent, double negations cancel out, terms on the
+    same field under OR (and negated under AND) become a single 'terms' clause, and comparisons on the same field under
+    AND bounding different sides become a single 'range' clause.
+
+    Terms become clauses according to their value type:
+
+      - ints, quoted strings, keyword values: term
+      - value sets (see :class:plyse.normalizer.Normalizer): terms
+      - ranges and comparisons: range
+      - partial strings: wildcard '*value*', where '*' is a wildcard (see :func:wildcard_pattern)
+      - terms with several default fields match any of them, and with none match_none
+
+    The result is a plain dict, to be used as the 'query' of a search request.
+    """
+
+    def __init__(self, fields=None, default_fields=None, case_insensitive=True):
+        """
+        :param fields: field -> index field, ej: 'status' -> 'status.keyword', nested fields (address:zip) as tuples.
+                       Other fields keep their name, nested ones joined with dots
+        :param default_fields: index fields to search for terms with no field, instead of the default fields of the
+                               terms
+        :param case_insensitive: whether partial strings ignore case, needs Elasticsearch 7.10 or later
+        """
+        self._fields = fields or {}
+        self._default_fields = list(default_fields) if default_fields else None
+        self._case_insensitive = case_insensitive
+
+    def compile(self, root):
+        """
+        :param root: root :class:TreeNode of the query tree
+        :return: query dict. An empty query (None root) is match_all
+        """
+        if root is None:
+            return {'match_all': {}}
+
+        results = []
+
+        # in post order the children of an operator are the last results when it comes up
+        for node in walk_tree(flatten_tree(root), POST_ORDER):
+            if node.is_leaf:
+                results.append(_any_of([self._clause(field, node) for field in self._term_fields(node)]))
+
+            elif node.type == Not.type:
+                results.append(self._negate(results.pop()))
+
+            else:
+                inputs = results[-len(node.children):]
+                del results[-len(node.children):]
+                results.append(self._all_of(inputs) if node.type == And.type else self._any(inputs))
+
+        query = results.pop()
+
+        # a bool query without should clauses is already a filter, anything else gets wrapped to skip scoring
+        return query if _bool_with(query, {'filter', 'must_not'}) else _bool(filter=[query])
+
+    @staticmethod
+    def _all_of(inputs):
+        filters, negated = [], []
+
+        for clause in inputs:
+            nested = _bool_with(clause, {'filter', 'must_not'})
+
+            if nested is None:
+                filters.append(clause)
+            else:
+                filters.extend(nested.get('filter', []))
+                negated.extend(nested.get('must_not', []))
+
+        filters, negated = _merge_ranges(filters), _merge_terms(negated)
+
+        if len(filters) == 1 and not negated:
+            return filters[0]
+
+        clauses = {}
+        if filters:
+            clauses['filter'] = filters
+        if negated:
+            clauses['must_not'] = negated
+
+        return _bool(**clauses)
+
+    @staticmethod
+    def _any(inputs):
+        should = []
+
+        for clause in inputs:
+            nested = _bool_with(clause, {'should', 'minimum_should_match'})
+            should.extend(nested['should'] if nested is not None else [clause])
+
+        return _any_of(_merge_terms(should))
+
+    @staticmethod
+    def _negate(clause):
+        negated = _bool_with(clause, {'must_not'})
+        if negated is not None and len(negated['must_not']) == 1:
+            return negated['must_not'][0]
+
+        # not (a or b) is none of them
+        alternatives = _bool_with(clause, {'should', 'minimum_should_match'})
+
+        return _bool(must_not=alternatives['should'] if alternatives is not None else [clause])
+
+    def _term_fields(self, term):
+        field = term.get(Term.FIELD)
+
+        if term.get(Term.FIELD_TYPE) == Term.DEFAULT:
+            if self._default_fields:
+                return self._default_fields
+
+            fields = field if isinstance(field, list) else [field]
+        else:
+            fields = [tuple(field) if isinstance(field, list) else field]
+
+        return [self._index_field(f) for f in fields]
+
+    def _index_field(self, field):
+        if field in self._fields:
+            return self._fields[field]
+
+        return '.'.join(field) if isinstance(field, tuple) else field
+
+    def _clause(self, field, term):
+        val, val_type = term.get(Term.VAL), term.get(Term.VAL_TYPE)
+
+        if val_type in (Term.INT, Term.EXACT_STRING, Term.KEYWORD_VALUE):
+            return {'term': {field: val}}
+
+        if val_type == Term.PARTIAL_STRING:
+            wildcard = {'value': wildcard_pattern(val)}
+            if self._case_insensitive:
+                wildcard['case_insensitive'] = True
+
+            return {'wildcard': {field: wildcard}}
+
+        if val_type in _COMPARISONS:
+            return {'range': {field: {_COMPARISONS[val_type]: val}}}
+
+        if val_type and val_type.endswith(Term.RANGE % ''):
+            return {'range': {field: {'gte': val[0], 'lte': val[1]}}}
+
+        if val_type and val_type.endswith(Term.SET % ''):
+            return {'terms': {field: list(val)}}
+
+        raise ESCompilerError("Don't know how to compile '%s' values" % val_type)
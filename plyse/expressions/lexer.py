@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import re
+from pyparsing import Keyword, ParseResults
+
+from .primitives import SimpleWord, caseless_pattern, run_parse_actions, WHITESPACE_PATTERN
+
+
+class LexerError(Exception):
+    pass
+
+
+class Lexer(object):
+    """
+    Compiles the operators, keywords and term (field and value types) of a grammar into one master regular expression
+    with a named group for each of them. A single re.finditer pass over the query string splits it in typed tokens,
+    which the :class:RegexScanner hands to :class:plyse.expressions.precedence.PrecedenceClimbing. Matched keywords,
+    fields and values are turned into tokens by their own parse actions, so the :class:TermParser callbacks build the
+    same terms they would for the pyparsing expressions.
+
+    Value types are tried in the term's order (precedence order when built through TermFactory). Since pyparsing
+    picks the longest value, a value ranked above a word type gives way to the word when the word is longer.
+    Every part of the grammar needs a lexer_pattern, see :class:plyse.expressions.primitives.BaseType
+    """
+
+    WHITESPACE = 'ws'
+    LPAR = 'lpar'
+    RPAR = 'rpar'
+    FIELD = 'field'
+    MISMATCH = 'mismatch'
+
+    def __init__(self, term, keywords, operators, lpar='(', rpar=')'):
+        self._term = term
+        self._keywords = dict(("keyword%s" % i, k) for i, k in enumerate(keywords))
+        self._values = dict(("value%s" % i, v) for i, v in enumerate(term.values))
+        values = list(term.values)
+        self._operators = {}
+
+        for elem in [term.field] + values + list(keywords):
+            if getattr(elem, 'lexer_pattern', None) is None:
+                raise LexerError("'%s' can't be matched by the regex lexer" % getattr(elem, 'name', elem))
+
+        operators_alt = []
+        for op in operators:
+            group = "op_%s" % op.name
+            pattern = self._operator_pattern(op)
+
+            self._operators[group] = re.compile(pattern)
+            operators_alt.append(self._group(group, pattern))
+
+        keywords_alt = [self._group(name, self._keywords[name].lexer_pattern) for name in sorted(self._keywords)]
+        field_alt = [self._group(self.FIELD, term.field.lexer_pattern)]
+        values_alt = self._values_alternatives(values)
+
+        self.master = re.compile("|".join(
+            [self._group(self.WHITESPACE, r'[ \t\n\r]+'),
+             self._group(self.LPAR, re.escape(lpar)),
+             self._group(self.RPAR, re.escape(rpar))] +
+            operators_alt + keywords_alt + field_alt + values_alt +
+            [self._group(self.MISMATCH, r'.')]
+        ))
+
+        self.operand = re.compile("|".join(keywords_alt + field_alt + values_alt))
+        self.value = re.compile("|".join(values_alt))
+        self.whitespace = re.compile(WHITESPACE_PATTERN)
+
+    @staticmethod
+    def _group(name, pattern):
+        return "(?P<%s>%s)" % (name, pattern)
+
+    @staticmethod
+    def _operator_pattern(operator):
+        # Same as :class:plyse.expressions.operators.Operator, single char symbols are literals and longer ones
+        # caseless keywords
+        ident = "[%s]" % re.escape(Keyword.DEFAULT_KEYWORD_CHARS)
+        symbols = ["(?<!%s)%s(?!%s)" % (ident, caseless_pattern(s), ident) if len(s) > 1 else re.escape(s)
+                   for s in operator.symbols]
+
+        return "|".join(symbols)
+
+    def _values_alternatives(self, values):
+        alternatives = [self._group("value%s" % i, v.lexer_pattern) for i, v in enumerate(values)]
+        words = [i for i, v in enumerate(values) if isinstance(v, SimpleWord)]
+
+        # Values ranked above the first word type and the regex matching only that word
+        self._above_word = set("value%s" % i for i in range(words[0])) if words else set()
+        self._word = re.compile(alternatives[words[0]]) if words else None
+
+        return alternatives
+
+    def tokenize(self, instring):
+        """
+        Splits :instring in a single pass
+
+        :return: dict mapping each token location to its match, the match lastgroup is the token type
+        """
+        return dict((m.start(), m) for m in self.master.finditer(instring))
+
+    def scanner(self, instring):
+        return RegexScanner(self, instring)
+
+    def keyword_tokens(self, string, location, match):
+        return self._keywords[match.lastgroup].lexer_tokens(string, location, match.group())
+
+    def term_tokens(self, string, location, field_match, value_match):
+        tokens = []
+
+        if field_match is not None:
+            tokens.extend(self._term.field.lexer_tokens(string, location, field_match.group()))
+
+        value = self._values[value_match.lastgroup]
+        tokens.extend(value.lexer_tokens(string, value_match.start(), value_match.group()))
+
+        return run_parse_actions(self._term, string, location, [ParseResults(tokens)])
+
+    def longest_value(self, instring, match):
+        """
+        :return: :match or the match of the word type starting at the same location if it's longer
+        """
+        if match.lastgroup in self._above_word:
+            word = self._word.match(instring, match.start())
+
+            if word is not None and word.end() > match.end():
+                return word
+
+        return match
+
+    def is_keyword(self, match):
+        return match.lastgroup in self._keywords
+
+    def is_value(self, match):
+        return match.lastgroup in self._values
+
+    def operator(self, name):
+        return self._operators.get("op_%s" % name)
+
+
+class RegexScanner(object):
+    """
+    Serves operands, operators and parenthesis out of the lexer tokens. Tokens come from a single pass over the query,
+    locations that weren't a token boundary in that pass (ej: an operator symbol that has to be read as the beginning
+    of an operand) are matched on demand.
+    """
+
+    def __init__(self, lexer, instring):
+        self.instring = instring
+        self._lexer = lexer
+        self._tokens = lexer.tokenize(instring)
+        self._operands = {}
+
+    def _token(self, loc):
+        token = self._tokens.get(loc)
+
+        if token is None and loc < len(self.instring):
+            token = self._tokens[loc] = self._lexer.master.match(self.instring, loc)
+
+        return token
+
+    def end(self, loc):
+        token = self._token(loc)
+        return token.end() if token is not None and token.lastgroup == Lexer.WHITESPACE else loc
+
+    def _expect(self, group, loc):
+        token = self._token(self.end(loc))
+        return token.end() if token is not None and token.lastgroup == group else None
+
+    def open_group(self, loc):
+        return self._expect(Lexer.LPAR, loc)
+
+    def close_group(self, loc):
+        return self._expect(Lexer.RPAR, loc)
+
+    def operator(self, level, loc):
+        loc = self.end(loc)
+        token = self._token(loc)
+
+        if token is None:
+            return None
+
+        group = "op_%s" % level.operator.name
+        if token.lastgroup == group:
+            return token.end()
+
+        if token.lastgroup.startswith("op_"):
+            # symbol shared with another operator, which got the token
+            match = self._lexer.operator(level.operator.name).match(self.instring, loc)
+            return match.end() if match else None
+
+        return None
+
+    def operand(self, loc):
+        if loc not in self._operands:
+            self._operands[loc] = self._match_operand(self.end(loc))
+
+        return self._operands[loc]
+
+    def _match_operand(self, loc):
+        lexer, instring = self._lexer, self.instring
+
+        token = self._token(loc)
+        if token is None:
+            return None
+
+        if token.lastgroup != Lexer.FIELD and not lexer.is_keyword(token) and not lexer.is_value(token):
+            token = lexer.operand.match(instring, loc)
+
+            if token is None:
+                return None
+
+        if lexer.is_keyword(token):
+            return token.end(), list(lexer.keyword_tokens(instring, loc, token))
+
+        field, value = None, token
+
+        if token.lastgroup == Lexer.FIELD:
+            field = token
+            value_loc = lexer.whitespace.match(instring, field.end()).end()
+            value = self._token(value_loc)
+
+            if value is None or not lexer.is_value(value):
+                value = lexer.value.match(instring, value_loc)
+
+                if value is None:
+                    return None
+
+        value = lexer.longest_value(instring, value)
+
+        return value.end(), list(lexer.term_tokens(instring, loc, field, value))
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+from pyparsing import Suppress, ParseResults, ParseException, ParseBaseException, ParserElement
+
+
+class OperatorPrecedenceError(Exception):
+    pass
+
+
+class OperatorLevel(object):
+    """
+    One precedence level of the operator table: the operator definition, the token it emits and its arity.
+    Unary operators are right associative (prefix) and binary ones left associative, same as pyparsing's
+    operatorPrecedence is set up by :class:Grammar
+    """
+
+    ARITIES = {'not': 1, 'and': 2, 'or': 2}
+
+    def __init__(self, operator):
+        if operator.name not in self.ARITIES:
+            raise OperatorPrecedenceError("Unknown operator '%s', arity can't be resolved" % operator.name)
+
+        self.operator = operator
+        self.token = operator.name.upper()
+        self.arity = self.ARITIES[operator.name]
+        self.implicit = operator.implicit
+
+
+class PyParsingScanner(object):
+    """
+    Matches operands, operators and parenthesis at a given location using their pyparsing expressions.
+    Operand matches are memoized by location, since backtracking may ask for the same operand more than once.
+    """
+
+    def __init__(self, instring, operand, lpar, rpar):
+        self.instring = instring
+        self._operand = operand
+        self._lpar = lpar
+        self._rpar = rpar
+        self._operands = {}
+
+    def _match(self, expr, loc):
+        try:
+            return expr._parse(self.instring, loc)
+        except ParseBaseException:
+            return None
+
+    def operand(self, loc):
+        """
+        :return: tuple (end location, token list) or None if there's no operand at loc
+        """
+        if loc not in self._operands:
+            match = self._match(self._operand, loc)
+            self._operands[loc] = (match[0], list(match[1])) if match else None
+
+        return self._operands[loc]
+
+    def operator(self, level, loc):
+        """
+        :return: end location of the operator symbol or None if there's no symbol at loc
+        """
+        match = self._match(level.operator, loc)
+        return match[0] if match else None
+
+    def open_group(self, loc):
+        match = self._match(self._lpar, loc)
+        return match[0] if match else None
+
+    def close_group(self, loc):
+        match = self._match(self._rpar, loc)
+        return match[0] if match else None
+
+    def end(self, loc):
+        """
+        :return: location after skipping trailing whitespace
+        """
+        return self._operand.preParse(self.instring, loc)
+
+
+class PrecedenceClimbing(object):
+    """
+    Precedence climbing alternative to pyparsing's operatorPrecedence. Operands and operator symbols are still matched
+    by their pyparsing expressions, but precedence is resolved in a single left to right pass, iterating over each
+    level's operators instead of having every level re-try the lower ones. The parse result has the same structure
+    operatorPrecedence produces: operands and operator tokens of the same level are grouped in a nested list, as long
+    as the level has at least one operator.
+
+    Operators are expected in precedence order, from the highest to the lowest. If a
+    :class:plyse.expressions.lexer.Lexer is given, operands and operators are matched with its tokens instead.
+    """
+
+    def __init__(self, operand, operators, lpar=Suppress('('), rpar=Suppress(')'), lexer=None):
+        self._operand = operand
+        self._levels = [OperatorLevel(op) for op in operators]
+        self._lpar = lpar
+        self._rpar = rpar
+        self._lexer = lexer
+
+        for expr in [operand, lpar, rpar] + [level.operator for level in self._levels]:
+            expr.streamline()
+
+    def _scanner(self, instring):
+        if self._lexer is not None:
+            return self._lexer.scanner(instring)
+
+        return PyParsingScanner(instring, self._operand, self._lpar, self._rpar)
+
+    def parseString(self, instring, parseAll=False):
+        ParserElement.resetCache()
+        instring = instring.expandtabs()
+        scanner = self._scanner(instring)
+
+        match = self._parse_level(scanner, len(self._levels) - 1, 0)
+        if match is None:
+            raise ParseException(instring, 0, "Expected an operand or a group")
+
+        loc, tokens = match
+        if parseAll:
+            loc = scanner.end(loc)
+
+            if loc < len(instring):
+                raise ParseException(instring, loc, "Expected end of text")
+
+        return ParseResults(tokens)
+
+    def _parse_level(self, scanner, index, loc):
+        """
+        Matches an expression of the operators at level :index (or higher) starting at :loc
+
+        :return: tuple (end location, token list) or None if there's no match
+        """
+        if index < 0:
+            return self._parse_atom(scanner, loc)
+
+        level = self._levels[index]
+
+        if level.arity == 1:
+            return self._parse_unary(scanner, level, index, loc)
+
+        return self._parse_binary(scanner, level, index, loc)
+
+    def _parse_unary(self, scanner, level, index, loc):
+        # Consume the chain of prefix operators. If what follows the last one is not an operand, that operator's
+        # symbol gets a chance to be matched as the beginning of an operand itself (ej: '-' as a word)
+        starts = []
+        end = scanner.operator(level, loc)
+
+        while end is not None:
+            starts.append(loc)
+            loc = end
+            end = scanner.operator(level, loc)
+
+        match = self._parse_level(scanner, index - 1, loc)
+
+        while match is None and starts:
+            match = self._parse_level(scanner, index - 1, starts.pop())
+
+        if match is None:
+            return None
+
+        end, tokens = match
+        for _ in starts:
+            tokens = [ParseResults([level.token] + tokens)]
+
+        return end, tokens
+
+    def _parse_binary(self, scanner, level, index, loc):
+        match = self._parse_level(scanner, index - 1, loc)
+        if match is None:
+            return None
+
+        loc, tokens = match
+        group = list(tokens)
+        grouped = False
+
+        while True:
+            op_end = scanner.operator(level, loc)
+
+            if op_end is None:
+                if not level.implicit:
+                    break
+
+                op_end = loc
+
+            match = self._parse_level(scanner, index - 1, op_end)
+            if match is None:
+                break
+
+            loc, tokens = match
+            group.append(level.token)
+            group.extend(tokens)
+            grouped = True
+
+        return loc, ([ParseResults(group)] if grouped else group)
+
+    def _parse_atom(self, scanner, loc):
+        match = scanner.operand(loc)
+        if match is not None:
+            return match
+
+        start = scanner.open_group(loc)
+        if start is None:
+            return None
+
+        match = self._parse_level(scanner, len(self._levels) - 1, start)
+        if match is None:
+            return None
+
+        end = scanner.close_group(match[0])
+        if end is None:
+            return None
+
+        return end, match[1]
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
+import re
 from pyparsing import (Literal, Word, MatchFirst, CaselessKeyword, Regex, QuotedString as QString,
                        Suppress, Optional, Group, FollowedBy, Combine,
-                       operatorPrecedence, opAssoc, ParseException,
+                       operatorPrecedence, opAssoc, ParseException, ParseResults,
                        ParserElement, alphanums, And, OneOrMore)
 
 from ..util import load_module
@@ -60,37 +61,144 @@ def concatenate(elems, operator='OR', class_to_embed_elem=None):
     return combined_elems
 
 
-class BaseType(object):
+# pyparsing's default whitespace, skipped between the parts of an expression
+WHITESPACE_PATTERN = r'[ \t\n\r]*'
+
+
+def caseless_pattern(text):
+    """
+    Regular expression matching :text in any case, without relying on inline flags
+    """
+    return "".join("[%s%s]" % (re.escape(c.lower()), re.escape(c.upper())) if c.isalpha() else re.escape(c)
+                   for c in text)
+
+
+def run_parse_actions(element, string, location, tokens):
+    """
+    Applies the parse actions of :element to :tokens the same way pyparsing does after matching it
+    """
+    tokens = ParseResults(tokens)
+
+    for fn in element.parseAction:
+        result = fn(string, location, tokens)
+
+        if result is not None and result is not tokens:
+            tokens = ParseResults(result)
+
+    return tokens
+
+
+def _rebuild(cls, args, kwargs):
+    return cls(*args, **kwargs)
+
+
+class Rebuildable(object):
+    """
+    Keeps the arguments an expression was built with, so it gets pickled as them and rebuilt on load. The pyparsing
+    expression itself can't be pickled, its parse actions are wrapped in local functions. Parse methods are pickled
+    as the bound methods they are, along with their :class:TermParser. The class is kept along with the arguments,
+    pyparsing may change the class of an expression while initializing it
+    """
+
+    def __new__(cls, *args, **kwargs):
+        obj = super(Rebuildable, cls).__new__(cls)
+        obj._init_args = (cls, args, kwargs)
+
+        return obj
+
+    def __reduce__(self):
+        return (_rebuild, self._init_args)
+
+    def __copy__(self):
+        # pyparsing copies expressions all the time, those are plain copies and not rebuilt ones
+        cpy = object.__new__(self.__class__)
+        cpy.__dict__.update(self.__dict__)
+
+        return cpy
+
+
+class BaseType(Rebuildable):
 
     name = 'base'
 
+    # Regular expression matching the type, used by :class:plyse.expressions.lexer.Lexer instead of the pyparsing
+    # expression. None if the type can't be matched by a regex
+    lexer_pattern = None
+
     def __init__(self, precedence):
         self.precedence = precedence
 
+    def lexer_tokens(self, string, location, text):
+        """
+        Builds the tokens the pyparsing expression produces, parse actions included, for :text
+        which was matched by :lexer_pattern at :location
+        """
+        raise NotImplementedError()
+
+
+_regex_word_classes = {}
+
+
+def _regex_word_class(cls, regex_cls):
+    """
+    Subclass of both :cls and :regex_cls, the class pyparsing swapped an instance of :cls for
+    """
+    key = (cls, regex_cls)
+
+    if key not in _regex_word_classes:
+        _regex_word_classes[key] = type(cls.__name__, (cls, regex_cls), {'__module__': cls.__module__})
+
+    return _regex_word_classes[key]
+
 
 class BaseWord(Word, BaseType):
 
     name = 'base_word'
 
     def __init__(self, chars, precendece):
+        cls = self.__class__
         Word.__init__(self, chars)
+
+        if self.__class__ is not cls:
+            # pyparsing >= 2.4 swaps the class of words it can match with a regex for its own Word subclass, which
+            # would drop everything defined here. Keeps both, so the regex fast path is still used
+            self.__class__ = _regex_word_class(cls, self.__class__)
+
         BaseType.__init__(self, precendece)
 
+        self.chars = chars
+
+    @property
+    def lexer_pattern(self):
+        return '[%s]+' % re.escape(self.chars)
+
+    def lexer_tokens(self, string, location, text):
+        return run_parse_actions(self, string, location, [text])
+
 
 class SimpleWord(BaseWord):
 
     name = 'simple_word'
 
+    # chars of every simple word, on top of the extra ones it's built with
+    CHARS = alphanums + '_.-'
+
     def __init__(self, parse_method=None, extra_chars=None, precedence=0):
-        extra_chars = extra_chars if extra_chars else ''
-        extra_chars += '_.-'
-        super(SimpleWord, self).__init__(alphanums+extra_chars, precedence)
+        self.word_chars = self.CHARS + (extra_chars or '')
+        super(SimpleWord, self).__init__(self.word_chars, precedence)
 
         self.addParseAction(lambda t: t[0].replace('\\\\', chr(127)).replace('\\', '').replace(chr(127), '\\'))
 
         if parse_method:
             self.addParseAction(parse_method)
 
+    @staticmethod
+    def char_class(chars=CHARS):
+        """
+        Regular expression matching a single char of :chars, the word chars by default
+        """
+        return '[%s]' % re.escape(chars)
+
 
 class FieldName(BaseWord):
 
@@ -118,6 +226,8 @@ class QuotedString(MatchFirst, BaseType):
 
     name = 'quoted_string'
 
+    _whitespace_escapes = [(r'\t', '\t'), (r'\n', '\n'), (r'\f', '\f'), (r'\r', '\r')]
+
     def __init__(self, parse_method=None, precedence=2):
         MatchFirst.__init__(self, [QString('"'), QString("'")])
         BaseType.__init__(self, precedence)
@@ -125,6 +235,19 @@ class QuotedString(MatchFirst, BaseType):
         if parse_method:
             self.addParseAction(parse_method)
 
+    @property
+    def lexer_pattern(self):
+        return "|".join(e.pattern for e in self.exprs)
+
+    def lexer_tokens(self, string, location, text):
+        text = text[1:-1]
+
+        if '\\' in text:
+            for escaped, char in self._whitespace_escapes:
+                text = text.replace(escaped, char)
+
+        return run_parse_actions(self, string, location, [text])
+
 
 class Phrase(OneOrMore, BaseType):
 
@@ -158,11 +281,21 @@ class Integer(Regex, BaseType):
         if parse_method:
             self.addParseAction(parse_method)
 
+    @property
+    def lexer_pattern(self):
+        return self.pattern
+
+    def lexer_tokens(self, string, location, text):
+        return run_parse_actions(self, string, location, [text])
+
 
 class IntegerComparison(And, BaseType):
 
     name = 'integer_comparison'
 
+    lexer_pattern = r'(<=|>=|<|>)' + WHITESPACE_PATTERN + r'(\d+)'
+    _lexer_re = re.compile(lexer_pattern)
+
     def __init__(self, parse_method=None, precedence=9):
         gt_lt_e = Literal('<') ^ Literal("<=") ^ Literal('>') ^ Literal(">=")
         And.__init__(self, [gt_lt_e + Integer()])
@@ -171,42 +304,91 @@ class IntegerComparison(And, BaseType):
         if parse_method:
             self.addParseAction(parse_method)
 
+    def lexer_tokens(self, string, location, text):
+        return run_parse_actions(self, string, location, list(self._lexer_re.match(text).groups()))
+
 
 class IntegerRange(And, BaseType):
 
     name = 'integer_range'
 
     def __init__(self, range_parse_method=None, item_parse_method=None, range_symbol='..', precedence=10):
-        And.__init__(self, [Integer(item_parse_method) + Literal(range_symbol) + Integer(item_parse_method)])
+        item = Integer(item_parse_method)
+        And.__init__(self, [item + Literal(range_symbol) + Integer(item_parse_method)])
         BaseType.__init__(self, precedence)
 
+        self.item = item
+        self.range_symbol = range_symbol
+
         if range_parse_method:
             self.addParseAction(range_parse_method)
 
+        self._lexer_re = re.compile(self.lexer_pattern)
+
+    @property
+    def lexer_pattern(self):
+        return r'(\d+)%s(%s)%s(\d+)' % (WHITESPACE_PATTERN, re.escape(self.range_symbol), WHITESPACE_PATTERN)
+
+    def lexer_tokens(self, string, location, text):
+        start, symbol, end = self._lexer_re.match(text).groups()
+        tokens = list(self.item.lexer_tokens(string, location, start))
+        tokens.append(symbol)
+        tokens.extend(self.item.lexer_tokens(string, location, end))
+
+        return run_parse_actions(self, string, location, tokens)
+
 
 class Field(And, BaseType):
 
     name = 'field'
 
     def __init__(self, parse_method=None, field_separator=':', precedence=11):
-        And.__init__(self, [FieldName() + Literal(field_separator)])
+        field_name = FieldName()
+        And.__init__(self, [field_name + Literal(field_separator)])
         BaseType.__init__(self, precedence)
 
+        self.field_name = field_name
+        self.field_separator = field_separator
+
         if parse_method:
             self.addParseAction(parse_method)
 
+        self._lexer_re = re.compile(self.lexer_pattern)
+
+    @property
+    def lexer_pattern(self):
+        return r'(%s)%s(%s)' % (self.field_name.lexer_pattern, WHITESPACE_PATTERN, re.escape(self.field_separator))
+
+    def lexer_tokens(self, string, location, text):
+        return run_parse_actions(self, string, location, list(self._lexer_re.match(text).groups()))
+
 
 class MultiField(OneOrMore, BaseType):
 
     name = 'multi_field'
 
     def __init__(self, parse_method=None, field_separator=':', precedence=12):
-        OneOrMore.__init__(self, Field(field_separator=field_separator))
+        field = Field(field_separator=field_separator)
+        OneOrMore.__init__(self, field)
         BaseType.__init__(self, precedence)
 
+        self.field = field
+        self.field_separator = field_separator
+
         if parse_method:
             self.addParseAction(parse_method)
 
+    @property
+    def lexer_pattern(self):
+        return r'(?:%s)(?:%s%s)*' % (self.field.lexer_pattern, WHITESPACE_PATTERN, self.field.lexer_pattern)
+
+    def lexer_tokens(self, string, location, text):
+        tokens = []
+        for name_and_separator in self.field._lexer_re.findall(text):
+            tokens.extend(name_and_separator)
+
+        return run_parse_actions(self, string, location, tokens)
+
 
 class StringProximity(And, BaseType):
 
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
-from pyparsing import Optional, Group, Literal, CaselessKeyword, And, OneOrMore
+import re
+from pyparsing import Optional, Group, Literal, CaselessKeyword, Keyword, And, OneOrMore
 
-from .primitives import SimpleWord, Field, PartialString, QuotedString, Integer, IntegerRange, concatenate
+from .primitives import (SimpleWord, Field, PartialString, QuotedString, Integer, IntegerRange, concatenate,
+                         caseless_pattern, run_parse_actions, WHITESPACE_PATTERN, Rebuildable)
 
 
 class TermFactory(object):
@@ -21,19 +23,20 @@ class TermFactory(object):
         return Term(Field(parse_method=parser.field_parse), values, parse_method=parser.term_parse)
 
 
-class Term(Group):
+class Term(Group, Rebuildable):
 
     def __init__(self, field, values, parse_method=None):
         super(Term, self).__init__(Optional(field) + concatenate(values, operator="LONGEST_OR"))
 
         self.field = field
         self.values = values
+        self.parse_method = parse_method
 
         if parse_method:
             self.setParseAction(parse_method)
 
 
-class KeywordTerm(And):
+class KeywordTerm(And, Rebuildable):
 
     def __init__(self, keyword_name, possible_values, separator=':', parse_method=None, allow_other_values=True):
 
@@ -46,6 +49,34 @@ class KeywordTerm(And):
 
         self.name = keyword_name
         self.values = possible_values
+        self.separator = separator
+        self.allow_other_values = allow_other_values
 
         if parse_method:
             self.setParseAction(parse_method)
+
+        self._lexer_re = re.compile(self.lexer_pattern)
+        self._canonical_values = dict((v.upper(), v) for v in possible_values)
+
+    @property
+    def lexer_pattern(self):
+        """
+        Regular expression matching the keyword, used by :class:plyse.expressions.lexer.Lexer.
+        Keyword names and values are caseless keywords, so they can't be preceded or followed by identifier chars
+        """
+        ident = "[%s]" % re.escape(Keyword.DEFAULT_KEYWORD_CHARS)
+        word_char = SimpleWord.char_class()
+        values = ["%s(?!%s)" % (caseless_pattern(v), ident) for v in sorted(self.values, key=len, reverse=True)]
+
+        if self.allow_other_values:
+            # the longest match wins, so a keyword value can't be followed by chars that would make a longer word
+            values = ["%s(?!%s)" % (v, word_char) for v in values] + [word_char + '+']
+
+        return r'(?<!%s)(%s)(?!%s)%s(%s)%s(%s)' % (ident, caseless_pattern(self.name), ident, WHITESPACE_PATTERN,
+                                                  re.escape(self.separator), WHITESPACE_PATTERN, "|".join(values))
+
+    def lexer_tokens(self, string, location, text):
+        _, separator, value = self._lexer_re.match(text).groups()
+        tokens = [self.name, separator, self._canonical_values.get(value.upper(), value)]
+
+        return run_parse_actions(self, string, location, tokens)
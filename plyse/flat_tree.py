@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Array backed encoding of a query tree, for code that walks lots of trees (ej: translators) and doesn't need the linked
+:class:plyse.query_tree.TreeNode objects.
+
+The nodes are stored in post-order in parallel arrays: the kind of each node, the offsets of its children in the
+children array and the index of its term in the term table (-1 for operators). The root is the last node, every
+child comes before its parent and the leaves come in the same (left to right) order as
+:meth:plyse.query_tree.TreeNode.leaves returns them.
+"""
+from array import array
+
+from .query_tree import Operand, OperatorFactory, And, Or, Not
+from .compact_tree import CompactOperand, CompactOperatorFactory
+
+
+class FlatTreeError(Exception):
+    pass
+
+
+# node kinds
+LEAF = 0
+AND = 1
+OR = 2
+NOT = 3
+
+_kinds = {And.type: AND, Or.type: OR, Not.type: NOT}
+_types = {AND: And.type, OR: Or.type, NOT: Not.type}
+
+
+class FlatTree(object):
+
+    __slots__ = ('_kinds', '_child_offsets', '_children', '_term_index', '_terms')
+
+    def __init__(self, kinds=None, child_offsets=None, children=None, term_index=None, terms=None):
+        """
+        Use :meth:from_tree to build one out of a query tree.
+
+        :param kinds: node kinds (LEAF, AND, OR, NOT) in post-order
+        :param child_offsets: children of node i are children[child_offsets[i]:child_offsets[i + 1]]
+        :param children: positions of the children of every node, grouped by parent
+        :param term_index: position in :terms of each node's term, -1 for operators
+        :param terms: term table, frozen leaf nodes
+        """
+        self._kinds = array('B', kinds or [])
+        self._child_offsets = array('l', child_offsets or [0])
+        self._children = array('l', children or [])
+        self._term_index = array('l', term_index or [])
+        self._terms = list(terms or [])
+
+        if not (len(self._kinds) == len(self._term_index) == len(self._child_offsets) - 1):
+            raise FlatTreeError("Node arrays have different lengths")
+
+    @staticmethod
+    def from_tree(root):
+        """
+        Flattens the tree under :root without recursion. Frozen leaves go into the term table as they are, the
+        other ones get frozen copies.
+
+        :param root: root :class:TreeNode or None for an empty tree
+        :return: :class:FlatTree
+        """
+        kinds, child_offsets, children, term_index, terms = array('B'), array('l', [0]), array('l'), array('l'), []
+        pending = [(root, False)] if root is not None else []
+        positions = []  # position of the already flattened nodes, in the order their parents expect them
+
+        while pending:
+            node, expanded = pending.pop()
+
+            if not node.is_leaf and not expanded:
+                pending.append((node, True))
+                pending.extend((child, False) for child in reversed(node.children))
+                continue
+
+            if node.is_leaf:
+                kinds.append(LEAF)
+                term_index.append(len(terms))
+                terms.append(node if node.is_frozen else Operand(node).freeze())
+            else:
+                if node.type not in _kinds:
+                    raise FlatTreeError("Unknown operator type '%s'" % node.type)
+
+                arity = len(node.children)
+                kinds.append(_kinds[node.type])
+                term_index.append(-1)
+                children.extend(positions[len(positions) - arity:])
+                del positions[len(positions) - arity:]
+
+            child_offsets.append(len(children))
+            positions.append(len(kinds) - 1)
+
+        return FlatTree(kinds, child_offsets, children, term_index, terms)
+
+    def to_tree(self, compact=False):
+        """
+        Builds the linked tree back, frozen. Leaves of the term table are reused when they are already nodes of the
+        wanted kind.
+
+        :param compact: build the tree out of the nodes of :mod:plyse.compact_tree
+        :return: root :class:TreeNode or None if the tree is empty
+        """
+        operand_class, factory = (CompactOperand, CompactOperatorFactory) if compact else (Operand, OperatorFactory)
+        offsets, children, terms = self._child_offsets, self._children, self._terms
+        built = []
+
+        for i, kind in enumerate(self._kinds):
+            if kind == LEAF:
+                term = terms[self._term_index[i]]
+                built.append(term if type(term) is operand_class else operand_class(term))
+            else:
+                built.append(factory.create(_types[kind], [built[c] for c in children[offsets[i]:offsets[i + 1]]]))
+
+        return built[-1].freeze() if built else None
+
+    def __len__(self):
+        return len(self._kinds)
+
+    @property
+    def root(self):
+        return len(self._kinds) - 1 if self._kinds else None
+
+    @property
+    def kinds(self):
+        return self._kinds
+
+    @property
+    def terms(self):
+        return self._terms
+
+    def kind(self, position):
+        return self._kinds[position]
+
+    def type(self, position):
+        """
+        Operator type (see :attr:plyse.query_tree.Operator.type) of the node at :position, None for leaves
+        """
+        return _types.get(self._kinds[position])
+
+    def is_leaf(self, position):
+        return self._kinds[position] == LEAF
+
+    def children(self, position):
+        return self._children[self._child_offsets[position]:self._child_offsets[position + 1]]
+
+    def term(self, position):
+        index = self._term_index[position]
+        return self._terms[index] if index >= 0 else None
+
+    def leaves(self, ignore_negated=False):
+        """
+        :param ignore_negated: leave out the leaves under a NOT operator
+        :return: list of terms, in the same order as :meth:TreeNode.leaves
+        """
+        if not ignore_negated or NOT not in self._kinds:
+            return [self._terms[index] for index in self._term_index if index >= 0]
+
+        # the subtree of a node is the contiguous run of positions from the first position of its first child's
+        # subtree up to the node itself. Walking backwards, every NOT hides the run of its subtree
+        offsets, children = self._child_offsets, self._children
+        first = array('l', range(len(self._kinds)))
+
+        for i in range(len(self._kinds)):
+            if offsets[i] != offsets[i + 1]:
+                first[i] = first[children[offsets[i]]]
+
+        negated_from = len(self._kinds)
+        leaves = []
+
+        for i in range(len(self._kinds) - 1, -1, -1):
+            if i >= negated_from:
+                continue
+
+            kind = self._kinds[i]
+
+            if kind == NOT:
+                negated_from = first[i]
+
+            elif kind == LEAF:
+                leaves.append(self._terms[self._term_index[i]])
+
+        return leaves[::-1]
+
+    def traverse(self, node_callback=lambda position: position, leaf_callback=lambda term: term,
+                 ignore_negated=False):
+        """
+        Walks the tree in the same order as :meth:plyse.query_tree.Operator.traverse, calling :node_callback with
+        the position of every operator and :leaf_callback with the term of every leaf
+        """
+        pending = [self.root] if self._kinds else []
+        offsets, children = self._child_offsets, self._children
+
+        while pending:
+            i = pending.pop()
+            kind = self._kinds[i]
+
+            if kind == LEAF:
+                leaf_callback(self._terms[self._term_index[i]])
+
+            elif kind == NOT and ignore_negated:
+                pass
+
+            else:
+                node_callback(i)
+                pending.extend(reversed(children[offsets[i]:offsets[i + 1]]))
+
+    def __eq__(self, other):
+        return (isinstance(other, FlatTree) and self._kinds == other._kinds and
+                self._child_offsets == other._child_offsets and self._children == other._children and
+                [self.term(i) for i in range(len(self))] == [other.term(i) for i in range(len(other))])
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return FlatTree, (self._kinds, self._child_offsets, self._children, self._term_index, self._terms)
+
+    def __repr__(self):
+        return "FlatTree(%d nodes, %d terms)" % (len(self._kinds), len(self._terms))
@@ -0,0 +1,439 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import types
+from .grammar import GrammarFactory
+from .parser import QueryParser
+from .term_parser import TermParserFactory
+from .expressions.lexer import Lexer, LexerError
+from .expressions.precedence import OperatorLevel
+from .expressions.primitives import (PrimitiveFactory, SimpleWord, QuotedString, Integer, IntegerComparison,
+                                     IntegerRange, Field, MultiField, ParseException)
+
+
+class ParserGeneratorError(Exception):
+    pass
+
+
+class ParserGenerator(object):
+    """
+    Generates the source of a standalone recursive descent parser module out of a grammar configuration, the same
+    conf dict :meth:GrammarFactory.build_from_conf takes. The generated module has the lexer regular expressions,
+    one function per operator precedence level and one per value type baked in, and builds the :class:Query tree
+    directly, so no pyparsing expression gets built or interpreted at parse time. The configured term parser
+    callbacks are still the ones building the terms.
+
+    Usage:
+        source = ParserGenerator(conf).generate()  # or write(path) to get an importable module
+        parser = ParserGenerator.load(source)
+        query = parser.parse("name:plyse")
+
+    Only the built in value types with a lexer pattern are supported (see :class:plyse.expressions.lexer.Lexer)
+    """
+
+    DEFAULT_TERM = {
+        'field': {'class': 'plyse.expressions.primitives.Field', 'precedence': 11, 'parse_method': 'field_parse'},
+        'values': [
+            {'class': 'plyse.expressions.primitives.IntegerRange', 'precedence': 10,
+             'range_parse_method': 'range_parse', 'item_parse_method': 'integer_parse'},
+            {'class': 'plyse.expressions.primitives.Integer', 'precedence': 6, 'parse_method': 'integer_parse'},
+            {'class': 'plyse.expressions.primitives.PartialString', 'precedence': 3,
+             'parse_method': 'partial_string_parse'},
+            {'class': 'plyse.expressions.primitives.QuotedString', 'precedence': 2,
+             'parse_method': 'quoted_string_parse'}
+        ]
+    }
+
+    def __init__(self, conf):
+        self._conf = conf
+        self._grammar = GrammarFactory.build_from_conf(conf)
+
+        term_parser = TermParserFactory.build_from_conf(conf['term_parser'])
+        term_conf = conf.get('term', self.DEFAULT_TERM)
+
+        self._field = (term_conf['field'], PrimitiveFactory.build_from_conf(term_conf['field'], term_parser))
+        values = [(v, PrimitiveFactory.build_from_conf(v, term_parser)) for v in term_conf['values']]
+        # same order TermFactory.build_term gives them
+        self._values = sorted(values, key=lambda v: v[1].precedence, reverse=True)
+
+        for primitive_conf, primitive in [self._field] + self._values:
+            if getattr(primitive, 'lexer_pattern', None) is None:
+                raise ParserGeneratorError("Type '%s' has no lexer pattern, it can't be generated"
+                                           % primitive_conf['class'])
+
+        try:
+            self._lexer = Lexer(self._grammar._term, self._grammar._keywords, self._grammar._operators)
+        except LexerError as e:
+            raise ParserGeneratorError("Grammar can't be generated: %s" % e)
+        self._levels = [OperatorLevel(op) for op in self._grammar._operators]
+
+    @staticmethod
+    def load(source, name='plyse_generated_parser'):
+        """
+        Imports generated :source as a module
+
+        :return: module object
+        """
+        module = types.ModuleType(name)
+        exec(compile(source, name, 'exec'), module.__dict__)
+
+        return module
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.write(self.generate())
+
+    def generate(self):
+        lexer = self._lexer
+        code = [_HEADER % {
+            'term_parser': repr(self._conf['term_parser']),
+            'master': repr(lexer.master.pattern),
+            'operand': repr(lexer.operand.pattern),
+            'value': repr(lexer.value.pattern),
+            'word': "re.compile(%r)" % lexer._word.pattern if lexer._word is not None else None,
+            'above_word': repr(sorted(lexer._above_word)),
+            'operators': "{%s}" % ", ".join("%r: re.compile(%r)" % ("op_%s" % name, regex.pattern)
+                                            for name, regex in sorted((k[3:], v) for k, v in lexer._operators.items()))
+        }]
+
+        code.append(self._field_function())
+
+        for i, (conf, value) in enumerate(self._values):
+            code.append(self._value_function("value%s" % i, conf, value))
+
+        for group in sorted(lexer._keywords):
+            code.append(self._keyword_function(group, lexer._keywords[group]))
+
+        code.append("_VALUES = {%s}\n" % ", ".join("%r: _%s" % (g, g) for g in sorted(lexer._values)))
+        code.append("_KEYWORDS = {%s}\n" % ", ".join("%r: _%s" % (g, g) for g in sorted(lexer._keywords)))
+        code.append(_SCANNER)
+
+        previous = "_parse_atom"
+        for level in self._levels:
+            name = "_parse_%s" % level.operator.name
+            template = _UNARY_LEVEL if level.arity == 1 else _BINARY_LEVEL
+            code.append(template % {
+                'name': name, 'next': previous, 'group': "op_%s" % level.operator.name,
+                'node': level.operator.name.capitalize(),
+                'implicit': "op_end = pos" if level.implicit else "break"
+            })
+            previous = name
+
+        code.append(_ATOM % {'top': previous})
+        code.append(_PARSE % {'top': previous})
+
+        return "\n".join(code)
+
+    def _field_function(self):
+        conf, field = self._field
+
+        if isinstance(field, MultiField):
+            body = "tokens = []\n    for name_and_separator in _FIELD_PARTS.findall(text):\n" \
+                   "        tokens.extend(name_and_separator)\n"
+            parts = field.field._lexer_re.pattern
+        elif isinstance(field, Field):
+            body = "tokens = list(_FIELD_PARTS.match(text).groups())\n"
+            parts = field._lexer_re.pattern
+        else:
+            raise ParserGeneratorError("Field type '%s' is not supported" % conf['class'])
+
+        return self._function('_field', '_FIELD_PARTS', parts, body, conf['parse_method'])
+
+    def _value_function(self, group, conf, value):
+        parts, parts_name = None, "_%s_PARTS" % group.upper()
+
+        if isinstance(value, SimpleWord):
+            body = "tokens = [text.replace('\\\\\\\\', chr(127)).replace('\\\\', '').replace(chr(127), '\\\\')]\n"
+        elif isinstance(value, QuotedString):
+            body = "tokens = [_unquote(text)]\n"
+        elif isinstance(value, Integer):
+            body = "tokens = [text]\n"
+        elif isinstance(value, IntegerComparison):
+            body = "tokens = list(%s.match(text).groups())\n" % parts_name
+            parts = value._lexer_re.pattern
+        elif isinstance(value, IntegerRange):
+            body = "start, symbol, end = %s.match(text).groups()\n" \
+                   "    tokens = _apply(TERM_PARSER.%s, s, loc, [start]) + [symbol] + " \
+                   "_apply(TERM_PARSER.%s, s, loc, [end])\n" % (parts_name, conf['item_parse_method'],
+                                                                conf['item_parse_method'])
+            parts = value._lexer_re.pattern
+        else:
+            raise ParserGeneratorError("Value type '%s' is not supported" % conf['class'])
+
+        method = conf.get('parse_method', conf.get('range_parse_method'))
+
+        return self._function("_%s" % group, parts_name, parts, body, method)
+
+    def _keyword_function(self, group, keyword):
+        body = "_, separator, value = %s.match(text).groups()\n" \
+               "    tokens = [%r, separator, %r.get(value.upper(), value)]\n" % (
+                   "_%s_PARTS" % group.upper(), keyword.name, keyword._canonical_values)
+
+        return self._function("_%s" % group, "_%s_PARTS" % group.upper(), keyword._lexer_re.pattern, body,
+                              'keyword_parse')
+
+    @staticmethod
+    def _function(name, parts_name, parts, body, method):
+        code = _FUNCTION % {'name': name, 'body': body, 'method': method}
+
+        if parts is not None:
+            code = "\n%s = re.compile(%r)\n\n%s" % (parts_name, parts, code)
+
+        return code
+
+    def verify(self, module, queries, fail_if_syntax_mismatch=False):
+        """
+        Differential check of a generated parser :module against the pyparsing grammar built from the same conf
+
+        :return: list of (query, expected, generated) for each query where the trees (or the failures) differ
+        """
+        parser = QueryParser(self._grammar)
+        mismatches = []
+
+        for query in queries:
+            expected = _outcome(parser.parse, query, fail_if_syntax_mismatch)
+            generated = _outcome(module.parse, query, fail_if_syntax_mismatch)
+
+            if expected != generated:
+                mismatches.append((query, expected, generated))
+
+        return mismatches
+
+
+def _outcome(parse, query, fail_if_syntax_mismatch):
+    try:
+        return _dump(parse(query, fail_if_syntax_mismatch).query_as_tree)
+    except ParseException:
+        return ParseException.__name__
+
+
+def _dump(node):
+    if node.is_leaf:
+        return sorted((k, repr(v)) for k, v in node.items())
+
+    return node.type, [_dump(child) for child in node.children]
+
+
+_HEADER = '''# -*- coding: utf-8 -*-
+# Parser generated by plyse.generator.ParserGenerator, do not edit.
+import re
+from plyse.expressions.primitives import ParseException
+from plyse.query import Query
+from plyse.query_tree import Operand, And, Or, Not
+from plyse.term_parser import TermParserFactory
+
+
+TERM_PARSER = TermParserFactory.build_from_conf(%(term_parser)s)
+
+_MASTER = re.compile(%(master)s)
+_OPERAND = re.compile(%(operand)s)
+_VALUE = re.compile(%(value)s)
+_WORD = %(word)s
+_ABOVE_WORD = frozenset(%(above_word)s)
+_OPERATORS = %(operators)s
+_WHITESPACE = re.compile(r'[ \\t\\n\\r]*')
+_WHITESPACE_ESCAPES = [(r'\\t', '\\t'), (r'\\n', '\\n'), (r'\\f', '\\f'), (r'\\r', '\\r')]
+
+
+def _apply(method, s, loc, tokens):
+    result = method(s, loc, tokens)
+    return tokens if result is None else (list(result) if isinstance(result, list) else [result])
+
+
+def _unquote(text):
+    text = text[1:-1]
+
+    if '\\\\' in text:
+        for escaped, char in _WHITESPACE_ESCAPES:
+            text = text.replace(escaped, char)
+
+    return text
+'''
+
+_FUNCTION = '''
+def %(name)s(s, loc, text):
+    %(body)s    return _apply(TERM_PARSER.%(method)s, s, loc, tokens)
+'''
+
+_SCANNER = '''
+class _Scanner(object):
+
+    def __init__(self, instring):
+        self.instring = instring
+        self.tokens = dict((m.start(), m) for m in _MASTER.finditer(instring))
+        self.operands = {}
+
+    def token(self, loc):
+        token = self.tokens.get(loc)
+
+        if token is None and loc < len(self.instring):
+            token = self.tokens[loc] = _MASTER.match(self.instring, loc)
+
+        return token
+
+    def end(self, loc):
+        token = self.token(loc)
+        return token.end() if token is not None and token.lastgroup == 'ws' else loc
+
+    def expect(self, group, loc):
+        token = self.token(self.end(loc))
+        return token.end() if token is not None and token.lastgroup == group else None
+
+    def operator(self, group, loc):
+        loc = self.end(loc)
+        token = self.token(loc)
+
+        if token is None:
+            return None
+
+        if token.lastgroup == group:
+            return token.end()
+
+        if token.lastgroup.startswith('op_'):
+            match = _OPERATORS[group].match(self.instring, loc)
+            return match.end() if match else None
+
+        return None
+
+    def operand(self, loc):
+        if loc not in self.operands:
+            self.operands[loc] = self._operand(self.end(loc))
+
+        return self.operands[loc]
+
+    def _operand(self, loc):
+        s = self.instring
+
+        token = self.token(loc)
+        if token is None:
+            return None
+
+        group = token.lastgroup
+        if group != 'field' and group not in _KEYWORDS and group not in _VALUES:
+            token = _OPERAND.match(s, loc)
+
+            if token is None:
+                return None
+
+            group = token.lastgroup
+
+        if group in _KEYWORDS:
+            return token.end(), Operand(**_KEYWORDS[group](s, loc, token.group())[0])
+
+        tokens, value = [], token
+
+        if group == 'field':
+            tokens = _field(s, loc, token.group())
+            value_loc = _WHITESPACE.match(s, token.end()).end()
+            value = self.token(value_loc)
+
+            if value is None or value.lastgroup not in _VALUES:
+                value = _VALUE.match(s, value_loc)
+
+                if value is None:
+                    return None
+
+        if value.lastgroup in _ABOVE_WORD:
+            word = _WORD.match(s, value.start())
+
+            if word is not None and word.end() > value.end():
+                value = word
+
+        tokens = tokens + _VALUES[value.lastgroup](s, value.start(), value.group())
+        term = _apply(TERM_PARSER.term_parse, s, loc, [tokens])[0]
+
+        return value.end(), Operand(**term)
+'''
+
+_UNARY_LEVEL = '''
+def %(name)s(sc, pos):
+    starts = []
+    end = sc.operator(%(group)r, pos)
+
+    while end is not None:
+        starts.append(pos)
+        pos = end
+        end = sc.operator(%(group)r, pos)
+
+    match = %(next)s(sc, pos)
+
+    while match is None and starts:
+        match = %(next)s(sc, starts.pop())
+
+    if match is None:
+        return None
+
+    end, node = match
+    for _ in starts:
+        node = %(node)s([node])
+
+    return end, node
+'''
+
+_BINARY_LEVEL = '''
+def %(name)s(sc, pos):
+    match = %(next)s(sc, pos)
+    if match is None:
+        return None
+
+    pos, node = match
+
+    while True:
+        op_end = sc.operator(%(group)r, pos)
+
+        if op_end is None:
+            %(implicit)s
+
+        match = %(next)s(sc, op_end)
+        if match is None:
+            break
+
+        pos, right = match
+        node = %(node)s([node, right])
+
+    return pos, node
+'''
+
+_ATOM = '''
+def _parse_atom(sc, pos):
+    match = sc.operand(pos)
+    if match is not None:
+        return match
+
+    start = sc.expect('lpar', pos)
+    if start is None:
+        return None
+
+    match = %(top)s(sc, start)
+    if match is None:
+        return None
+
+    end = sc.expect('rpar', match[0])
+    if end is None:
+        return None
+
+    return end, match[1]
+'''
+
+_PARSE = '''
+def parse(query_string, fail_if_syntax_mismatch=False):
+    """
+    Parses :query_string into a :class:Query, same as QueryParser.parse would with the grammar this module was
+    generated from. Raises ParseException if nothing can be parsed, or if fail_if_syntax_mismatch is set and the
+    full input can't be parsed.
+    """
+    instring = query_string.expandtabs()
+    sc = _Scanner(instring)
+
+    match = %(top)s(sc, 0)
+    if match is None:
+        raise ParseException(instring, 0, "Expected an operand or a group")
+
+    loc, tree = match
+    if fail_if_syntax_mismatch:
+        loc = sc.end(loc)
+
+        if loc < len(instring):
+            raise ParseException(instring, loc, "Expected end of text")
+
+    return Query(tree, raw_query=query_string)
+'''
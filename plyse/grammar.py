@@ -1,29 +1,44 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+from collections import namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
 
 from .term_parser import TermParserFactory
+from .util import PackratCache
 from .expressions.primitives import PrimitiveFactory, ParserElement, operatorPrecedence, opAssoc
 from .expressions.operators import *
 from .expressions.terms import *
+from .expressions.precedence import PrecedenceClimbing
+from .expressions.lexer import Lexer
 
 
 class GrammarError(Exception):
     pass
 
 
+BuildInfo = namedtuple('BuildInfo', ['builds', 'total_time', 'last_time', 'compiled'])
+
+
+def _type_path(obj):
+    return "%s.%s" % (obj.__class__.__module__, obj.__class__.__name__)
+
+
 class GrammarFactory(object):
 
     @staticmethod
-    def build(term, parser, operators, keywords=None):
-        return Grammar(term=term, operators=operators, term_parser=parser, keywords=keywords)
+    def build(term, parser, operators, keywords=None, engine=None, packrat_cache_size=128):
+        return Grammar(term=term, operators=operators, term_parser=parser, keywords=keywords, engine=engine,
+                       packrat_cache_size=packrat_cache_size)
 
     @staticmethod
-    def build_default(term_parser=None):
+    def build_default(term_parser=None, engine=None, packrat_cache_size=128):
         t_parser = term_parser or TermParserFactory.build_default()
         operators = [Operator("not", ['!', '-', 'not']), Operator('and', ['+', 'and']), Operator('or', ['or'], True)]
         term = TermFactory.build_default_term(t_parser)
 
-        return Grammar(operators=operators, term=term, keywords=[], term_parser=t_parser)
+        return Grammar(operators=operators, term=term, keywords=[], term_parser=t_parser, engine=engine,
+                       packrat_cache_size=packrat_cache_size)
 
     @staticmethod
     def build_from_conf(conf):
@@ -50,20 +65,133 @@ class GrammarFactory(object):
             keywords = [KeywordTerm(keyword_name=key, possible_values=values, parse_method=term_parser.keyword_parse)
                         for key, values in iter(conf['keywords'].items())]
 
-        return Grammar(operators=operators, term=term, keywords=keywords, term_parser=term_parser)
+        return Grammar(operators=operators, term=term, keywords=keywords, term_parser=term_parser,
+                       engine=conf.get('engine'), packrat_cache_size=conf.get('packrat_cache_size', 128))
 
 
 class Grammar(object):
 
-    def __init__(self, operators, term, keywords, term_parser):
+    # Operator engines, the way operators precedence gets resolved
+    PYPARSING = 'pyparsing'
+    PRECEDENCE_CLIMBING = 'precedence_climbing'
+    REGEX = 'regex'
+
+    def __init__(self, operators, term, keywords, term_parser, engine=None, packrat_cache_size=128):
+        """
+        :param engine: PYPARSING (default) uses pyparsing's operatorPrecedence, PRECEDENCE_CLIMBING resolves
+                       operators in a single pass over the matched terms and operator symbols. Both produce the
+                       same parse result. REGEX is precedence climbing over the tokens of a master regex
+                       compiled out of the term, keywords and operators (see :class:plyse.expressions.lexer.Lexer)
+        :param packrat_cache_size: max amount of entries of the grammar's packrat memo, which is emptied after each
+                                   parse. 0 disables packrat parsing and None leaves the memo unbounded. Only the
+                                   PYPARSING engine uses it, the other ones memoize the operands on their own.
+                                   pyparsing's packrat memo is process wide, so while a grammar parses its memo
+                                   replaces pyparsing's one under pyparsing's packrat lock: PYPARSING parses with the
+                                   memo enabled run one at a time across all the grammars of the process, and any other
+                                   pyparsing code running in another thread meanwhile waits for the lock or goes
+                                   through the grammar's memo. Disable it or use another engine to avoid both
+        """
+        if engine not in (None, self.PYPARSING, self.PRECEDENCE_CLIMBING, self.REGEX):
+            raise GrammarError("Unknown operator engine '%s'" % engine)
+
         self._term_parser = term_parser
         self._operators = operators
         self._keywords = keywords
         self._term = term
-        self._grammar_parser = self._build_grammar()
+        self._engine = engine or self.PYPARSING
+        self._packrat = PackratCache(packrat_cache_size)
+        self._reset_build_state()
+
+    def _reset_build_state(self):
+        self._fingerprint = None
+        self._grammar_parser = None  # compiled on the first parse
+        self._pending_values = None  # term values waiting for the batch to finish
+        self._batch_start = None  # term, operators and keywords before the batch, restored if it fails
+        self._batch_depth = 0
+        self._builds = 0
+        self._total_build_time = self._last_build_time = 0.0
+
+    def compile(self):
+        """
+        Builds the grammar expressions now instead of waiting for the first parse (ej: to warm it up on startup)
+
+        :return: itself
+        """
+        if self._grammar_parser is None:
+            start = default_timer()
+            self._grammar_parser = self._build_grammar()
+
+            self._last_build_time = default_timer() - start
+            self._total_build_time += self._last_build_time
+            self._builds += 1
+
+        return self
+
+    def build_info(self):
+        """
+        Grammar build statistics
+
+        :return: :class:BuildInfo with the amount of builds, total and last build time in seconds and whether the
+                 grammar is compiled right now
+        """
+        return BuildInfo(self._builds, self._total_build_time, self._last_build_time,
+                         self._grammar_parser is not None)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups several modifications, so the term is rebuilt once when the batch finishes instead of once per added or
+        removed value type. As with any modification, the grammar gets compiled on the next parse. If the batch raises,
+        none of its modifications are kept.
+
+            with grammar.batch():
+                grammar.add_keyword(...)
+                grammar.remove_type(...)
+
+        :return: context manager yielding the grammar itself
+        """
+        if self._batch_depth == 0:
+            self._batch_start = (self._term, self._operators, self._keywords)
+
+        self._batch_depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            self._finish_batch(rollback=True)
+            raise
+
+        self._finish_batch()
+
+    def _finish_batch(self, rollback=False):
+        self._batch_depth -= 1
+
+        if self._batch_depth:
+            return
+
+        values, self._pending_values = self._pending_values, None
+        start, self._batch_start = self._batch_start, None
+
+        if rollback:
+            if [id(part) for part in start] != [id(self._term), id(self._operators), id(self._keywords)]:
+                self._update_grammar(*start)
+            else:
+                self._fingerprint = None
+
+        elif values is not None:
+            self._update_grammar(term=TermFactory.build_term(self._term.field, values, self._term.parse_method))
 
     def _build_grammar(self):
-        ParserElement.enablePackrat()
+        # The expression has to combine operators with terms and/or keywords
+        # Keywords have higher precedence over terms
+        expression_elem = concatenate((self._keywords if self._keywords else []) + [self._term])
+
+        if self._engine == self.PRECEDENCE_CLIMBING:
+            return PrecedenceClimbing(expression_elem, self._operators).parseString
+
+        if self._engine == self.REGEX:
+            lexer = Lexer(self._term, self._keywords or [], self._operators)
+            return PrecedenceClimbing(expression_elem, self._operators, lexer=lexer).parseString
 
         precedence_list = []
 
@@ -82,18 +210,67 @@ class Grammar(object):
 
             precedence_list.append(op_def)
 
-        # The expression has to combine operators with terms and/or keywords
-        # Keywords have higher precedence over terms
-        expression_elem = concatenate((self._keywords if self._keywords else []) + [self._term])
         expression = operatorPrecedence(expression_elem, precedence_list)
 
         return expression.parseString
 
     def _update_grammar(self, term=None, operators=None, keywords=None):
-        self._term = term if term else self._term
-        self._operators = operators if operators else self._operators
-        self._keywords = keywords if keywords else self._keywords
-        self._grammar_parser = self._build_grammar()
+        self._term = term if term is not None else self._term
+        self._operators = operators if operators is not None else self._operators
+        self._keywords = keywords if keywords is not None else self._keywords
+        self._fingerprint = None
+        self._grammar_parser = None
+
+    def _term_values(self):
+        return self._pending_values if self._pending_values is not None else self._term.values
+
+    def _update_term_values(self, values):
+        if self._batch_depth:
+            self._pending_values = values
+            self._fingerprint = None
+        else:
+            self._update_grammar(term=TermFactory.build_term(self._term.field, values, self._term.parse_method))
+
+    def __getstate__(self):
+        # Pickled by its spec, the pyparsing expressions get rebuilt on the first parse after loading
+        return {'operators': self._operators, 'term': self._term, 'keywords': self._keywords,
+                'term_parser': self._term_parser, 'engine': self._engine, 'packrat': self._packrat}
+
+    def __setstate__(self, state):
+        self._term_parser = state['term_parser']
+        self._operators = state['operators']
+        self._keywords = state['keywords']
+        self._term = state['term']
+        self._engine = state['engine']
+        self._packrat = state['packrat']
+        self._reset_build_state()
+
+    @property
+    def fingerprint(self):
+        """
+        Hashable description of everything that affects the parse output: operators and their symbols, keywords,
+        term field and value types and the term parser settings. It changes whenever the grammar gets modified, so
+        it can be used to key cached parse results.
+        """
+        if self._fingerprint is None:
+            parser = self._term_parser
+            self._fingerprint = (
+                tuple((op.name, tuple(op.symbols), op.implicit) for op in self._operators),
+                tuple((k.name, tuple(k.values)) for k in self._keywords),
+                _type_path(self._term.field),
+                tuple((_type_path(v), getattr(v, 'precedence', None)) for v in self._term_values()),
+                _type_path(parser),
+                tuple(parser._default_fields),
+                tuple(sorted(parser.aliases.items())),
+                parser._integers_as_string,
+                self._engine
+            )
+
+        return self._fingerprint
+
+    @property
+    def engine(self):
+        return self._engine
 
     @property
     def term_parser(self):
@@ -105,7 +282,7 @@ class Grammar(object):
 
     @property
     def value_types(self):
-        return [{'type': v.name, 'precedence': v.precedence} for v in self._term.values]
+        return [{'type': v.name, 'precedence': v.precedence} for v in self._term_values()]
 
     @property
     def field_type(self):
@@ -129,14 +306,11 @@ class Grammar(object):
         if not isinstance(value, ParserElement):
             raise GrammarError("Value types should be PyParsing ParserElements or plyse.expressions.primitives.BaseType")
 
-        new_term = TermFactory.build_term(self._term.field, self._term.values + [value], *self._term.parseAction)
-        self._update_grammar(new_term)
+        self._update_term_values(list(self._term_values()) + [value])
         return self
 
     def remove_type(self, type_name):
-        new_term_values = filter(lambda x: x.name != type_name, self._term.values)
-        new_term = TermFactory.build_term(self._term.field, new_term_values, *self._term.parseAction)
-        self._update_grammar(term=new_term)
+        self._update_term_values([v for v in self._term_values() if v.name != type_name])
         return self
 
     def remove_operator(self, operator_name):
@@ -148,4 +322,33 @@ class Grammar(object):
         return self
 
     def parse(self, input_string, fail_if_syntax_mismatch=False):
-        return self._grammar_parser(input_string, parseAll=fail_if_syntax_mismatch)
+        if self._pending_values is not None:
+            raise GrammarError("Grammar can't be used while a batch of modifications is in progress")
+
+        if self._grammar_parser is None:
+            self.compile()
+
+        if self._engine != self.PYPARSING or self._packrat._maxsize == 0:
+            return self._grammar_parser(input_string, parseAll=fail_if_syntax_mismatch)
+
+        # pyparsing's packrat memo is global, the grammar's own memo takes its place during the parse. The lock is the
+        # one pyparsing holds while using the memo
+        with ParserElement.packrat_cache_lock:
+            memo = ParserElement.packrat_cache, ParserElement.packrat_cache_stats, ParserElement._parse
+            ParserElement.packrat_cache = self._packrat
+            ParserElement.packrat_cache_stats = [0, 0]
+            ParserElement._parse = ParserElement._parseCache
+
+            try:
+                return self._grammar_parser(input_string, parseAll=fail_if_syntax_mismatch)
+            finally:
+                self._packrat.clear()
+                ParserElement.packrat_cache, ParserElement.packrat_cache_stats, ParserElement._parse = memo
+
+    def packrat_info(self):
+        """
+        Packrat memo statistics, added up over all the parses
+
+        :return: :class:plyse.util.CacheInfo with hits, misses, evictions, maxsize and currsize
+        """
+        return self._packrat.info()
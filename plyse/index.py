@@ -0,0 +1,349 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+In-memory inverted index that runs plyse queries over a collection of documents (dicts), see :class:InvertedIndex.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+from .query import Query
+from .query_tree import And, Not, POST_ORDER, flatten_tree, walk_tree
+from .term_parser import Term
+
+
+class InvertedIndexError(Exception):
+    pass
+
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# ratio between the sizes of two posting lists from which the small one gets galloped through the big one
+_GALLOP_RATIO = 8
+
+
+def tokenize(value):
+    """
+    Lower case words of a document value
+    """
+    return _TOKEN.findall((value if isinstance(value, str) else str(value)).lower())
+
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def gallop_intersect(small, large):
+    """
+    Intersection of two sorted lists, looking up each item of :small in :large with an exponential search that
+    starts where the previous one ended, so only a logarithmic part of :large is read for each item
+
+    :return: sorted list
+    """
+    result = []
+    low, size = 0, len(large)
+
+    for item in small:
+        step, high = 1, low
+        while high < size and large[high] < item:
+            low = high + 1
+            high += step
+            step *= 2
+
+        low = bisect_left(large, item, low, min(high + 1, size))
+
+        if low == size:
+            break
+
+        if large[low] == item:
+            result.append(item)
+            low += 1
+
+    return result
+
+
+def intersect(postings):
+    """
+    Intersection of sorted posting lists, smallest first so every step works on the smallest possible result. Like
+    :func:union and :func:difference, it may return one of the given lists
+    """
+    postings = sorted(postings, key=len)
+    result = postings[0]
+
+    for other in postings[1:]:
+        if not result:
+            break
+
+        if len(other) >= len(result) * _GALLOP_RATIO:
+            result = gallop_intersect(result, other)
+        else:
+            result = sorted(set(result).intersection(other))
+
+    return result
+
+
+def union(postings):
+    if len(postings) == 1:
+        return postings[0]
+
+    return sorted(set().union(*postings))
+
+
+def _prefix_range(words, prefix):
+    # u'' keeps the bound a unicode character in py2, where '\uffff' is six bytes
+    return bisect_left(words, prefix), bisect_left(words, prefix + u'\uffff') if prefix else len(words)
+
+
+def difference(postings, removed):
+    if not removed:
+        return postings
+
+    removed = set(removed)
+    return [doc_id for doc_id in postings if doc_id not in removed]
+
+
+class InvertedIndex(object):
+    """
+    Sorted posting lists of document ids for every value and every word of each field of the indexed documents.
+    Nested documents are indexed with the tuple of keys of each field (the nested field address:zip is the field
+    ('address', 'zip')), and documents with list values get indexed for every item in them.
+
+    Queries (see :meth:search) honor the term field and value type:
+
+      - ints, quoted strings and keyword values match the documents with that exact value, and value sets (see
+        :class:plyse.normalizer.Normalizer) any of their values
+      - partial strings match the documents with a word that starts with them, case insensitive. A '*' in them is a
+        wildcard that has to match whole words ('pe*er')
+      - ranges and comparisons match the numeric values in them
+      - terms with several default fields match if any of those fields does. The index :default_fields, if any, are
+        searched for every default field term instead of the term ones
+
+    AND operators intersect the posting lists of their inputs, smallest first and galloping through much bigger lists,
+    OR operators join them and NOT subtracts them. Negated inputs of an operator are kept as the set of documents that
+    don't match, so NOT never goes through every document unless the whole query is negated.
+    """
+
+    _comparisons = (Term.GREATER_THAN, Term.GREATER_EQUAL_THAN, Term.LOWER_THAN, Term.LOWER_EQUAL_THAN)
+
+    def __init__(self, default_fields=None):
+        """
+        :param default_fields: fields to search for terms with no field, ej: TermParser default fields
+        """
+        self._default_fields = list(default_fields) if default_fields else None
+        self._values = {}  # field -> value -> posting list
+        self._tokens = {}  # field -> word -> posting list
+        self._sorted_values = {}  # field -> sorted numeric values, built on first use
+        self._sorted_tokens = {}  # field -> sorted words, built on first use
+        self._size = 0
+
+    @staticmethod
+    def from_term_parser(term_parser):
+        """
+        Index that searches the default fields of :term_parser for terms with no field
+        """
+        return InvertedIndex(term_parser._default_fields)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def fields(self):
+        return frozenset(self._tokens)
+
+    def add(self, document):
+        """
+        :param document: dict of field -> value
+        :return: id of the document, documents are numbered in the order they get added
+        """
+        doc_id = self._size
+        self._size += 1
+
+        pending = [((), document)]
+        while pending:
+            path, values = pending.pop()
+
+            for key, value in values.items():
+                field = path + (key,) if path else key
+
+                if isinstance(value, dict):
+                    pending.append((path + (key,), value))
+                else:
+                    self._add_value(doc_id, field, value)
+
+        return doc_id
+
+    def add_many(self, documents):
+        """
+        :return: list with the ids of the documents
+        """
+        return [self.add(document) for document in documents]
+
+    def _add_value(self, doc_id, field, value):
+        values = self._values.setdefault(field, {})
+        tokens = self._tokens.setdefault(field, {})
+        self._sorted_values.pop(field, None)
+        self._sorted_tokens.pop(field, None)
+
+        for item in (value if isinstance(value, (list, tuple, set, frozenset)) else [value]):
+            if item is None:
+                continue
+
+            self._append(values.setdefault(item, []), doc_id)
+
+            for token in tokenize(item):
+                self._append(tokens.setdefault(token, []), doc_id)
+
+    @staticmethod
+    def _append(postings, doc_id):
+        # ids only grow, a value or word repeated in a document already has the document id at the end
+        if not postings or postings[-1] != doc_id:
+            postings.append(doc_id)
+
+    def search(self, query):
+        """
+        :param query: :class:plyse.query.Query or root :class:TreeNode of a query tree
+        :return: sorted list with the ids of the matching documents. Every document matches an empty query
+        """
+        root = query.query_as_tree if isinstance(query, Query) else query
+
+        if root is None:
+            return list(range(self._size))
+
+        results = []  # (posting list, negated) of the evaluated nodes, negated ones are the documents not matching
+
+        # in post order the children of an operator are the last results when it comes up
+        for node in walk_tree(flatten_tree(root), POST_ORDER):
+            if node.is_leaf:
+                results.append((self.postings(node), False))
+
+            elif node.type == Not.type:
+                postings, negated = results.pop()
+                results.append((postings, not negated))
+
+            else:
+                inputs = results[-len(node.children):]
+                del results[-len(node.children):]
+                results.append(self._combine(node.type, inputs))
+
+        postings, negated = results.pop()
+
+        # results can be posting lists of the index, the caller gets a copy
+        return list(difference(range(self._size), postings) if negated else postings)
+
+    @staticmethod
+    def _combine(operator_type, inputs):
+        positive = [postings for postings, negated in inputs if not negated]
+        negative = [postings for postings, negated in inputs if negated]
+
+        if operator_type == And.type:
+            if positive:
+                return difference(intersect(positive), union(negative) if negative else ()), False
+
+            return union(negative), True  # not a and not b is not (a or b)
+
+        if negative:
+            # a or not b is not (b and not a)
+            return difference(intersect(negative), union(positive) if positive else ()), True
+
+        return union(positive), False
+
+    def postings(self, term):
+        """
+        :return: sorted list with the ids of the documents matching :term
+        """
+        val, val_type = term.get(Term.VAL), term.get(Term.VAL_TYPE)
+
+        if val_type in (Term.INT, Term.EXACT_STRING, Term.KEYWORD_VALUE):
+            def _postings(field):
+                return [self._values.get(field, {}).get(val, [])]
+
+        elif val_type == Term.PARTIAL_STRING:
+            def _postings(field):
+                return [self._partial_postings(field, val)]
+
+        elif val_type and val_type.endswith(Term.SET % ''):
+            def _postings(field):
+                values = self._values.get(field, {})
+                return [values[v] for v in val if v in values]
+
+        elif val_type in self._comparisons or (val_type and val_type.endswith(Term.RANGE % '')):
+            def _postings(field):
+                return self._numeric_postings(field, val, val_type)
+
+        else:
+            raise InvertedIndexError("Don't know how to match '%s' values" % val_type)
+
+        postings = [p for field in self._term_fields(term) for p in _postings(field) if p]
+        return union(postings) if postings else []
+
+    def _term_fields(self, term):
+        field = term.get(Term.FIELD)
+
+        if term.get(Term.FIELD_TYPE) == Term.DEFAULT:
+            if self._default_fields:
+                return self._default_fields
+
+            return field if isinstance(field, list) else [field]
+
+        return [tuple(field)] if isinstance(field, list) else [field]
+
+    def _partial_postings(self, field, val):
+        tokens = self._tokens.get(field)
+        if not tokens:
+            return []
+
+        words = self._sorted(self._sorted_tokens, field, lambda: sorted(tokens))
+
+        if '*' in val:
+            # words starting with the part before the first wildcard, matching the whole pattern
+            # '*' is the only wildcard, like for the predicates
+            pattern = re.compile('.*'.join(re.escape(part) for part in val.lower().split('*')) + r'\Z', re.DOTALL)
+            prefix = val.split('*')[0].lower()
+            matching = [tokens[word] for word in words[slice(*_prefix_range(words, prefix))] if pattern.match(word)]
+
+            return union(matching) if matching else []
+
+        # every word of the value has to start a word of the document
+        postings = []
+        for prefix in tokenize(val):
+            matching = [tokens[word] for word in words[slice(*_prefix_range(words, prefix))]]
+
+            if not matching:
+                return []
+
+            postings.append(union(matching))
+
+        return intersect(postings) if postings else []
+
+    def _numeric_postings(self, field, val, val_type):
+        values = self._values.get(field)
+        if not values:
+            return []
+
+        keys = self._sorted(self._sorted_values, field, lambda: sorted(v for v in values if _numeric(v)))
+
+        if val_type and val_type.endswith(Term.RANGE % ''):
+            if not all(_numeric(v) for v in val):
+                return []
+            start, end = bisect_left(keys, val[0]), bisect_right(keys, val[1])
+
+        elif not _numeric(val):
+            return []
+
+        elif val_type == Term.GREATER_THAN:
+            start, end = bisect_right(keys, val), len(keys)
+        elif val_type == Term.GREATER_EQUAL_THAN:
+            start, end = bisect_left(keys, val), len(keys)
+        elif val_type == Term.LOWER_EQUAL_THAN:
+            start, end = 0, bisect_right(keys, val)
+
+        else:
+            start, end = 0, bisect_left(keys, val)
+
+        return [values[key] for key in keys[start:end]]
+
+    @staticmethod
+    def _sorted(cache, field, build):
+        if field not in cache:
+            cache[field] = build()
+
+        return cache[field]
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Simplification of query trees into equivalent, smaller ones (see :meth:plyse.query.Query.normalize).
+"""
+from .query_tree import (OperatorFactory, And, Or, Not, ASSOCIATIVE_TYPES, transform_tree, _chain_operands,
+                         _same_or_new)
+from .compact_tree import CompactNode, CompactOperatorFactory
+from .term_parser import Term
+
+
+class NormalizerError(Exception):
+    pass
+
+
+def _hashable(value):
+    return tuple(_hashable(v) for v in value) if isinstance(value, list) else value
+
+
+class Normalizer(object):
+    """
+    Rewrites a query tree applying the enabled rules bottom up, in a single pass without recursion:
+
+      - flatten: merges chains of the same associative operator into n-ary ones (see
+        :func:plyse.query_tree.flatten_tree)
+      - deduplicate: drops the repeated inputs of AND and OR operators, 'a or a' is 'a'
+      - double_negation: 'not not x' is 'x'
+      - de_morgan: pushes a NOT down into the AND or OR under it when most of that operator's inputs are negated,
+        so the negations cancel out: 'not (not a or not b)' is 'a and b'
+      - value_sets: an OR of exact values (ints, quoted strings, keyword values) on the same field becomes a single
+        term whose value is the list of values and whose value type is :Term.SET of the values type
+        ('id:1 or id:2' is a term with val [1, 2] and val_type 'int_set')
+
+    Unchanged subtrees are shared with the original tree.
+    """
+
+    # value types whose terms match a value exactly, and can be gathered into value sets
+    exact_value_types = (Term.INT, Term.EXACT_STRING, Term.KEYWORD_VALUE)
+
+    def __init__(self, flatten=True, deduplicate=True, double_negation=True, de_morgan=True, value_sets=True,
+                 min_set_size=2):
+        """
+        :param min_set_size: minimum amount of values on a field to gather them into a value set
+        """
+        if min_set_size < 2:
+            raise NormalizerError("Value sets need at least 2 values")
+
+        self._flatten = flatten
+        self._deduplicate = deduplicate
+        self._double_negation = double_negation
+        self._de_morgan = de_morgan
+        self._value_sets = value_sets
+        self._min_set_size = min_set_size
+
+    def normalize(self, root):
+        """
+        :param root: root :class:TreeNode of the tree to normalize
+        :return: root of the normalized tree, None if :root is None
+        """
+        keys = {}  # structural keys of the subtrees, by node id, to find duplicates
+        nodes = []  # keeps the nodes alive while their ids are keys
+
+        def _key(node):
+            key = keys.get(id(node))
+
+            if key is None:
+                if node.is_leaf:
+                    key = tuple(sorted((k, _hashable(v)) for k, v in node.items()))
+                else:
+                    key = (node.type,) + tuple(_key(child) for child in node.children)
+
+                keys[id(node)] = key
+                nodes.append(node)
+
+            return key
+
+        def _normalize(node, children):
+            if node.type == Not.type:
+                return self._normalize_not(node, children, _normalize)
+
+            if node.type in ASSOCIATIVE_TYPES:
+                return self._normalize_associative(node, children, _key)
+
+            return _same_or_new(node, children)
+
+        # with flatten, the whole chain of nested operators of the same type gets normalized as one n-ary operator
+        return transform_tree(root, _normalize, _chain_operands if self._flatten else lambda node: node.children)
+
+    def _normalize_not(self, node, children, normalize):
+        child = children[0]
+
+        if child.is_leaf:
+            return _same_or_new(node, children)
+
+        if self._double_negation and child.type == Not.type:
+            return child.children[0]
+
+        if self._de_morgan and child.type in ASSOCIATIVE_TYPES:
+            negated = [c for c in child.children if not c.is_leaf and c.type == Not.type]
+
+            # the NOT and the negated inputs go away, every other input gets a NOT of its own
+            if len(child.children) - len(negated) < 1 + len(negated):
+                factory = _factory(node)
+                inputs = [c.children[0] if not c.is_leaf and c.type == Not.type else factory.create(Not.type, [c])
+                          for c in child.children]
+                opposite = factory.create(Or.type if child.type == And.type else And.type, inputs)
+
+                return normalize(opposite, inputs)
+
+        return _same_or_new(node, children)
+
+    def _normalize_associative(self, node, children, key):
+        if self._flatten:
+            children = [grandchild for child in children
+                        for grandchild in (child.children if not child.is_leaf and child.type == node.type
+                                           else [child])]
+
+        if self._deduplicate:
+            seen = set()
+            unique = []
+
+            for child in children:
+                child_key = key(child)
+
+                if child_key not in seen:
+                    seen.add(child_key)
+                    unique.append(child)
+
+            children = unique
+
+        if self._value_sets and node.type == Or.type:
+            children = self._gather_value_sets(children)
+
+        if len(children) == 1:
+            return children[0]
+
+        return _same_or_new(node, children)
+
+    def _gather_value_sets(self, children):
+        groups = {}
+
+        for child in children:
+            if child.is_leaf and child.get(Term.VAL_TYPE) in self.exact_value_types:
+                group_key = (_hashable(child.get(Term.FIELD)), child.get(Term.FIELD_TYPE), child[Term.VAL_TYPE])
+                groups.setdefault(group_key, []).append(child)
+
+        value_sets = {}
+        for group in groups.values():
+            if len(group) >= self._min_set_size:
+                values, seen = [], set()
+
+                for term in group:
+                    if term[Term.VAL] not in seen:
+                        seen.add(term[Term.VAL])
+                        values.append(term[Term.VAL])
+
+                first = group[0]
+                value_set = dict(first, **{Term.VAL: values, Term.VAL_TYPE: Term.SET % first[Term.VAL_TYPE]})
+                value_sets[id(first)] = first.__class__(value_set)
+                value_sets.update((id(term), None) for term in group[1:])
+
+        if not value_sets:
+            return children
+
+        # the value set takes the place of the first of its terms, the other ones are dropped
+        gathered = [value_sets.get(id(child), child) for child in children]
+        return [child for child in gathered if child is not None]
+
+
+def _factory(node):
+    return CompactOperatorFactory if isinstance(node, CompactNode) else OperatorFactory
+
@@ -1,9 +1,10 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
-from copy import deepcopy
-from .query_tree import Operator, OperatorFactory, Operand, And, Or, Not
+from .query_tree import OperatorNode, OperatorFactory, Operand, And, Or, Not, flatten_tree
+from .compact_tree import CompactOperatorFactory, CompactOperand
 from .query import Query
 from .term_parser import Term
+from .util import LRUCache, map_chunks
 
 
 class QueryParserError(Exception):
@@ -12,8 +13,23 @@ class QueryParserError(Exception):
 
 class QueryParser(object):
 
-    def __init__(self, grammar):
+    _operator_types = (And.type, Or.type, Not.type)
+
+    def __init__(self, grammar, cache_size=0, compact=False, nary=False):
+        """
+        :param grammar: :class:Grammar used to match the query strings
+        :param cache_size: max amount of parsed queries to keep in the LRU parse cache. 0 disables the cache
+                           and None leaves it unbounded
+        :param compact: build the query trees out of the slotted nodes of :mod:plyse.compact_tree, which take
+                        a fraction of the memory of the dict based ones
+        :param nary: build n-ary AND and OR operators holding a whole chain of terms instead of nested binary ones
+                     (see :func:plyse.query_tree.flatten_tree)
+        """
         self._grammar = grammar
+        self._cache = LRUCache(cache_size)
+        self._operator_factory = CompactOperatorFactory if compact else OperatorFactory
+        self._operand_class = CompactOperand if compact else Operand
+        self._nary = nary
 
     def parse(self, query_string, fail_if_syntax_mismatch=False):
         """
@@ -24,54 +40,111 @@ class QueryParser(object):
         Grammar parse result should be a concatenation of lists where the elements/leafs
         are :class:Term 's representing the properties of each defined grammar element
         matched in the query string
+
+        If the parse cache is enabled, repeated query strings return the same (shared) :class:Query object.
+        Since queries are immutable it's safe to hand them to several callers.
         """
-        return Query(
-            self.parse_elements(self._grammar.parse(query_string, fail_if_syntax_mismatch)),
-            raw_query=query_string
-        )
+        key = (query_string, fail_if_syntax_mismatch, self._grammar.fingerprint)
+        query = self._cache.get(key)
 
-    def parse_elements(self, elements, stack=None):
-        if not elements:
-            return deepcopy(stack.pop()) if stack else None
+        if query is None:
+            query = Query(
+                self.parse_elements(self._grammar.parse(query_string, fail_if_syntax_mismatch)),
+                raw_query=query_string
+            )
+            self._cache.set(key, query)
 
-        stack = [] if not stack else stack
+        return query
 
-        e = elements[0]
-        if type(e) is str and e.lower() in [And.type, Or.type, Not.type]:
-            op = OperatorFactory.create(e)
+    def cache_info(self):
+        """
+        Parse cache statistics
 
-            if op.has_left_operand():
-                op.add_input(stack.pop())
+        :return: :class:plyse.util.CacheInfo with hits, misses, evictions, maxsize and currsize
+        """
+        return self._cache.info()
 
-            stack.append(op)
-        else:
-            if isinstance(e, dict):
-                operand = Operand(**e)
+    def cache_clear(self):
+        self._cache.clear()
 
-            else:
-                operand = self.parse_elements(e)
+    def parse_many(self, query_strings, workers=1, chunksize=100, fail_if_syntax_mismatch=False):
+        """
+        Parses every query string in :query_strings, yielding the results in the same order as they come. A query
+        string that can't be parsed yields the exception raised for it instead of a :class:Query, so one bad query
+        doesn't abort the batch. The input is consumed lazily in chunks, identical query strings inside a chunk are
+        parsed only once and share the resulting :class:Query.
+
+        :param query_strings: iterable of query strings
+        :param workers: amount of processes to parse the chunks in. With more than 1, each worker process gets the
+                        parser once when the pool starts and only chunks of strings and results travel between them
+        :param chunksize: amount of query strings per chunk
+        :return: generator of :class:Query or exception, one for each query string
+        """
+        return map_chunks(_parse_chunk, query_strings, chunksize, workers, setup_args=(self, fail_if_syntax_mismatch))
+
+    def parse_elements(self, elements):
+        """
+        Builds the boolean tree out of the grammar parse result in a single pass. Nested lists (groups) are handled
+        with an explicit stack of frames instead of recursion, so the cost is linear in the amount of elements and
+        there is no limit on how long or deeply nested the query can be.
+
+        :param elements: grammar parse result, a list of :class:Term 's, operator names and nested lists
+        :return: root :class:TreeNode of the tree or None if there were no elements
+        """
+        root = None
+        frames = [(iter(elements), [])]  # each frame is the remaining elements of a group and its operands stack
 
-            if len(stack) == 0:
-                stack.append(operand)
+        while frames:
+            group, stack = frames[-1]
 
-            elif isinstance(stack[-1], Operator) or isinstance(stack[-1], Operand):
-                    current_elem = stack.pop().add_input(operand)
+            for e in group:
+                if type(e) is str and e.lower() in self._operator_types:
+                    op = self._operator_factory.create(e)
 
-                    # 'Not' operator only works on the right element, if there was a previous operator
-                    # the stack would be have 2 elements, so the new operand is added to the current operator
-                    # (Not operator) and then the Not operator is added as an input to the previous operator
-                    # finishing the cicle and leaving the stack with only one element (an operator)
-                    if stack:
-                        current_elem = stack.pop().add_input(current_elem)
+                    if op.has_left_operand():
+                        op.add_input(stack.pop())
 
-                    stack.append(current_elem)
+                    stack.append(op)
+
+                elif isinstance(e, dict):
+                    self._push_operand(stack, self._operand_class(e))
+
+                else:
+                    frames.append((iter(e), []))
+                    break
 
             else:
-                msg = """The previous element of an operand should be None or another Operand.
-                      The inputted parse result is invalid! Type '{type}', Stack: {stack}"""
-                raise QueryParserError(msg.format(type=type(stack[-1]), stack=stack))
+                frames.pop()
+                node = stack.pop() if stack else None
+
+                if frames:
+                    self._push_operand(frames[-1][1], node)
+                else:
+                    root = node
+
+        return flatten_tree(root) if self._nary else root
+
+    @staticmethod
+    def _push_operand(stack, operand):
+        if len(stack) == 0:
+            stack.append(operand)
+
+        elif isinstance(stack[-1], (OperatorNode, Operand, CompactOperand)):
+            current_elem = stack.pop().add_input(operand)
+
+            # 'Not' operator only works on the right element, if there was a previous operator
+            # the stack would be have 2 elements, so the new operand is added to the current operator
+            # (Not operator) and then the Not operator is added as an input to the previous operator
+            # finishing the cicle and leaving the stack with only one element (an operator)
+            if stack:
+                current_elem = stack.pop().add_input(current_elem)
 
-        return self.parse_elements(elements[1:], stack)
+            stack.append(current_elem)
+
+        else:
+            msg = """The previous element of an operand should be None or another Operand.
+                  The inputted parse result is invalid! Type '{type}', Stack: {stack}"""
+            raise QueryParserError(msg.format(type=type(stack[-1]), stack=stack))
 
     def stringify(self, query):
         """
@@ -91,18 +164,36 @@ class QueryParser(object):
             s = Not.type + " " + self._do_stringify(node.children[0])
 
         else:
-            s = "(%s %s %s)" % (self._do_stringify(node.children[0]), node.type, self._do_stringify(node.children[1]))
+            s = "(%s)" % (" %s " % node.type).join(self._do_stringify(child) for child in node.children)
 
         return s
 
     def _leaf_to_string(self, term):
-        if type(term.field) is list:
+        if term.value_type and term.value_type.endswith(Term.SET % ''):
+            s = "(%s)" % " or ".join(self._leaf_to_string(Term(term, **{Term.VAL: value, Term.VAL_TYPE: None}))
+                                     for value in term.value)
+
+        elif isinstance(term.field, list):
             s = str(term.value)
         else:
             # We are reverting the query to string, we have the already aliased fields and we want the original ones
             aliases = {v: k for k, v in iter(self._grammar.term_parser.aliases.items())}
             field = aliases[term.field] if term.field in aliases else term.field
-            value = "%s..%s" % (term.value[0], term.value[1]) if type(term.value) is list else term.value
+            value = "%s..%s" % (term.value[0], term.value[1]) if isinstance(term.value, list) else term.value
             s = "%s:%s" % (field, value)
 
         return s
+
+
+def _parse_chunk(state, chunk):
+    parser, fail_if_syntax_mismatch = state
+    parsed = {}
+
+    for query_string in chunk:
+        if query_string not in parsed:
+            try:
+                parsed[query_string] = parser.parse(query_string, fail_if_syntax_mismatch)
+            except Exception as e:
+                parsed[query_string] = e
+
+    return [parsed[query_string] for query_string in chunk]
@@ -0,0 +1,439 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Cost based planning of query trees (see :meth:plyse.query.Query.plan): the inputs of every AND and OR operator get
+reordered so a short-circuiting evaluator does the least work, out of estimates of how many records each term matches.
+
+Estimates come from :class:Statistics, given explicitly, or from :class:SketchStatistics, which learns them out of
+the records an evaluator goes through with a count-min sketch of the field values and a HyperLogLog of the distinct
+values of each field.
+"""
+import hashlib
+import math
+from collections import namedtuple
+
+from .query_tree import And, Not, transform_tree, _chain_operands, _same_or_new
+from .term_parser import Term
+
+
+class PlannerError(Exception):
+    pass
+
+
+def _hash(key):
+    """
+    Stable 64 bit hash of a field value, the same in every process
+    """
+    return int(hashlib.md5(repr(key).encode('utf-8')).hexdigest()[:16], 16)
+
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class CountMinSketch(object):
+    """
+    Approximate count of the times each key was added, in a fixed amount of memory. Estimates are never below the real
+    count and exceed it by at most 2 / width of the total count, with probability 1 - 1 / 2 ** depth.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        if width < 1 or depth < 1:
+            raise PlannerError("Count-min sketches need a positive width and depth")
+
+        self._width = width
+        self._depth = depth
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def _columns(self, key):
+        # double hashing, each row takes a different combination of the two halves of the hash
+        h = _hash(key)
+        low, high = h & 0xffffffff, h >> 32
+
+        return [(low + row * high) % self._width for row in range(self._depth)]
+
+    def add(self, key, count=1):
+        for row, column in zip(self._rows, self._columns(key)):
+            row[column] += count
+
+    def estimate(self, key):
+        return min(row[column] for row, column in zip(self._rows, self._columns(key)))
+
+
+class HyperLogLog(object):
+    """
+    Approximate count of distinct keys in 2 ** precision registers, with a standard error of about
+    1.04 / sqrt(2 ** precision)
+    """
+
+    def __init__(self, precision=10):
+        if not 4 <= precision <= 16:
+            raise PlannerError("HyperLogLog precision has to be between 4 and 16")
+
+        self._precision = precision
+        self._registers = [0] * (1 << precision)
+
+    def add(self, key):
+        h = _hash(key)
+        register = h >> (64 - self._precision)
+        rest = h & ((1 << (64 - self._precision)) - 1)
+
+        # position of the first 1 bit in the rest of the hash
+        rank = (64 - self._precision) - rest.bit_length() + 1
+        if rank > self._registers[register]:
+            self._registers[register] = rank
+
+    def count(self):
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self._registers)
+
+        empty = self._registers.count(0)
+        if estimate <= 2.5 * m and empty:
+            estimate = m * math.log(float(m) / empty)  # linear counting for small cardinalities
+
+        return int(round(estimate))
+
+
+class Statistics(object):
+    """
+    Estimated selectivity of query terms: the fraction of the records they match.
+
+      - exact values (ints, quoted strings, keyword values) use the selectivity of the (field, value) pair, and value
+        sets the sum of their values
+      - any other term, and exact values without statistics of their own, use the selectivity of the field
+      - terms on fields without statistics use :default
+
+    Terms with several default fields match if any of them does, fields are assumed to be independent.
+    """
+
+    exact_value_types = (Term.INT, Term.EXACT_STRING, Term.KEYWORD_VALUE)
+
+    def __init__(self, total, fields=None, values=None, default=0.1):
+        """
+        :param total: amount of records
+        :param fields: field -> selectivity of the terms on that field
+        :param values: (field, value) -> selectivity of the terms matching that value exactly
+        :param default: selectivity of the terms without statistics
+        """
+        self._total = total
+        self._fields = fields or {}
+        self._values = values or {}
+        self._default = default
+
+    @property
+    def total(self):
+        return self._total
+
+    def selectivity(self, term):
+        """
+        :return: estimated fraction of the records matching :term, between 0 and 1
+        """
+        field, val, val_type = term.get(Term.FIELD), term.get(Term.VAL), term.get(Term.VAL_TYPE)
+
+        if isinstance(field, list) and term.get(Term.FIELD_TYPE) != Term.DEFAULT:
+            fields = [tuple(field)]
+        else:
+            fields = field if isinstance(field, list) else [field]
+
+        misses = 1.0
+        for f in fields:
+            misses *= 1.0 - min(1.0, max(0.0, self._field_term_selectivity(f, val, val_type)))
+
+        return 1.0 - misses
+
+    def _field_term_selectivity(self, field, val, val_type):
+        if val_type in self.exact_value_types:
+            return self.value_selectivity(field, val)
+
+        if val_type and val_type.endswith(Term.SET % ''):
+            return sum(self.value_selectivity(field, v) for v in val)
+
+        if val_type and val_type.endswith(Term.RANGE % ''):
+            return self.range_selectivity(field, val[0], val[1])
+
+        if val_type in (Term.GREATER_THAN, Term.GREATER_EQUAL_THAN):
+            return self.range_selectivity(field, val, None)
+
+        if val_type in (Term.LOWER_THAN, Term.LOWER_EQUAL_THAN):
+            return self.range_selectivity(field, None, val)
+
+        return self.field_selectivity(field)
+
+    def field_selectivity(self, field):
+        return self._fields.get(field, self._default)
+
+    def value_selectivity(self, field, value):
+        try:
+            return self._values[(field, value)]
+        except (KeyError, TypeError):
+            return self.field_selectivity(field)
+
+    def range_selectivity(self, field, low, high):
+        """
+        :param low: lower bound, None if there is none
+        :param high: upper bound, None if there is none
+        """
+        return self.field_selectivity(field)
+
+
+class SketchStatistics(Statistics):
+    """
+    Statistics learned from the records an evaluator goes through (see :meth:observe), in a fixed amount of memory:
+
+      - a count-min sketch counts the records with each (field, value) pair
+      - a HyperLogLog per field counts its distinct values, exact values not in the sketch are assumed to be one of
+        them, all equally common
+      - the lowest and highest numeric value of each field, ranges are assumed to be uniformly distributed between
+        them
+
+    Partial strings use :partial_selectivity of the records that have the field.
+    """
+
+    def __init__(self, width=2048, depth=4, precision=10, partial_selectivity=0.1, default=0.1):
+        super(SketchStatistics, self).__init__(0, default=default)
+        self._counts = CountMinSketch(width, depth)
+        self._precision = precision
+        self._distinct = {}  # field -> HyperLogLog
+        self._present = {}  # field -> records with the field
+        self._bounds = {}  # field -> [lowest, highest] numeric value
+        self._partial_selectivity = partial_selectivity
+
+    def observe(self, record):
+        """
+        :param record: dict of field -> value, nested dicts are fields too (address:zip is ('address', 'zip'))
+        """
+        self._total += 1
+
+        pending = [((), record)]
+        while pending:
+            path, values = pending.pop()
+
+            for key, value in values.items():
+                field = path + (key,) if path else key
+
+                if isinstance(value, dict):
+                    pending.append((path + (key,), value))
+                elif value is not None:
+                    self._observe_value(field, value)
+
+    def observe_many(self, records):
+        for record in records:
+            self.observe(record)
+
+    def _observe_value(self, field, value):
+        self._present[field] = self._present.get(field, 0) + 1
+        distinct = self._distinct.get(field)
+
+        if distinct is None:
+            distinct = self._distinct[field] = HyperLogLog(self._precision)
+
+        for item in (value if isinstance(value, (list, tuple, set, frozenset)) else [value]):
+            self._counts.add((field, item))
+            distinct.add(item)
+
+            if _numeric(item):
+                bounds = self._bounds.get(field)
+
+                if bounds is None:
+                    self._bounds[field] = [item, item]
+                elif item < bounds[0]:
+                    bounds[0] = item
+                elif item > bounds[1]:
+                    bounds[1] = item
+
+    def _presence(self, field):
+        return float(self._present.get(field, 0)) / self._total if self._total else 0.0
+
+    def field_selectivity(self, field):
+        if field not in self._present:
+            return 0.0 if self._total else self._default
+
+        return self._presence(field) * self._partial_selectivity
+
+    def value_selectivity(self, field, value):
+        if not self._total or field not in self._present:
+            return self.field_selectivity(field)
+
+        try:
+            count = self._counts.estimate((field, value))
+        except TypeError:
+            count = 0
+
+        if count:
+            return float(count) / self._total
+
+        # not in the sketch at all, so the value is at most as common as the average one
+        distinct = self._distinct[field].count() if field in self._distinct else 0
+        return self._presence(field) / distinct if distinct else 0.0
+
+    def range_selectivity(self, field, low, high):
+        bounds = self._bounds.get(field)
+
+        if not self._total:
+            return self._default
+
+        if bounds is None or (low is not None and not _numeric(low)) or (high is not None and not _numeric(high)):
+            return 0.0
+
+        lowest, highest = bounds
+        low = lowest if low is None else max(low, lowest)
+        high = highest if high is None else min(high, highest)
+
+        if high < low:
+            return 0.0
+
+        # values are assumed to be integers, so a range of a single value covers one of the possible ones
+        covered = (high - low + 1.0) / (highest - lowest + 1.0)
+        return self._presence(field) * min(1.0, covered)
+
+
+# estimates of a node of a planned tree
+NodeEstimate = namedtuple('NodeEstimate', ['selectivity', 'cardinality', 'cost'])
+
+
+class Plan(object):
+    """
+    Planned query tree along with the estimates of each of its nodes
+    """
+
+    def __init__(self, tree, estimates, nodes):
+        self._tree = tree
+        self._estimates = estimates
+        self._nodes = nodes  # keeps the nodes alive while their ids are keys
+
+    @property
+    def tree(self):
+        return self._tree
+
+    def estimate(self, node):
+        """
+        :param node: node of the planned tree
+        :return: :class:NodeEstimate
+        """
+        return self._estimates[id(node)]
+
+    def explain(self):
+        """
+        :return: one line per node of the planned tree, indented by depth, with its estimated cardinality, selectivity
+                 and evaluation cost
+        """
+        lines = []
+        pending = [(self._tree, 0)] if self._tree is not None else []
+
+        while pending:
+            node, depth = pending.pop()
+            estimate = self.estimate(node)
+
+            if node.is_leaf:
+                label = "%s:%s" % (node.get(Term.FIELD), node.get(Term.VAL))
+            else:
+                label = node.type.upper()
+                pending.extend((child, depth + 1) for child in reversed(node.children))
+
+            lines.append("%s%s  (rows=%d selectivity=%.4g cost=%.3g)" % (
+                '  ' * depth, label, estimate.cardinality, estimate.selectivity, estimate.cost))
+
+        return "\n".join(lines)
+
+
+class Planner(object):
+    """
+    Reorders the inputs of AND and OR operators so that a short-circuiting evaluator stops as soon as possible:
+    AND operators get the inputs most likely to be false first, OR operators the ones most likely to be true, both
+    weighted by how much it costs to evaluate them. Chains of the same operator are merged into n-ary operators first
+    (see :func:plyse.query_tree.flatten_tree), so every input of a chain gets reordered, not just the two of each
+    node. :func:plyse.query_tree.binarize_tree turns the plan back into binary operators, keeping the order.
+
+    Selectivities come from :class:Statistics and assume the inputs are independent: an AND matches the product of
+    the selectivities of its inputs, an OR everything that is not missed by all of them. The cost of a term is
+    :attr:costs of its value type, the cost of an operator the expected cost of evaluating its inputs in order,
+    stopping at the first one that settles the result.
+    """
+
+    costs = {
+        Term.INT: 1.0,
+        Term.EXACT_STRING: 1.0,
+        Term.KEYWORD_VALUE: 1.0,
+        Term.GREATER_THAN: 1.5,
+        Term.GREATER_EQUAL_THAN: 1.5,
+        Term.LOWER_THAN: 1.5,
+        Term.LOWER_EQUAL_THAN: 1.5,
+        Term.PARTIAL_STRING: 4.0,
+    }
+
+    # cost of the value types not in :attr:costs, ej: ranges and value sets
+    default_cost = 2.0
+
+    def __init__(self, statistics):
+        self._statistics = statistics
+
+    def plan(self, root):
+        """
+        :param root: root :class:TreeNode of the query tree
+        :return: :class:Plan
+        """
+        estimates = {}  # by node id
+        nodes = []  # keeps the nodes alive while their ids are keys
+
+        def _estimate(node):
+            if id(node) not in estimates:
+                selectivity = self._statistics.selectivity(node)
+                estimates[id(node)] = self._estimate(selectivity, self._term_cost(node))
+                nodes.append(node)
+
+            return estimates[id(node)]
+
+        def _plan(node, children):
+            inputs = [_estimate(child) for child in children]
+
+            if node.type == Not.type:
+                selectivity, cost = 1.0 - inputs[0].selectivity, inputs[0].cost
+
+            else:
+                is_and = node.type == And.type
+
+                # the classic ordering for short-circuiting evaluation: the lowest cost per chance of settling the
+                # result goes first, an input settles an AND when it's false and an OR when it's true
+                def _rank(pair):
+                    estimate = pair[1]
+                    settles = 1.0 - estimate.selectivity if is_and else estimate.selectivity
+                    return estimate.cost / settles if settles > 0 else float('inf')
+
+                ordered = sorted(zip(children, inputs), key=_rank)
+                children = [child for child, _ in ordered]
+                inputs = [estimate for _, estimate in ordered]
+
+                cost, reached = 0.0, 1.0  # reached: chance of getting to the next input
+                for estimate in inputs:
+                    cost += reached * estimate.cost
+                    reached *= estimate.selectivity if is_and else 1.0 - estimate.selectivity
+
+                selectivity = reached if is_and else 1.0 - reached
+
+            planned = _same_or_new(node, children)
+            estimates[id(planned)] = self._estimate(selectivity, cost)
+            nodes.append(planned)
+
+            return planned
+
+        tree = transform_tree(root, _plan, _chain_operands)
+
+        if tree is not None and tree.is_leaf:
+            _estimate(tree)
+
+        return Plan(tree, estimates, nodes)
+
+    def _estimate(self, selectivity, cost):
+        selectivity = min(1.0, max(0.0, selectivity))
+        return NodeEstimate(selectivity, int(round(selectivity * self._statistics.total)), cost)
+
+    def _term_cost(self, term):
+        cost = self.costs.get(term.get(Term.VAL_TYPE), self.default_cost)
+        fields = term.get(Term.FIELD)
+
+        # every default field gets checked
+        if isinstance(fields, list) and term.get(Term.FIELD_TYPE) == Term.DEFAULT:
+            cost *= len(fields)
+
+        return cost
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compiles query trees into plain python callables that tell whether a record (a dict) matches the query (see
+:meth:plyse.query.Query.compile_predicate), to filter in-memory records without walking the tree for each of them.
+
+The tree is turned into its canonical form (see :func:plyse.canonical.canonical) and then into the source of a single
+function, an expression of nested ``and``, ``or`` and ``not`` that python evaluates short-circuiting. Terms are
+replaced by calls to matchers built once per term, so the source only depends on the shape of the query: it gets
+compiled once per shape and reused for every query with that shape, whatever their values are.
+"""
+import re
+
+from .canonical import canonical
+from .query_tree import And, Not, walk_tree, POST_ORDER
+from .term_parser import Term
+from .util import LRUCache
+
+
+class PredicateError(Exception):
+    pass
+
+
+# record values of these types hold several values, they match if any of them does
+_MULTI_VALUED = (list, tuple, set, frozenset)
+
+
+def _any_value(test):
+    def _test(value):
+        if value.__class__ in _MULTI_VALUED:
+            return any(test(v) for v in value)
+
+        return test(value)
+
+    return _test
+
+
+def _equal_matcher(val):
+    def _test(value):
+        return value == val or (value.__class__ in _MULTI_VALUED and val in value)
+
+    return _test
+
+
+def _partial_string_matcher(val):
+    # '*' is a wildcard, anything else is a case insensitive substring
+    if '*' in val:
+        search = re.compile('.*'.join(re.escape(part) for part in val.split('*')), re.IGNORECASE | re.DOTALL).search
+
+        def _test(value):
+            return value is not None and search(value if isinstance(value, str) else str(value)) is not None
+    else:
+        val = val.lower()
+
+        def _test(value):
+            return value is not None and val in (value if isinstance(value, str) else str(value)).lower()
+
+    return _any_value(_test)
+
+
+def _comparison_matcher(compare):
+    def _matcher(val):
+        def _test(value):
+            try:
+                return value is not None and compare(value, val)
+            except TypeError:  # values that can't be compared with the query one don't match
+                return False
+
+        return _any_value(_test)
+
+    return _matcher
+
+
+def _range_matcher(val):
+    low, high = val
+
+    def _test(value):
+        try:
+            return value is not None and low <= value <= high
+        except TypeError:
+            return False
+
+    return _any_value(_test)
+
+
+def _set_matcher(val):
+    values = frozenset(val)
+
+    def _test(value):
+        if value.__class__ in _MULTI_VALUED:
+            return not values.isdisjoint(value)
+
+        try:
+            return value in values
+        except TypeError:  # unhashable values
+            return False
+
+    return _test
+
+
+def _nested_value(path):
+    def _value(record):
+        for key in path:
+            if not isinstance(record, dict):
+                return None
+            record = record.get(key)
+
+        return record
+
+    return _value
+
+
+class PredicateCompiler(object):
+    """
+    Builds predicates out of query trees. Each term is matched against the record value of its field:
+
+      - attribute fields are read from the record key of the same name, nested fields (address:zip) from nested
+        dicts, and terms with several default fields match if any of those keys does
+      - record values that are lists, tuples or sets match if any of their items does
+      - values are compared according to the term value type, see :attr:matchers. Values that can't be compared
+        with the query one (ej: a string against 'age:>3') don't match
+
+    :attr:matchers maps each value type to a function that takes the term value and returns the test for the record
+    values, subclasses can extend it to support their own value types. Value ranges and sets (see
+    :class:plyse.normalizer.Normalizer) of any type are supported.
+    """
+
+    matchers = {
+        Term.INT: _equal_matcher,
+        Term.EXACT_STRING: _equal_matcher,
+        Term.KEYWORD_VALUE: _equal_matcher,
+        Term.PARTIAL_STRING: _partial_string_matcher,
+        Term.GREATER_THAN: _comparison_matcher(lambda value, val: value > val),
+        Term.GREATER_EQUAL_THAN: _comparison_matcher(lambda value, val: value >= val),
+        Term.LOWER_THAN: _comparison_matcher(lambda value, val: value < val),
+        Term.LOWER_EQUAL_THAN: _comparison_matcher(lambda value, val: value <= val),
+    }
+
+    # compiled function factories, by source. The source only depends on the shape of the query
+    _factories = LRUCache(256)
+
+    def __init__(self, schema=None):
+        """
+        :param schema: maps query fields (nested fields as tuples) to where their values are in the records: a record
+                       key, a list of keys (the term matches if any of them does, ej: the default fields) or a
+                       callable that takes the record and returns the value
+        """
+        self._schema = schema or {}
+
+    def compile(self, root):
+        """
+        :param root: root :class:TreeNode of the query tree
+        :return: callable that takes a record and returns True if it matches the query. Every record matches an
+                 empty query (None root)
+        """
+        if root is None:
+            return lambda record: True
+
+        expressions = {}  # by node id
+        names, args = [], []
+
+        # the canonical form shares the source between equal queries and puts the terms, cheaper to check, first
+        tree = canonical(root)
+
+        for node in walk_tree(tree, POST_ORDER):
+            if node.is_leaf:
+                expressions[id(node)] = self._term_expression(node, names, args)
+
+            elif node.type == Not.type:
+                expressions[id(node)] = "not %s" % expressions[id(node.children[0])]
+
+            else:
+                operator = ' and ' if node.type == And.type else ' or '
+                expressions[id(node)] = "(%s)" % operator.join(expressions[id(child)] for child in node.children)
+
+        source = "def _factory(%s):\n" \
+                 "    def predicate(record):\n" \
+                 "        get = record.get\n" \
+                 "        return bool(%s)\n" \
+                 "    return predicate\n" % (', '.join(names), expressions[id(tree)])
+
+        return self._factory(source)(*args)
+
+    @classmethod
+    def _factory(cls, source):
+        factory = cls._factories.get(source)
+
+        if factory is None:
+            namespace = {}
+
+            # too deep expressions raise RecursionError, a RuntimeError (py2 raises the RuntimeError itself)
+            try:
+                exec(compile(source, '<plyse predicate>', 'exec'), namespace)
+            except (SyntaxError, RuntimeError, MemoryError):
+                raise PredicateError("The query is too deeply nested to be compiled")
+
+            factory = namespace['_factory']
+            cls._factories.set(source, factory)
+
+        return factory
+
+    def _term_expression(self, term, names, args):
+        test = self._matcher(term.get(Term.VAL_TYPE))(term.get(Term.VAL))
+        test_name = 't%d' % len(names)
+        names.append(test_name)
+        args.append(test)
+
+        expressions = []
+        for accessor in self._accessors(term):
+            name = '%s%d' % ('a' if callable(accessor) else 'k', len(names))
+            names.append(name)
+            args.append(accessor)
+            expressions.append('%s(%s)' % (test_name, '%s(record)' % name if callable(accessor) else 'get(%s)' % name))
+
+        if not expressions:
+            # a term without fields (ej: no default fields) matches nothing
+            return 'False'
+
+        return expressions[0] if len(expressions) == 1 else "(%s)" % ' or '.join(expressions)
+
+    def _matcher(self, val_type):
+        if val_type in self.matchers:
+            return self.matchers[val_type]
+
+        if val_type and val_type.endswith(Term.RANGE % ''):
+            return _range_matcher
+
+        if val_type and val_type.endswith(Term.SET % ''):
+            return _set_matcher
+
+        raise PredicateError("Don't know how to match '%s' values" % val_type)
+
+    def _accessors(self, term):
+        field = term.get(Term.FIELD)
+        schema_key = tuple(field) if isinstance(field, list) else field
+
+        if schema_key in self._schema:
+            location = self._schema[schema_key]
+            return list(location) if isinstance(location, (list, tuple)) else [location]
+
+        if isinstance(field, list):
+            # several default fields are alternatives, several attribute fields are a path into nested records
+            return list(field) if term.get(Term.FIELD_TYPE) == Term.DEFAULT else [_nested_value(field)]
+
+        return [field]
+
+
+def compile_predicate(root, schema=None):
+    """
+    Shortcut for :meth:PredicateCompiler.compile
+    """
+    return PredicateCompiler(schema).compile(root)
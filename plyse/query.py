@@ -1,63 +1,233 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
-from .query_tree import OperatorFactory, And, Or
-from copy import deepcopy
+from threading import Lock
+from .query_tree import OperatorFactory, And, Or, pack_trees, unpack_trees, iter_tree_leaves
+from .compact_tree import CompactNode, CompactOperatorFactory
+from .flat_tree import FlatTree
+from .term_parser import Term
+from .normalizer import Normalizer
+from .canonical import canonical, fingerprint, tree_digest, operator_digest
+from .predicate import PredicateCompiler
+from .columnar import ColumnarEvaluator
+from .planner import Planner
+from .sql_compiler import SQLCompiler
+from .es_compiler import ESCompiler
 
 
 class QueryError(Exception):
     pass
 
 
+class QueryHistory(object):
+    """
+    Append only record of the queries that were stacked or combined to build a query, mapping each level (position)
+    to a (query_tree, raw_query) tuple. Histories derived from each other share one list of entries, each one seeing
+    its first :len entries, so looking up a level is O(1) and appending to the latest history doesn't copy anything.
+    Appending to a history that was already appended to (deriving two queries from the same one) copies its entries.
+    """
+
+    __slots__ = ('_entries', '_size')
+
+    # guards the check and the append on a shared entries list
+    _lock = Lock()
+
+    def __init__(self, entry=None, _entries=None):
+        self._entries = _entries if _entries is not None else [entry]
+        self._size = len(self._entries)
+
+    def append(self, entry):
+        with self._lock:
+            if len(self._entries) == self._size:
+                entries = self._entries
+            else:
+                entries = self._entries[:self._size]
+
+            entries.append(entry)
+
+            return QueryHistory(_entries=entries)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, level):
+        return isinstance(level, int) and 0 <= level < self._size
+
+    def __getitem__(self, level):
+        if level not in self:
+            raise KeyError(level)
+
+        return self._entries[level]
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def items(self):
+        return [(level, self[level]) for level in self]
+
+    def entries(self):
+        return self._entries[:self._size]
+
+    @staticmethod
+    def from_entries(entries):
+        return QueryHistory(_entries=list(entries)) if entries else None
+
+
+class TermIndex(object):
+    """
+    Terms of a query grouped by field, field type and value type, in the same order as :meth:Query.terms. A term
+    with several fields (ej: default fields) is indexed under each of them. Groups are tuples, shared between the
+    indexes merged out of them.
+    """
+
+    __slots__ = ('_by_field', '_by_field_type', '_by_val_type', '_fields')
+
+    def __init__(self, by_field=None, by_field_type=None, by_val_type=None):
+        self._by_field = by_field or {}
+        self._by_field_type = by_field_type or {}
+        self._by_val_type = by_val_type or {}
+        self._fields = None
+
+    @staticmethod
+    def build(terms):
+        by_field, by_field_type, by_val_type = {}, {}, {}
+
+        for term in terms:
+            fields = term.get(Term.FIELD)
+
+            for field in (fields if isinstance(fields, list) else [fields]):
+                by_field.setdefault(field, []).append(term)
+
+            by_field_type.setdefault(term.get(Term.FIELD_TYPE), []).append(term)
+            by_val_type.setdefault(term.get(Term.VAL_TYPE), []).append(term)
+
+        return TermIndex(*[{key: tuple(group) for key, group in groups.items()}
+                           for groups in (by_field, by_field_type, by_val_type)])
+
+    def merge(self, other):
+        """
+        Index of the terms of both indexes, the ones of :other after these ones
+
+        :return: new :class:TermIndex
+        """
+        def _merge(groups, other_groups):
+            merged = dict(groups)
+            for key, group in other_groups.items():
+                merged[key] = merged[key] + group if key in merged else group
+
+            return merged
+
+        return TermIndex(_merge(self._by_field, other._by_field),
+                         _merge(self._by_field_type, other._by_field_type),
+                         _merge(self._by_val_type, other._by_val_type))
+
+    def by_field(self, field):
+        return self._by_field.get(field, ())
+
+    def by_field_type(self, field_type):
+        return self._by_field_type.get(field_type, ())
+
+    def by_val_type(self, val_type):
+        return self._by_val_type.get(val_type, ())
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = frozenset(self._by_field)
+
+        return self._fields
+
+
+def _unpickle_query(nodes, unfrozen, roots, raw_queries, stack_size):
+    trees = unpack_trees(nodes, roots, unfrozen)
+    entries = list(zip(trees, raw_queries))
+
+    query = Query.__new__(Query)
+    query._query_tree, query._raw_query = entries[0]
+    query._stack_map = QueryHistory.from_entries(entries[1:1 + stack_size])
+    query._combine_map = QueryHistory.from_entries(entries[1 + stack_size:])
+    query._flat_tree = None
+    query._derived = {}
+    query._sources = None
+
+    return query
+
+
+# shared by the queries compiled without a compiler of their own, so they share its SQL templates cache
+_sql_compiler = SQLCompiler()
+_es_compiler = ESCompiler()
+
+
+def _derived(cache, tree, key, build):
+    if key not in cache:
+        cache[key] = build(tree)
+
+    return cache[key]
+
+
 class Query(object):
     """
     Query represents the parsed user query. It allows to operate on a higher level
     combining query objects to build stacked or combined queries, as well as to retrieve
     queries from complex combined/stacked queries and all the terms conforming the query.
 
-    Query is Immutable, every operation that modifies the state returns a new Query object
+    Query is Immutable, every operation that modifies the state returns a new Query object.
+    The query tree gets frozen (see :meth:TreeNode.freeze) instead of copied, so trees are
+    shared between the queries built on top of each other and between their histories.
 
     """
     def __init__(self, query_tree, raw_query=None):
         self._raw_query = raw_query
-        self._query_tree = deepcopy(query_tree)
+        self._query_tree = query_tree.freeze() if query_tree is not None else None
+        self._flat_tree = None
+        self._derived = {}  # values derived from the tree (indexes, fingerprint), built on first use
+        self._sources = None  # derived values and trees of the queries this one was stacked or combined from
 
-        original_tuple = (deepcopy(query_tree), deepcopy(raw_query))
-        self._stack_map = {0: original_tuple}
-        self._combine_map = {0: original_tuple}
+        original_tuple = (self._query_tree, raw_query)
+        self._stack_map = QueryHistory(original_tuple)
+        self._combine_map = QueryHistory(original_tuple)
 
     def _mix_query(self, query, operator):
         q, raw = query.query_as_tree, query.raw_query
 
-        new_root = OperatorFactory.create(operator)
+        # compact trees stay compact (see :mod:plyse.compact_tree)
+        factory = CompactOperatorFactory if isinstance(self._query_tree, CompactNode) else OperatorFactory
+        new_root = factory.create(operator)
         new_root.add_input(self._query_tree)
-        new_root.add_input(deepcopy(q))
+        new_root.add_input(q)
 
         new_root_raw = None
         if self._raw_query and raw:
             new_root_raw = "(%s) %s (%s)" % (self._raw_query, new_root.type, raw)
 
-        return q, raw, new_root, new_root_raw
+        result = Query(new_root, new_root_raw)
+        result._sources = ((self._derived, self._query_tree), (query._derived, q))
+
+        return q, raw, result
 
     def stack(self, query):
-        q, raw, new_root, new_root_raw = self._mix_query(query, And.type)
+        q, raw, result = self._mix_query(query, And.type)
 
-        result = Query(new_root, new_root_raw)
-        result._combine_map.update(self._combine_map)  # Keep the combined history from current query
-        result._stack_map.update(self._stack_map)  # Keep the stack history and append the new one to the dict
-        result._stack_map[len(self._stack_map)] = (deepcopy(q), deepcopy(raw))
+        result._combine_map = self._combine_map  # Keep the combined history from current query
+        result._stack_map = self._stack_map.append((q, raw))  # Keep the stack history and append the new one
 
         return result
 
     def combine(self, query):
-        q, raw, new_root, new_root_raw = self._mix_query(query, Or.type)
+        q, raw, result = self._mix_query(query, Or.type)
 
-        result = Query(new_root, new_root_raw)
-        result._stack_map.update(self._stack_map)  # Keep the stack history from current query
-        result._combine_map.update(self._combine_map)  # Keep the combine history and append the new one to the dict
-        result._combine_map[len(self._combine_map)] = (deepcopy(q), deepcopy(raw))
+        result._stack_map = self._stack_map  # Keep the stack history from current query
+        result._combine_map = self._combine_map.append((q, raw))  # Keep the combine history and append the new one
 
         return result
 
+    def __reduce__(self):
+        # The query tree and the ones in the histories share most of their nodes, they all get packed together
+        # (see :func:plyse.query_tree.pack_trees) so each node is pickled once
+        entries = [(self._query_tree, self._raw_query)] + self._stack_map.entries() + self._combine_map.entries()
+        nodes, roots, unfrozen = pack_trees([tree for tree, _ in entries])
+
+        return _unpickle_query, (nodes, unfrozen, roots, [raw for _, raw in entries], len(self._stack_map))
+
     @property
     def query_as_tree(self):
         return self._query_tree
@@ -66,9 +236,159 @@ class Query(object):
     def raw_query(self):
         return self._raw_query
 
+    @property
+    def flat_tree(self):
+        """
+        Array backed encoding of the query tree (see :class:plyse.flat_tree.FlatTree), built on first use. It shares
+        the leaves with the query tree, :meth:FlatTree.to_tree converts it back.
+        """
+        if self._flat_tree is None:
+            self._flat_tree = FlatTree.from_tree(self._query_tree)
+
+        return self._flat_tree
+
     def terms(self, ignore_negated=False):
         return self._query_tree.leaves(ignore_negated)
 
+    def iter_terms(self, ignore_negated=False):
+        """
+        Lazy version of :meth:terms, the tree is walked as the terms are consumed
+
+        :return: generator of the query terms (leaves)
+        """
+        return iter_tree_leaves(self._query_tree, ignore_negated)
+
+    def term_index(self, ignore_negated=False):
+        """
+        Index of the query terms (see :class:TermIndex), built on first use. The index of a stacked or combined query
+        is merged out of the indexes of its two queries instead of walking the whole tree again.
+
+        :param ignore_negated: leave out the terms under a NOT operator
+        :return: :class:TermIndex
+        """
+        key = ('term_index', bool(ignore_negated))
+
+        if key not in self._derived:
+            def _build(tree):
+                return TermIndex.build(iter_tree_leaves(tree, ignore_negated))
+
+            if self._sources is not None:
+                left, right = [_derived(derived, tree, key, _build) for derived, tree in self._sources]
+                self._derived[key] = left.merge(right)
+            else:
+                self._derived[key] = _build(self._query_tree)
+
+        return self._derived[key]
+
+    def terms_by_field(self, field, ignore_negated=False):
+        return self.term_index(ignore_negated).by_field(field)
+
+    def terms_by_field_type(self, field_type, ignore_negated=False):
+        return self.term_index(ignore_negated).by_field_type(field_type)
+
+    def terms_by_val_type(self, val_type, ignore_negated=False):
+        return self.term_index(ignore_negated).by_val_type(val_type)
+
+    def fields(self, ignore_negated=False):
+        """
+        :return: frozenset of the fields the query terms refer to
+        """
+        return self.term_index(ignore_negated).fields
+
+    def canonical(self, aliases=None):
+        """
+        Query with the canonical version of the tree (see :func:plyse.canonical.canonical), equal for semantically
+        equal queries. The raw query stays the same, stack and combine histories start over.
+
+        :param aliases: alias -> field mapping to normalize the fields with, ej: grammar.term_parser.aliases
+        :return: :class:Query
+        """
+        return Query(canonical(self._query_tree, aliases), self._raw_query)
+
+    def fingerprint(self, aliases=None):
+        """
+        Stable structural hash of the query (see :mod:plyse.canonical), the same for every query with the same
+        canonical form and in every process, to be used as cache key. The fingerprint of a stacked or combined query
+        is derived from the fingerprints of its queries.
+
+        :param aliases: alias -> field mapping to normalize the fields with, ej: grammar.term_parser.aliases
+        :return: hex string
+        """
+        if aliases:
+            return fingerprint(self._query_tree, aliases)
+
+        if 'digest' not in self._derived:
+            if self._sources is not None:
+                children = [_derived(derived, tree, 'digest', tree_digest) for derived, tree in self._sources]
+                self._derived['digest'] = operator_digest(self._query_tree.type, children)
+            else:
+                self._derived['digest'] = tree_digest(self._query_tree)
+
+        return '%032x' % self._derived['digest'].digest
+
+    def normalize(self, **rules):
+        """
+        Equivalent query with a simplified tree, see :class:plyse.normalizer.Normalizer for the rules and how to
+        turn them on and off. The raw query stays the same, stack and combine histories start over.
+
+        :param rules: :class:Normalizer arguments
+        :return: :class:Query
+        """
+        return Query(Normalizer(**rules).normalize(self._query_tree), self._raw_query)
+
+    def compile_predicate(self, schema=None):
+        """
+        Compiles the query into a callable that tells whether a record (dict) matches it, see
+        :class:plyse.predicate.PredicateCompiler for how terms are matched. Without schema, the predicate is built
+        once and kept with the query.
+
+        :param schema: where the values of each field are in the records, see :class:PredicateCompiler
+        :return: callable that takes a record and returns a bool
+        """
+        if schema:
+            return PredicateCompiler(schema).compile(self._query_tree)
+
+        return _derived(self._derived, self._query_tree, 'predicate', PredicateCompiler().compile)
+
+    def mask(self, columns):
+        """
+        Rows of columnar data that match the query, evaluated with numpy (see :class:plyse.columnar.ColumnarEvaluator).
+        To run several queries over the same columns, use an evaluator and its mask method.
+
+        :param columns: dict of field -> numpy array
+        :return: boolean numpy array
+        """
+        evaluator = columns if isinstance(columns, ColumnarEvaluator) else ColumnarEvaluator(columns)
+        return evaluator.mask(self._query_tree)
+
+    def plan(self, statistics):
+        """
+        Reorders the inputs of the query operators for short-circuiting evaluation, see :class:plyse.planner.Planner
+
+        :param statistics: :class:plyse.planner.Statistics of the records the query will run on
+        :return: :class:plyse.planner.Plan with the planned tree and the estimates of each node
+        """
+        return Planner(statistics).plan(self._query_tree)
+
+    def to_sql(self, compiler=None):
+        """
+        Parameterized SQL WHERE clause for the query, see :class:plyse.sql_compiler.SQLCompiler
+
+        :param compiler: :class:SQLCompiler with the columns and parameter style to use, by default fields are
+                         columns and parameters are '?' placeholders
+        :return: tuple (sql, parameters)
+        """
+        return (compiler or _sql_compiler).compile(self._query_tree)
+
+    def to_es(self, compiler=None):
+        """
+        Elasticsearch/OpenSearch bool query for the query, see :class:plyse.es_compiler.ESCompiler
+
+        :param compiler: :class:ESCompiler with the index fields to use, by default fields are used as they are
+        :return: query dict
+        """
+        return (compiler or _es_compiler).compile(self._query_tree)
+
     def query_from_stack(self, level):
         """
         Get the stacked query at level :level
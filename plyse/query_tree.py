@@ -3,11 +3,210 @@
 from copy import deepcopy
 
 
+class FrozenNodeError(Exception):
+    pass
+
+
+class FrozenList(list):
+    """
+    List value of a frozen node (ej: a range, a value set or the fields of a term). Readers still get a list, but
+    modifying it raises :class:FrozenNodeError like modifying the node does. Copies are plain lists
+    """
+
+    def _check_mutable(self, *args, **kwargs):
+        raise FrozenNodeError("Values of frozen tree nodes can't be modified, make a copy of the node instead")
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _check_mutable
+    append = extend = insert = pop = remove = reverse = sort = clear = _check_mutable
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(list(self), memo)
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+
+def freeze_value(value):
+    """
+    :return: :value, with lists (nested ones included) turned into :class:FrozenList 's
+    """
+    if isinstance(value, list) and not isinstance(value, FrozenList):
+        return FrozenList(freeze_value(v) for v in value)
+
+    return value
+
+
+def freeze_tree(root):
+    """
+    Makes :root and all its descendants immutable. Already frozen subtrees are not visited again, thus freezing a new
+    node on top of frozen ones is O(1)
+
+    :return: root
+    """
+    pending = [root]
+
+    while pending:
+        node = pending.pop()
+
+        if not node._frozen:
+            node._freeze_node()
+            pending.extend(node.children)
+
+    return root
+
+
+class TreeNodeError(Exception):
+    pass
+
+
+# walk orders
+PRE_ORDER = 'pre'
+POST_ORDER = 'post'
+
+
+def walk_tree(root, order=PRE_ORDER, ignore_negated=False):
+    """
+    Lazily walks the tree under :root with an explicit stack, children from left to right. Nothing is visited
+    until the caller asks for the next node, so stopping early skips the rest of the tree.
+
+    :param order: PRE_ORDER yields every operator before its children, POST_ORDER after them
+    :param ignore_negated: skip NOT operators and everything under them
+    :return: generator of :class:TreeNode 's
+    """
+    if order not in (PRE_ORDER, POST_ORDER):
+        raise TreeNodeError("Unknown walk order '%s'" % order)
+
+    pending = [(root, False)] if root is not None else []
+
+    while pending:
+        node, expanded = pending.pop()
+
+        if expanded or node.is_leaf:
+            yield node
+            continue
+
+        if ignore_negated and node.type == Not.type:
+            continue
+
+        if order == PRE_ORDER:
+            yield node
+        else:
+            pending.append((node, True))
+
+        pending.extend((child, False) for child in reversed(node.children))
+
+
+def iter_tree_leaves(root, ignore_negated=False):
+    """
+    Lazily yields the leaves of the tree under :root from left to right, with an explicit stack
+
+    :param ignore_negated: skip the leaves under NOT operators
+    """
+    pending = [root] if root is not None else []
+
+    while pending:
+        node = pending.pop()
+
+        if node.is_leaf:
+            yield node
+
+        elif not (ignore_negated and node.type == Not.type):
+            pending.extend(reversed(node.children))
+
+
+def find_node(root, predicate, order=PRE_ORDER, ignore_negated=False):
+    """
+    First node of the tree under :root, in :order, for which :predicate returns True. The walk stops there.
+
+    :return: :class:TreeNode or None if there is none
+    """
+    for node in walk_tree(root, order, ignore_negated):
+        if predicate(node):
+            return node
+
+    return None
+
+
 class TreeNode(dict):
 
+    _frozen = False
+
     def __init__(self, *args, **kwargs):
         super(TreeNode, self).__init__(*args, **kwargs)
 
+    @property
+    def is_frozen(self):
+        return self._frozen
+
+    def freeze(self):
+        """
+        Makes the node and all its descendants immutable, so they can be safely shared between queries
+        (see :func:freeze_tree)
+
+        :return itself
+        """
+        return freeze_tree(self)
+
+    def flatten(self):
+        """
+        N-ary version of the tree (see :func:flatten_tree)
+        """
+        return flatten_tree(self)
+
+    def binarize(self):
+        """
+        Binary version of the tree (see :func:binarize_tree)
+        """
+        return binarize_tree(self)
+
+    def balance(self):
+        """
+        Balanced binary version of the tree (see :func:balance_tree)
+        """
+        return balance_tree(self)
+
+    def _freeze_node(self):
+        object.__setattr__(self, '_frozen', True)
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise FrozenNodeError("Frozen tree nodes can't be modified, make a copy of the node instead")
+
+    def __setattr__(self, name, val):
+        self._check_mutable()
+        super(TreeNode, self).__setattr__(name, val)
+
+    def __setitem__(self, key, val):
+        self._check_mutable()
+        super(TreeNode, self).__setitem__(key, val)
+
+    def __delitem__(self, key):
+        self._check_mutable()
+        super(TreeNode, self).__delitem__(key)
+
+    def clear(self):
+        self._check_mutable()
+        super(TreeNode, self).clear()
+
+    def pop(self, *args):
+        self._check_mutable()
+        return super(TreeNode, self).pop(*args)
+
+    def popitem(self):
+        self._check_mutable()
+        return super(TreeNode, self).popitem()
+
+    def setdefault(self, *args):
+        self._check_mutable()
+        return super(TreeNode, self).setdefault(*args)
+
+    def update(self, *args, **kwargs):
+        self._check_mutable()
+        super(TreeNode, self).update(*args, **kwargs)
+
     @property
     def is_leaf(self):
         raise NotImplementedError()
@@ -36,6 +235,199 @@ class TreeNode(dict):
         """
         raise NotImplementedError()
 
+    def walk(self, order=PRE_ORDER, ignore_negated=False):
+        """
+        Lazily walks the nodes of the tree (see :func:walk_tree)
+
+        :return generator of TreeNodes
+        """
+        return walk_tree(self, order, ignore_negated)
+
+    def iter_leaves(self, ignore_negated=False):
+        """
+        Lazily yields the leaves of the tree, same as :meth:leaves but without building the list
+
+        :return generator of leaves
+        """
+        return iter_tree_leaves(self, ignore_negated)
+
+    def find(self, predicate, order=PRE_ORDER, ignore_negated=False):
+        """
+        First node of the tree :predicate returns True for, visiting only the nodes up to it
+
+        :return a TreeNode or None
+        """
+        return find_node(self, predicate, order, ignore_negated)
+
+
+def pack_trees(roots):
+    """
+    Flattens the trees under :roots into a post-order list of nodes, without recursion. Each node is a tuple of its
+    class and either its items as a plain dict (operands) or its children positions (operators). Nodes shared between
+    the trees (or inside one) are stored once.
+
+    :param roots: list of root :class:TreeNode 's, None roots are allowed
+    :return: tuple (nodes, roots positions, positions of the nodes that are not frozen)
+    """
+    positions = {}
+    nodes = []
+    unfrozen = []
+
+    for root in roots:
+        pending = [(root, False)] if root is not None else []
+
+        while pending:
+            node, expanded = pending.pop()
+
+            if id(node) in positions:
+                continue
+
+            if not node.is_leaf and not expanded:
+                pending.append((node, True))
+                pending.extend((child, False) for child in reversed(node.children))
+                continue
+
+            positions[id(node)] = len(nodes)
+            nodes.append((node.__class__,
+                          dict(node) if node.is_leaf else tuple(positions[id(c)] for c in node.children)))
+
+            if not node._frozen:
+                unfrozen.append(positions[id(node)])
+
+    return nodes, [positions[id(root)] if root is not None else None for root in roots], unfrozen
+
+
+def unpack_trees(nodes, roots, unfrozen=()):
+    """
+    Rebuilds the trees flattened by :func:pack_trees
+
+    :return: list of root :class:TreeNode 's
+    """
+    built = []
+
+    for cls, payload in nodes:
+        built.append(cls(payload) if isinstance(payload, dict) else cls([built[i] for i in payload]))
+
+    unfrozen = set(unfrozen)
+    for position, node in enumerate(built):
+        if position not in unfrozen:
+            node._freeze_node()
+
+    return [built[i] if i is not None else None for i in roots]
+
+
+def _unpack_tree(nodes, unfrozen):
+    return unpack_trees(nodes, [len(nodes) - 1], unfrozen)[0]
+
+
+def transform_tree(root, operator_callback, children=lambda node: node.children):
+    """
+    Rebuilds the tree under :root bottom up, without recursion. Leaves are kept as they are and each operator is
+    replaced by what :operator_callback returns for it, given the operator and its already transformed children.
+
+    :param children: function returning the nodes to take as the children of an operator
+    :return: new root, None if :root is None
+    """
+    if root is None:
+        return None
+
+    pending = [(root, None)]  # node and, once its children are pending, their amount
+    done = []
+
+    while pending:
+        node, amount = pending.pop()
+
+        if node.is_leaf:
+            done.append(node)
+
+        elif amount is None:
+            node_children = children(node)
+            pending.append((node, len(node_children)))
+            pending.extend((child, None) for child in reversed(node_children))
+
+        else:
+            first = len(done) - amount
+            transformed = done[first:]
+            del done[first:]
+            done.append(operator_callback(node, transformed))
+
+    return done[0]
+
+
+def _same_or_new(node, children):
+    # untouched subtrees are shared with the original tree
+    if len(children) == len(node.children) and all(new is old for new, old in zip(children, node.children)):
+        return node
+
+    return node.__class__(children)
+
+
+def _chain_operands(node):
+    # inputs of the whole chain of nested operators of the same associative type starting at :node, in order
+    if node.type not in ASSOCIATIVE_TYPES:
+        return node.children
+
+    operands = []
+    pending = list(reversed(node.children))
+
+    while pending:
+        child = pending.pop()
+
+        if not child.is_leaf and child.type == node.type:
+            pending.extend(reversed(child.children))
+        else:
+            operands.append(child)
+
+    return operands
+
+
+def flatten_tree(root):
+    """
+    Merges the chains of nested operators of the same associative type (AND, OR) into single n-ary operators, so
+    'a or b or c' becomes one OR node with three inputs instead of two nested ones. The result isn't deeper than the
+    longest chain of different operators, whatever the amount of terms.
+
+    :return: new root, sharing the subtrees that didn't change with :root
+    """
+    return transform_tree(root, _same_or_new, _chain_operands)
+
+
+def binarize_tree(root):
+    """
+    Splits the n-ary operators back into nested binary ones, left leaning like the parser builds them
+    ('a or b or c' is '(a or b) or c'), for code that expects two inputs per operator.
+
+    :return: new root, sharing the subtrees that didn't change with :root
+    """
+    def _binarize(node, children):
+        if len(children) <= 2:
+            return _same_or_new(node, children)
+
+        binary = node.__class__(children[:2])
+        for child in children[2:]:
+            binary = node.__class__([binary, child])
+
+        return binary
+
+    return transform_tree(root, _binarize)
+
+
+def balance_tree(root):
+    """
+    Rebuilds every chain of operators of the same associative type (nested or n-ary) as a balanced binary tree, so
+    a chain of n terms is log2(n) levels deep instead of n. Terms keep their left to right order.
+
+    :return: new root, sharing the subtrees that didn't change with :root
+    """
+    def _balance(node, children):
+        while len(children) > 2:
+            children = [node.__class__(children[i:i + 2]) if i + 1 < len(children) else children[i]
+                        for i in range(0, len(children), 2)]
+
+        return _same_or_new(node, children)
+
+    return transform_tree(root, _balance, _chain_operands)
+
 
 class Operand(TreeNode):
 
@@ -62,6 +454,25 @@ class Operand(TreeNode):
     def leaves(self, *args, **kwargs):
         return [self]
 
+    def _freeze_node(self):
+        # list values are shared along with the node, so they get frozen as well
+        for key, value in list(self.items()):
+            if isinstance(value, list):
+                dict.__setitem__(self, key, freeze_value(value))
+
+        super(Operand, self)._freeze_node()
+
+    # Copies are never frozen, copying is the way to get a modifiable version of a frozen node
+
+    def __copy__(self):
+        return self.__class__((key, list(value) if isinstance(value, list) else value) for key, value in self.items())
+
+    def __deepcopy__(self, memo):
+        return self.__class__(deepcopy(dict(self), memo))
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),), {'_frozen': True} if self._frozen else None)
+
 
 class OperatorFactoryError(Exception):
     pass
@@ -70,23 +481,25 @@ class OperatorFactoryError(Exception):
 class OperatorFactory(object):
 
     @staticmethod
-    def create(op_type):
+    def create(op_type, operands=None):
         if op_type.lower() == Or.type:
-            return Or()
+            return Or(operands)
         elif op_type.lower() == And.type:
-            return And()
+            return And(operands)
         elif op_type.lower() == Not.type:
-            return Not()
+            return Not(operands)
         else:
             raise OperatorFactoryError("Cannot create an operator of type '%s'" % op_type)
 
 
-class Operator(TreeNode):
-    type = "base_operator"
+class OperatorNode(object):
+    """
+    Operator behaviour, shared by the dict based operators and the slotted ones of :mod:plyse.compact_tree. Subclasses
+    keep their inputs in :_operands and provide the freezing primitives of :class:TreeNode
+    """
+    __slots__ = ()
 
-    def __init__(self, operands=None, *args, **kwargs):
-        super(Operator, self).__init__(*args, **kwargs)
-        self._operands = [] if not operands else operands
+    type = "base_operator"
 
     def has_left_operand(self):
         raise Exception("Not implemented!")
@@ -94,10 +507,28 @@ class Operator(TreeNode):
     def has_right_operand(self):
         raise Exception("Not implemented!")
 
+    def _freeze_node(self):
+        self._operands = tuple(self._operands)
+        super(OperatorNode, self)._freeze_node()
+
+    def __copy__(self):
+        return self.__class__(list(self._operands))
+
+    def __deepcopy__(self, memo):
+        return self.__class__([deepcopy(operand, memo) for operand in self._operands])
+
+    def __reduce__(self):
+        # pickled flat (see pack_trees), so there is no limit on how deep the tree can be
+        nodes, _, unfrozen = pack_trees([self])
+        return _unpack_tree, (nodes, unfrozen)
+
     def add_input(self, operand):
+        self._check_mutable()
+
         # An operator can have only two inputs (binary tree). If another gets added then it creates a new operator
         # of the same type with inputs as the last element and the one wanted to be added. The result is a left input
-        # operand and a right input operator, with the last element and the new one as inputs
+        # operand and a right input operator, with the last element and the new one as inputs. N-ary operators (see
+        # :func:flatten_tree) just get one more input
         if len(self._operands) == 2:
             op = self.__class__([self._operands.pop(1), operand])
             self._operands.append(op)
@@ -119,26 +550,14 @@ class Operator(TreeNode):
         return self._operands
 
     def leaves(self, ignore_negated=False, *args, **kwargs):
-        leaves = []
-        self.traverse(ignore_negated=ignore_negated, leaf_callback=lambda leaf: leaves.append(leaf))
-        return leaves
+        return list(iter_tree_leaves(self, ignore_negated))
 
     def traverse(self, node_callback=lambda node: node, leaf_callback=lambda leaf: leaf, ignore_negated=False):
-        def _do_traverse(operand):
-            if operand.is_leaf:
-                leaf_callback(operand)
-
-            elif isinstance(operand, Not) and ignore_negated:
-                pass
-
+        for node in walk_tree(self, PRE_ORDER, ignore_negated):
+            if node.is_leaf:
+                leaf_callback(node)
             else:
-                node_callback(operand)
-                _do_traverse(operand.inputs[0])
-
-                if len(operand.inputs) > 1:
-                    _do_traverse(operand.inputs[1])
-
-        return _do_traverse(self)
+                node_callback(node)
 
     def __str__(self):
         return "[TreeNode] '{op}' operator with {children} children ".format(op=self.type.upper(), children=len(self.children))
@@ -147,6 +566,13 @@ class Operator(TreeNode):
         return self.__str__()
 
 
+class Operator(OperatorNode, TreeNode):
+
+    def __init__(self, operands=None, *args, **kwargs):
+        super(Operator, self).__init__(*args, **kwargs)
+        self._operands = [] if not operands else operands
+
+
 class And(Operator):
     type = "and"
 
@@ -167,6 +593,10 @@ class Or(Operator):
         return True
 
 
+# operators whose nested chains can be merged into a single n-ary operator
+ASSOCIATIVE_TYPES = (And.type, Or.type)
+
+
 class NotOperatorError(Exception):
     pass
 
@@ -181,6 +611,8 @@ class Not(Operator):
         return True
 
     def add_input(self, operand):
+        self._check_mutable()
+
         if not self._operands:
             self._operands.append(operand)
         else:
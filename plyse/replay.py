@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Replays a log of query strings through a parser, measuring how long each one takes and which ones fail. Used by the
+command line tool (python -m plyse), see :func:replay and :class:ReplayStats.
+"""
+import heapq
+import json
+import math
+from array import array
+from collections import namedtuple, Counter
+from timeit import default_timer
+
+from .grammar import GrammarFactory
+from .parser import QueryParser
+from .util import map_chunks
+
+
+class ReplayError(Exception):
+    pass
+
+
+# outcome of a query of the log: its line number, the query string, its terms (list of dicts) or the error message
+# (type: message) if it couldn't be parsed and the parse time in seconds
+ReplayResult = namedtuple('ReplayResult', ['line', 'query', 'terms', 'error', 'latency'])
+
+ReplayReport = namedtuple('ReplayReport', ['queries', 'failures', 'errors', 'elapsed', 'throughput', 'p50', 'p95',
+                                           'p99', 'max', 'slowest'])
+
+
+def load_conf(path):
+    """
+    Grammar configuration out of a YAML (needs pyyaml) or JSON file, like plyse/plyse_config.yaml. The configuration
+    can be the whole file or its 'grammar' key
+    """
+    with open(path) as conf_file:
+        if path.endswith('.json'):
+            conf = json.load(conf_file)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ReplayError("Reading YAML configurations needs pyyaml, use a JSON one or pip install pyyaml")
+
+            conf = yaml.safe_load(conf_file)
+
+    if not isinstance(conf, dict):
+        raise ReplayError("'%s' is not a grammar configuration" % path)
+
+    return conf.get('grammar', conf)
+
+
+def build_parser(conf=None, cache_size=0):
+    """
+    :param conf: grammar configuration for :meth:GrammarFactory.build_from_conf, None for the default grammar
+    :param cache_size: parse cache size, see :class:QueryParser
+    """
+    grammar = GrammarFactory.build_from_conf(conf) if conf is not None else GrammarFactory.build_default()
+    return QueryParser(grammar, cache_size=cache_size)
+
+
+def read_log(lines):
+    """
+    Numbered query strings of a query log, one per line. Blank lines are skipped but still counted
+
+    :return: generator of (line number, query string)
+    """
+    for number, line in enumerate(lines, 1):
+        query_string = line.rstrip('\r\n')
+
+        if query_string.strip():
+            yield number, query_string
+
+
+def replay(log, conf=None, workers=1, chunksize=100, cache_size=0, fail_if_syntax_mismatch=False):
+    """
+    Parses every query of :log, yielding the results in the same order. The log is consumed lazily in chunks.
+
+    :param log: iterable of (line number, query string), see :func:read_log
+    :param conf: grammar configuration, None for the default grammar
+    :param workers: amount of processes to parse the chunks in. Each one builds its own parser out of :conf
+    :param chunksize: amount of queries per chunk
+    :param cache_size: parse cache size of the parsers, 0 parses every query even if it was already seen
+    :return: generator of :class:ReplayResult
+    """
+    return map_chunks(_replay_chunk, log, chunksize, workers, _replay_setup,
+                      (conf, cache_size, fail_if_syntax_mismatch))
+
+
+class ReplayStats(object):
+    """
+    Aggregates the results of a replay: amount of queries and failures, failures per error type, latency percentiles
+    and the slowest queries. Latencies are kept in a compact array of doubles, 8 bytes per query.
+    """
+
+    def __init__(self, slowest=10):
+        """
+        :param slowest: amount of slowest queries to keep
+        """
+        self._latencies = array('d')
+        self._errors = Counter()
+        self._slowest = []
+        self._slowest_size = slowest
+        self._start = default_timer()
+        self._end = None
+
+    def add(self, result):
+        self._latencies.append(result.latency)
+
+        if result.error is not None:
+            self._errors[result.error.split(':', 1)[0]] += 1
+
+        entry = (result.latency, result.line, result.query)
+
+        if len(self._slowest) < self._slowest_size:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest and entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def finish(self):
+        """
+        Stops the clock the throughput is measured with, the report of an unfinished replay uses the current time
+        """
+        self._end = default_timer()
+
+    def report(self):
+        """
+        :return: :class:ReplayReport, latencies in seconds. Slowest queries are (latency, line, query) tuples
+        """
+        elapsed = (self._end or default_timer()) - self._start
+        latencies = sorted(self._latencies)
+        queries = len(latencies)
+
+        return ReplayReport(
+            queries=queries,
+            failures=sum(self._errors.values()),
+            errors=dict(self._errors),
+            elapsed=elapsed,
+            throughput=queries / elapsed if elapsed > 0 else 0.0,
+            p50=percentile(latencies, 50),
+            p95=percentile(latencies, 95),
+            p99=percentile(latencies, 99),
+            max=latencies[-1] if latencies else 0.0,
+            slowest=sorted(self._slowest, reverse=True),
+        )
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile
+
+    :param values: sorted values
+    :param p: percentile, from 0 to 100
+    """
+    if not values:
+        return 0.0
+
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def format_report(report):
+    """
+    Human readable version of a :class:ReplayReport
+    """
+    errors = ", ".join("%s: %d" % item for item in sorted(report.errors.items()))
+    lines = [
+        "queries     %d" % report.queries,
+        "failures    %d%s" % (report.failures, " (%s)" % errors if errors else ""),
+        "elapsed     %.3f s" % report.elapsed,
+        "throughput  %.1f queries/s" % report.throughput,
+        "latency     p50 %.3f ms  p95 %.3f ms  p99 %.3f ms  max %.3f ms" % (
+            report.p50 * 1000, report.p95 * 1000, report.p99 * 1000, report.max * 1000),
+    ]
+
+    if report.slowest:
+        lines.append("slowest")
+        lines.extend("  %9.3f ms  line %-6d %s" % (latency * 1000, line, query)
+                     for latency, line, query in report.slowest)
+
+    return "\n".join(lines)
+
+
+def result_as_json(result):
+    """
+    JSON line for a :class:ReplayResult, without the latency so outputs of different runs can be diffed
+    """
+    return json.dumps({'line': result.line, 'query': result.query, 'terms': result.terms, 'error': result.error},
+                      sort_keys=True, default=str)
+
+
+def _replay_setup(conf, cache_size, fail_if_syntax_mismatch):
+    return build_parser(conf, cache_size), fail_if_syntax_mismatch
+
+
+def _replay_chunk(state, chunk):
+    parser, fail_if_syntax_mismatch = state
+    results = []
+
+    for line, query_string in chunk:
+        start = default_timer()
+
+        try:
+            query = parser.parse(query_string, fail_if_syntax_mismatch)
+            latency = default_timer() - start
+            terms, error = [dict(term) for term in query.iter_terms()], None
+        except Exception as e:
+            latency = default_timer() - start
+            terms, error = None, "%s: %s" % (type(e).__name__, e)
+
+        results.append(ReplayResult(line, query_string, terms, error, latency))
+
+    return results
+
@@ -0,0 +1,244 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Compiles query trees into parameterized SQL WHERE clauses (see :class:SQLCompiler and
+:meth:plyse.query.Query.to_sql).
+"""
+import re
+
+from .query_tree import And, Not, ASSOCIATIVE_TYPES, POST_ORDER, walk_tree
+from .term_parser import Term
+from .util import LRUCache
+
+
+class SQLCompilerError(Exception):
+    pass
+
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+# identifier quote characters: standard SQL (also PostgreSQL, SQLite, Oracle) and MySQL's
+_QUOTES = ('"', '`')
+
+# DB-API 2.0 parameter styles, out of the position and name of each parameter
+_PLACEHOLDERS = {
+    'qmark': lambda position, name: '?',
+    'format': lambda position, name: '%s',
+    'numeric': lambda position, name: ':%d' % (position + 1),
+    'named': lambda position, name: ':%s' % name,
+    'pyformat': lambda position, name: '%%(%s)s' % name,
+}
+
+_COMPARISONS = {
+    Term.GREATER_THAN: '>',
+    Term.GREATER_EQUAL_THAN: '>=',
+    Term.LOWER_THAN: '<',
+    Term.LOWER_EQUAL_THAN: '<=',
+}
+
+
+# escape character of the LIKE patterns, unlike the backslash it needs no escaping in any SQL dialect string literals
+LIKE_ESCAPE = '!'
+
+
+def like_pattern(value):
+    """
+    LIKE pattern matching the values that contain :value, where '*' is a wildcard. LIKE wildcards and the escape
+    character in :value are escaped with :LIKE_ESCAPE
+    """
+    escaped = value.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+
+    for wildcard in '%_':
+        escaped = escaped.replace(wildcard, LIKE_ESCAPE + wildcard)
+
+    return '%' + escaped.replace('*', '%') + '%'
+
+
+class SQLCompiler(object):
+    """
+    Turns query trees into a SQL boolean expression with placeholders, to be used as WHERE clause, and the values to
+    bind to them. Terms become predicates on the column of their field according to their value type:
+
+      - partial strings: column LIKE '%value%' ESCAPE '!', '*' is a wildcard (see :func:like_pattern)
+      - ints, quoted strings and keyword values: column = value
+      - ranges: column BETWEEN low AND high
+      - comparisons: column > value, >=, < and <=
+      - value sets (see :class:plyse.normalizer.Normalizer): column IN (value, ...)
+      - terms with several default fields check each of their columns, joined with OR, and with none '1 = 0'
+
+    Field names come from the user, so they have to be plain SQL identifiers (optionally table.column) unless
+    :columns maps them to a column. They get quoted, so fields named like reserved words (order, group) are still
+    columns. Values are never part of the SQL.
+
+    The SQL only depends on the shape of the query (its operators and the fields, value types and amount of values of
+    its terms), so it's kept in an LRU cache keyed by that shape: a query with a known shape only gets its values
+    collected, and the database gets the same statement over and over, which keeps its prepared statements cache hot.
+    """
+
+    def __init__(self, columns=None, default_columns=None, paramstyle='qmark', like_operator='LIKE', cache_size=256,
+                 quote='"'):
+        """
+        :param columns: field -> column, nested fields (address:zip) as tuples. Columns are used as given
+        :param default_columns: columns to check for terms with no field, instead of the default fields of the terms.
+                                Used as given
+        :param paramstyle: placeholders style, one of the DB-API 2.0 ones: qmark, format, numeric, named or pyformat.
+                           Named styles bind a dict of parameters (p0, p1...), the other ones a list
+        :param like_operator: operator for partial strings, ej: ILIKE for case insensitive matching in PostgreSQL
+        :param cache_size: max amount of SQL templates to keep, 0 disables the cache and None leaves it unbounded
+        :param quote: identifier quote character of the database, '"' (standard SQL) or '`' (MySQL). None leaves the
+                      field names unquoted
+        """
+        if paramstyle not in _PLACEHOLDERS:
+            raise SQLCompilerError("Unknown paramstyle '%s', use one of %s" % (paramstyle, sorted(_PLACEHOLDERS)))
+
+        if quote is not None and quote not in _QUOTES:
+            raise SQLCompilerError("Unknown identifier quote '%s', use one of %s or None" % (quote, list(_QUOTES)))
+
+        self._columns = columns or {}
+        self._default_columns = list(default_columns) if default_columns else None
+        self._paramstyle = paramstyle
+        self._placeholder = _PLACEHOLDERS[paramstyle]
+        self._like_operator = like_operator
+        self._quote = quote
+        self._templates = LRUCache(cache_size)
+
+    def compile(self, root):
+        """
+        :param root: root :class:TreeNode of the query tree
+        :return: tuple (sql, parameters). An empty query (None root) is '1 = 1', true for every row
+        """
+        if root is None:
+            return '1 = 1', {} if self._paramstyle in ('named', 'pyformat') else []
+
+        shape, values = [], []
+
+        # post order lists every node after its children, which is enough to rebuild the tree out of the shape
+        for node in walk_tree(root, POST_ORDER):
+            if node.is_leaf:
+                columns = self._term_columns(node)
+                val, val_type = node.get(Term.VAL), node.get(Term.VAL_TYPE)
+                term_values = self._values(val, val_type)
+
+                shape.append((tuple(columns), val_type, len(term_values)))
+                values.extend(term_values * len(columns))
+            else:
+                shape.append((node.type, len(node.children)))
+
+        shape = tuple(shape)
+        template = self._templates.get(shape)
+
+        if template is None:
+            template = self._template(shape)
+            self._templates.set(shape, template)
+
+        if self._paramstyle in ('named', 'pyformat'):
+            return template, {'p%d' % i: value for i, value in enumerate(values)}
+
+        return template, values
+
+    def cache_info(self):
+        """
+        SQL templates cache statistics, see :meth:plyse.util.LRUCache.info
+        """
+        return self._templates.info()
+
+    def cache_clear(self):
+        self._templates.clear()
+
+    def _term_columns(self, term):
+        field = term.get(Term.FIELD)
+
+        if term.get(Term.FIELD_TYPE) == Term.DEFAULT:
+            if self._default_columns:
+                return self._default_columns
+
+            fields = field if isinstance(field, list) else [field]
+        else:
+            fields = [tuple(field) if isinstance(field, list) else field]
+
+        return [self._column(f) for f in fields]
+
+    def _column(self, field):
+        if field in self._columns:
+            return self._columns[field]
+
+        column = '_'.join(field) if isinstance(field, tuple) else field
+
+        if not isinstance(column, str) or not _IDENTIFIER.match(column):
+            raise SQLCompilerError("'%s' is not a valid column name" % (column,))
+
+        if self._quote is None:
+            return column
+
+        # valid identifiers have no quote characters to escape
+        return '.'.join(self._quote + part + self._quote for part in column.split('.'))
+
+    @staticmethod
+    def _values(val, val_type):
+        if val_type == Term.PARTIAL_STRING:
+            return [like_pattern(val)]
+
+        if val_type in (Term.INT, Term.EXACT_STRING, Term.KEYWORD_VALUE) or val_type in _COMPARISONS:
+            return [val]
+
+        if val_type and val_type.endswith(Term.RANGE % ''):
+            return [val[0], val[1]]
+
+        if val_type and val_type.endswith(Term.SET % ''):
+            if not val:
+                raise SQLCompilerError("Value sets can't be empty")
+
+            return list(val)
+
+        raise SQLCompilerError("Don't know how to compile '%s' values" % val_type)
+
+    def _template(self, shape):
+        expressions = []
+        position = [0]
+
+        def _placeholder():
+            placeholder = self._placeholder(position[0], 'p%d' % position[0])
+            position[0] += 1
+            return placeholder
+
+        for item in shape:
+            if isinstance(item[0], tuple):
+                columns, val_type, amount = item
+                predicates = [self._predicate(column, val_type, amount, _placeholder) for column in columns]
+
+                if not predicates:
+                    # a term without columns (ej: no default fields) matches no row
+                    expressions.append("1 = 0")
+                else:
+                    expressions.append(predicates[0] if len(predicates) == 1 else "(%s)" % " OR ".join(predicates))
+
+            elif item[0] == Not.type:
+                expression = expressions.pop()
+                expressions.append("NOT %s" % (expression if expression.startswith('(') else "(%s)" % expression))
+
+            else:
+                operator_type, amount = item
+                inputs = expressions[-amount:]
+                del expressions[-amount:]
+                joined = (" AND " if operator_type == And.type else " OR ").join(inputs)
+                expressions.append("(%s)" % joined)
+
+        sql = expressions.pop()
+
+        # the parenthesis of the root operator aren't needed
+        return sql[1:-1] if shape[-1][0] in ASSOCIATIVE_TYPES else sql
+
+    def _predicate(self, column, val_type, amount, placeholder):
+        if val_type == Term.PARTIAL_STRING:
+            return "%s %s %s ESCAPE '%s'" % (column, self._like_operator, placeholder(), LIKE_ESCAPE)
+
+        if val_type in _COMPARISONS:
+            return "%s %s %s" % (column, _COMPARISONS[val_type], placeholder())
+
+        if val_type.endswith(Term.RANGE % ''):
+            return "%s BETWEEN %s AND %s" % (column, placeholder(), placeholder())
+
+        if val_type.endswith(Term.SET % ''):
+            return "%s IN (%s)" % (column, ", ".join(placeholder() for _ in range(amount)))
+
+        return "%s = %s" % (column, placeholder())
@@ -44,7 +44,7 @@ class TermParser(object):
         return {Term.VAL: value, Term.VAL_TYPE: value_type}
 
     def _build_term_with_default_fields(self, value_dict):
-        default_fields = self._default_fields[0] if len(self._default_fields) == 1 else self._default_fields
+        default_fields = self._default_fields[0] if len(self._default_fields) == 1 else list(self._default_fields)
         r = self._build_field_data(default_fields, Term.DEFAULT)
 
         r.update(value_dict)
@@ -149,8 +149,12 @@ class TermParser(object):
 
 class Term(dict):
 
+    # terms are plain dicts, no per instance attributes
+    __slots__ = ()
+
     # value types
     RANGE = "%s_range"
+    SET = "%s_set"
     INT = 'int'
     EXACT_STRING = 'exact_string'
     PARTIAL_STRING = 'partial_string'
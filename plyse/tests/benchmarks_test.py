@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO  # print writes bytes in py2
+except ImportError:
+    from io import StringIO
+
+# the benchmarks live next to the package in the source tree, they aren't installed with it
+try:
+    from benchmarks.suite import Result, compare, load_baseline, main, save_baseline
+except ImportError:
+    main = None
+
+
+@unittest.skipIf(main is None, "the benchmarks are only in the source tree")
+class BenchmarkSuiteTester(unittest.TestCase):
+
+    benchmark = 'grammar.parse/terms=1'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'baseline.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _main(self, baseline_best=None):
+        if baseline_best is not None:
+            save_baseline(self.path, {self.benchmark: Result(baseline_best, baseline_best, 1)})
+
+        # the report isn't part of the test output
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            return main(['--filter', '^%s$' % self.benchmark, '--repeat', '1', '--min-time', '0', '--compare',
+                         self.path])
+        finally:
+            sys.stdout = stdout
+
+    def test_threshold_boundary(self):
+        baseline = {'a': Result(4.0, 4.0, 1), 'b': Result(4.0, 4.0, 1), 'c': Result(4.0, 4.0, 1)}
+        results = {'a': Result(5.0, 5.0, 1), 'b': Result(5.000001, 5.0, 1), 'c': Result(3.0, 3.0, 1)}
+
+        rows = dict((row[0], row) for row in compare(baseline, results, threshold=0.25))
+        # exactly at the threshold is still ok, above it is a regression
+        self.assertEqual((4.0, 5.0, 0.25, 'ok'), rows['a'][1:])
+        self.assertEqual('REGRESSION', rows['b'][4])
+        self.assertEqual((4.0, 3.0, -0.25, 'ok'), rows['c'][1:])
+        self.assertEqual('faster', compare(baseline, results, threshold=0.2)[2][4])
+
+    def test_missing_and_new_benchmarks(self):
+        baseline = {'gone': Result(1.0, 1.0, 1), 'kept': Result(1.0, 1.0, 1)}
+        results = {'kept': Result(1.0, 1.0, 1), 'added': Result(2.0, 2.0, 1)}
+
+        rows = compare(baseline, results)
+        self.assertEqual(['kept', 'added'], [row[0] for row in rows])
+        self.assertEqual(('added', None, 2.0, None, 'new'), rows[1])
+
+    def test_baseline_round_trip(self):
+        results = {'a': Result(1.5, 2.0, 10)}
+        save_baseline(self.path, results)
+
+        self.assertEqual(results, load_baseline(self.path))
+
+        with open(self.path, 'w') as f:
+            json.dump({'version': 0, 'results': {}}, f)
+        self.assertRaises(ValueError, load_baseline, self.path)
+
+    def test_exit_status(self):
+        self.assertEqual(1, self._main(1e-12))
+        self.assertEqual(0, self._main(1e3))
+
+        # a benchmark the baseline doesn't have isn't a regression
+        save_baseline(self.path, {'other': Result(1e-12, 1e-12, 1)})
+        self.assertEqual(0, self._main())
+
+if __name__ == '__main__':
+    unittest.main()
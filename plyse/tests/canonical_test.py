@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import unittest
+from plyse.canonical import canonical, fingerprint, term_key, encode_value
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+from plyse.query_tree import Operand, And, Or
+from plyse.term_parser import TermParser
+
+
+class CanonicalTester(unittest.TestCase):
+
+    def setUp(self):
+        self.qp = QueryParser(GrammarFactory.build_default())
+
+    def assert_same(self, *query_strings):
+        queries = [self.qp.parse(q) for q in query_strings]
+
+        self.assertEqual(1, len(set(q.fingerprint() for q in queries)), query_strings)
+        self.assertEqual(1, len(set(self.qp.stringify(q.canonical()) for q in queries)), query_strings)
+
+    def assert_different(self, a, b):
+        self.assertNotEqual(self.qp.parse(a).fingerprint(), self.qp.parse(b).fingerprint())
+
+    def test_commutative_and_associative(self):
+        self.assert_same('b and a', 'a + b')
+        self.assert_same('a or (b or c)', '(c or a) or b', 'b c a')
+        self.assert_same('x:1 and -(y or z) and w', 'w and -(z or y) and x:1')
+        self.assert_same('(a and b) or (c and d)', '(d + c) or (b + a)')
+
+    def test_different_queries(self):
+        self.assert_different('a and b', 'a or b')
+        self.assert_different('a', '-a')
+        self.assert_different('a and (b or c)', '(a and b) or c')
+        self.assert_different('x:1', 'x:"1"')
+        self.assert_different('a and b', 'a and b and b')
+
+    def test_canonical_tree(self):
+        q = self.qp.parse('z:1 or (y and x) or a:2..3')
+        c = q.canonical()
+
+        self.assertEqual('z:1 or a:2..3 or (default:x and default:y)', self.qp.stringify(c))
+        self.assertEqual(q.fingerprint(), c.fingerprint())
+        self.assertEqual(q.raw_query, c.raw_query)
+        self.assertIs(c.query_as_tree, c.canonical().query_as_tree)
+
+    def test_aliases(self):
+        aliases = {'who': 'name'}
+        qp = QueryParser(GrammarFactory.build_default(TermParser(aliases=aliases)))
+
+        aliased = Or([Operand(field='who', field_type='attribute', val='a', val_type='partial_string'),
+                      Operand(field='age', field_type='attribute', val=1, val_type='int')])
+        parsed = qp.parse('age:1 or who:a')
+
+        self.assertEqual(parsed.fingerprint(), fingerprint(aliased, aliases))
+        self.assertNotEqual(parsed.fingerprint(), fingerprint(aliased))
+        self.assertEqual('name', canonical(aliased, aliases).children[1]['field'])
+        self.assertEqual('who', aliased.children[0]['field'])
+        self.assertEqual('name', canonical(Operand(field='who'), aliases)['field'])
+
+    def test_incremental(self):
+        q1, q2, q3 = self.qp.parse('a or b'), self.qp.parse('c'), self.qp.parse('d and e')
+
+        stacked = q1.stack(q2).stack(q3)
+        self.assertEqual(self.qp.parse('e and d and c and (b or a)').fingerprint(), stacked.fingerprint())
+        self.assertEqual(fingerprint(stacked.query_as_tree), stacked.fingerprint())
+
+        combined = q1.combine(q3)
+        self.assertEqual(self.qp.parse('a or b or (d and e)').fingerprint(), combined.fingerprint())
+        self.assertIn('digest', q1._derived)
+
+    def test_empty_and_long_trees(self):
+        self.assertEqual(fingerprint(None), fingerprint(None))
+        self.assertIs(None, canonical(None))
+
+        tree = Operand(val=0)
+        for i in range(1, 10000):
+            tree = And([Operand(val=i), tree])
+
+        flat = canonical(tree)
+        self.assertEqual(10000, len(flat.children))
+        self.assertEqual(set(range(10000)), set(leaf['val'] for leaf in flat.children))
+        self.assertEqual(fingerprint(tree), fingerprint(flat))
+
+    def test_stable_across_processes(self):
+        expected = '536776ca1ed5b2192ed5547d4ddddc26'
+        self.assertEqual(expected, self.qp.parse('name:a and age:3').fingerprint())
+
+        script = ("from plyse.grammar import GrammarFactory; from plyse.parser import QueryParser; "
+                  "print(QueryParser(GrammarFactory.build_default()).parse('age:3 + name:a').fingerprint())")
+        output = subprocess.check_output([sys.executable, '-c', script]).decode().strip()
+        self.assertEqual(expected, output)
+
+    def test_term_key(self):
+        # same key for the types a value may have in any python version
+        self.assertEqual(term_key({'val': u'x', 'n': 3}), term_key({b'val': b'x', 'n': 3}))
+        self.assertEqual('d2:s1:ni3;s3:vals1:x', term_key({'val': u'x', 'n': 3}))
+        self.assertEqual('l3:s1:ai1;n', encode_value(['a', 1, None]))
+
+        self.assertNotEqual(encode_value(1), encode_value('1'))
+        self.assertNotEqual(encode_value(True), encode_value(1))
+        self.assertNotEqual(encode_value(['ab', 'c']), encode_value(['a', 'bc']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from plyse.columnar import ColumnarEvaluator, ColumnarError
+from plyse.grammar import Grammar
+from plyse.query_tree import And, Or, Not
+from plyse.term_parser import Term
+from .fixtures import build_parser, term
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class ColumnarTester(unittest.TestCase):
+
+    def setUp(self):
+        self.qp = build_parser()
+        self.columns = {
+            'name': numpy.array(['Peter Pan', 'Mary', 'John', 'Paul']),
+            'age': numpy.array([30, 50, 45, 7]),
+            'status': numpy.array(['open', None, 'closed', 'open'], dtype=object),
+            'default': numpy.array(['hello world', 'bye', 'hello', 'hi']),
+            ('address', 'zip'): numpy.array(['AB1', 'CD2', 'AB3', 'EF4']),
+        }
+        self.evaluator = ColumnarEvaluator(self.columns)
+
+    def _rows(self, query):
+        tree = self.qp.parse(query).query_as_tree if isinstance(query, str) else query
+        return list(numpy.flatnonzero(self.evaluator.mask(tree)))
+
+    def test_value_types(self):
+        self.assertEqual([0, 3], self._rows('name:p'))
+        self.assertEqual([0], self._rows('name:"p*pan"'))
+        self.assertEqual([1], self._rows('name:"Mary"'))
+        self.assertEqual([1, 2], self._rows('age:40..50'))
+        self.assertEqual([2], self._rows('age:45'))
+        self.assertEqual([0, 3], self._rows('status:"open"'))
+        self.assertEqual([2], self._rows('status:clo'))
+
+        self.assertEqual([1, 2], self._rows('age:>30'))
+        self.assertEqual([0, 3], self._rows('age:<=30'))
+
+        self.assertEqual([0, 3], self._rows(term('age', [30, 7, 'x'], Term.SET % Term.INT)))
+        self.assertEqual([0, 2], self._rows(term(['address', 'zip'], 'ab', Term.PARTIAL_STRING)))
+
+        self.assertRaises(ColumnarError, self.evaluator.mask, term('age', 1, 'color'))
+
+    def test_mismatching_types(self):
+        self.assertEqual([], self._rows('name:3'))
+        self.assertEqual([], self._rows('age:"x"'))
+        self.assertEqual([], self._rows('name:1..5'))
+        self.assertEqual([], self._rows('age:3*'))
+        self.assertEqual([], self._rows('missing:1'))
+
+    def test_operators(self):
+        self.assertEqual([0, 2], self._rows('hello'))
+        self.assertEqual([1, 3], self._rows('-hello'))
+        self.assertEqual([0, 1, 2], self._rows('hello or age:50'))
+        self.assertEqual([2], self._rows('hello and -(name:peter or age:30)'))
+        self.assertEqual([0, 1, 2, 3], self._rows('--age:0..100'))
+
+        default_fields = build_parser(['name', 'default']).parse('h').query_as_tree
+        self.assertEqual([0, 2, 3], self._rows(default_fields))
+
+    def test_repeated_terms(self):
+        # the same term objects in several places of the tree, which parsing never gives
+        a, b = term('age', 30, Term.INT), term('name', 'mary', Term.PARTIAL_STRING)
+        tree = Or([And([a, Not([a])]), Or([Not([b]), And([a, term('age', 30, Term.INT)])]), b])
+
+        self.assertEqual([0, 1, 2, 3], self._rows(tree))
+        self.assertEqual([1, 2, 3], self._rows(And([Not([a]), Not([a])])))
+        self.assertEqual([1], self._rows(Or([And([b, b]), And([b, Not([a])])])))
+
+    def test_repeated_terms_in_place(self):
+        # every use of a repeated term reads the same mask, combining one of them can't overwrite it for the others
+        self.assertEqual([0, 1, 2, 3], self._rows('age:50 or not age:50'))
+        self.assertEqual([], self._rows('age:50 and not age:50'))
+        self.assertEqual([0, 2], self._rows('age:45 or (age:30 and -age:45)'))
+        self.assertEqual([0, 1, 2, 3], self._rows('name:"Mary" or -name:"Mary"'))
+        self.assertEqual([1, 3], self._rows('-(hello and (hello or age:50)) and (-hello or age:45)'))
+
+    def test_matches_predicates(self):
+        rnd = random.Random(11)
+        terms = ['age:30', 'age:45', 'age:10..46', 'name:pa', 'status:"open"', 'hello']
+        records = [{field: (value.item() if hasattr(value, 'item') else value) for field, value in
+                    ((field, column[i]) for field, column in self.columns.items() if isinstance(field, str))}
+                   for i in range(self.evaluator.size)]
+
+        def _query(depth):
+            if depth == 0 or rnd.random() < 0.3:
+                return rnd.choice(terms)
+
+            operator = rnd.choice(['and', 'or', '-'])
+            if operator == '-':
+                return '-(%s)' % _query(depth - 1)
+
+            return '(%s)' % (' %s ' % operator).join(_query(depth - 1) for _ in range(rnd.randint(2, 3)))
+
+        # same trees as the default engine, in a fraction of the time
+        qp = build_parser(engine=Grammar.PRECEDENCE_CLIMBING)
+
+        for _ in range(300):
+            query = qp.parse(_query(4))
+            predicate = query.compile_predicate()
+
+            self.assertEqual([i for i, record in enumerate(records) if predicate(record)],
+                             self._rows(query.query_as_tree), query.raw_query)
+
+    def test_masks_are_not_shared(self):
+        first = self.evaluator.mask(self.qp.parse('age:30').query_as_tree)
+        second = self.evaluator.mask(self.qp.parse('age:50').query_as_tree)
+
+        self.assertEqual([0], list(numpy.flatnonzero(first)))
+        self.assertEqual([1], list(numpy.flatnonzero(second)))
+
+    def test_query_mask(self):
+        self.assertEqual([1], list(numpy.flatnonzero(self.qp.parse('name:mary').mask(self.columns))))
+        self.assertEqual([2], list(numpy.flatnonzero(self.qp.parse('age:45').mask(self.evaluator))))
+        self.assertTrue(self.evaluator.mask(None).all())
+
+    def test_columns_of_different_length(self):
+        self.assertRaises(ColumnarError, ColumnarEvaluator, {'a': numpy.arange(3), 'b': numpy.arange(4)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import pickle
+import unittest
+from copy import copy, deepcopy
+from plyse.compact_tree import CompactOperand, CompactAnd, CompactOr, CompactNot, CompactOperatorFactory
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+from plyse.query_tree import Operand, And, Or, Not, NotOperatorError, FrozenNodeError
+
+
+class CompactTreeTester(unittest.TestCase):
+
+    def setUp(self):
+        self.o1 = {'field': 'dummy', 'field_type': 'attribute', 'val': 'test', 'val_type': 'partial_string'}
+        self.o2 = {'field': 'other', 'field_type': 'attribute', 'val': 5, 'val_type': 'int'}
+
+    def test_operand_is_a_dict_view(self):
+        o = CompactOperand(self.o1)
+
+        self.assertTrue(o.is_leaf)
+        self.assertEqual([], o.children)
+        self.assertEqual([o], o.leaves())
+        self.assertEqual(self.o1, o)
+        self.assertEqual(self.o1, dict(o))
+        self.assertEqual(Operand(self.o1), o)
+        self.assertEqual(o, Operand(self.o1))
+        self.assertEqual(sorted(self.o1), sorted(o.keys()))
+        self.assertEqual('dummy', o.field)
+        self.assertEqual('test', o['val'])
+        self.assertEqual(None, o.get('missing'))
+        self.assertNotIn('missing', o)
+        self.assertFalse(hasattr(o, '__dict__'))
+
+    def test_operand_missing_and_extra_keys(self):
+        o = CompactOperand(field='a', val=1, boost=2)
+
+        self.assertEqual({'field': 'a', 'val': 1, 'boost': 2}, dict(o))
+        self.assertEqual(3, len(o))
+        self.assertEqual(2, o.boost)
+        self.assertRaises(KeyError, lambda: o['val_type'])
+        self.assertRaises(AttributeError, getattr, o, 'val_type')
+
+    def test_strings_are_interned(self):
+        field = ''.join(['dum', 'my'])
+        o1, o2 = CompactOperand(self.o1), CompactOperand(dict(self.o1, field=field))
+
+        self.assertIsNot(self.o1['field'], field)
+        self.assertIs(o1.field, o2.field)
+        self.assertIs(o1.val_type, o2.val_type)
+
+    def test_operand_is_frozen(self):
+        o = CompactOperand(self.o1)
+
+        self.assertTrue(o.is_frozen)
+        self.assertRaises(FrozenNodeError, o.__setitem__, 'val', 'other')
+        self.assertRaises(FrozenNodeError, setattr, o, 'val', 'other')
+
+        mutable = copy(o)
+        self.assertEqual(Operand, type(mutable))
+        mutable['val'] = 'other'
+        self.assertEqual('test', o.val)
+
+    def test_operand_list_values_are_immutable(self):
+        o = CompactOperand(dict(self.o1, field=['name', 'alias'], val=[1, 5], val_type='int_range', extra=[1]))
+
+        self.assertEqual([1, 5], o.val)
+        self.assertRaises(FrozenNodeError, o.val.append, 6)
+        self.assertRaises(FrozenNodeError, o.field.__setitem__, 0, 'other')
+        self.assertRaises(FrozenNodeError, o['extra'].pop)
+
+        mutable = copy(o)
+        mutable['val'].append(6)
+        self.assertEqual([1, 5], o.val)
+        self.assertEqual([1, 5, 6], mutable['val'])
+
+    def test_operator_nodes(self):
+        tree = CompactOperatorFactory.create('or', [CompactOperand(self.o1), CompactOperand(self.o2)])
+        tree.add_input(CompactNot([CompactOperand(self.o1)]))
+
+        self.assertEqual(CompactOr, type(tree))
+        self.assertEqual(CompactOr, type(tree.children[1]))
+        self.assertEqual([self.o1, self.o2, self.o1], tree.leaves())
+        self.assertEqual([self.o1, self.o2], tree.leaves(ignore_negated=True))
+        self.assertRaises(NotOperatorError, tree.children[1].children[1].add_input, CompactOperand(self.o2))
+        self.assertFalse(hasattr(tree, '__dict__'))
+
+        tree.freeze()
+        self.assertTrue(tree.is_frozen)
+        self.assertTrue(tree.children[1].is_frozen)
+        self.assertRaises(FrozenNodeError, tree.add_input, CompactOperand(self.o1))
+
+        tree_copy = deepcopy(tree)
+        self.assertFalse(tree_copy.is_frozen)
+        self.assertEqual(tree.leaves(), tree_copy.leaves())
+
+    def test_pickle(self):
+        tree = CompactAnd([CompactOperand(self.o1), CompactNot([CompactOperand(self.o2)])]).freeze()
+
+        loaded = pickle.loads(pickle.dumps(tree))
+        self.assertEqual(CompactAnd, type(loaded))
+        self.assertEqual(CompactNot, type(loaded.children[1]))
+        self.assertEqual(CompactOperand, type(loaded.children[0]))
+        self.assertTrue(loaded.is_frozen)
+        self.assertEqual(tree.leaves(), loaded.leaves())
+
+    def test_compact_parser(self):
+        grammar = GrammarFactory.build_default()
+        qp, compact_qp = QueryParser(grammar), QueryParser(grammar, compact=True)
+
+        for query in ['a:1 and (-b:"x y" or c:2..5) d', 'name:a', '-(a b)']:
+            q, compact_q = qp.parse(query), compact_qp.parse(query)
+
+            self.assertEqual(q.terms(), compact_q.terms())
+            self.assertEqual(qp.stringify(q), compact_qp.stringify(compact_q))
+
+        tree = compact_qp.parse('a + -b').query_as_tree
+        self.assertEqual((CompactAnd, CompactNot), (type(tree), type(tree.children[1])))
+        self.assertFalse(isinstance(tree, (And, Or, Not)))
+
+        stacked = compact_qp.parse('a').stack(compact_qp.parse('b'))
+        self.assertEqual(CompactAnd, type(stacked.query_as_tree))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from fnmatch import fnmatchcase
+from plyse.es_compiler import ESCompiler, ESCompilerError, wildcard_pattern
+from plyse.term_parser import Term
+from .fixtures import build_parser, term
+
+
+def _matches(query, document):
+    """
+    Evaluates the subset of the query DSL the compiler emits against a document, keyword fields only
+    """
+    (kind, body), = query.items()
+
+    if kind == 'match_all':
+        return True
+
+    if kind == 'match_none':
+        return False
+
+    if kind == 'bool':
+        return (all(_matches(q, document) for q in body.get('filter', [])) and
+                not any(_matches(q, document) for q in body.get('must_not', [])) and
+                ('should' not in body or sum(_matches(q, document) for q in body['should']) >=
+                 body['minimum_should_match']))
+
+    (field, condition), = body.items()
+    value = document.get(field)
+
+    if kind == 'term':
+        return value == condition
+
+    if kind == 'terms':
+        return value in condition
+
+    if kind == 'wildcard':
+        return isinstance(value, str) and fnmatchcase(value.lower(), condition['value'].lower())
+
+    bounds = {'gt': lambda b: value > b, 'gte': lambda b: value >= b, 'lt': lambda b: value < b,
+              'lte': lambda b: value <= b}
+
+    # like elasticsearch, one bound per side: of gt and gte (or lt and lte) the last one overrides the other
+    sides = {}
+    for op, bound in condition.items():
+        sides[op[:2]] = op, bound
+
+    return isinstance(value, int) and all(bounds[op](bound) for op, bound in sides.values())
+
+
+class ESCompilerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.qp = build_parser()
+        self.compiler = ESCompiler()
+
+    def _es(self, query, compiler=None):
+        tree = self.qp.parse(query).query_as_tree if isinstance(query, str) else query
+        return (compiler or self.compiler).compile(tree)
+
+    def test_value_types(self):
+        self.assertEqual({'bool': {'filter': [{'term': {'age': 30}}]}}, self._es('age:30'))
+        self.assertEqual({'bool': {'filter': [{'term': {'name': 'Mary'}}]}}, self._es('name:"Mary"'))
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'gte': 3, 'lte': 5}}}]}}, self._es('age:3..5'))
+        self.assertEqual({'bool': {'filter': [{'wildcard': {'name': {'value': '*p*n*', 'case_insensitive': True}}}]}},
+                         self._es('name:"p*n"'))
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'gt': 3}}}]}},
+                         self._es('age:>3'))
+        self.assertEqual({'bool': {'filter': [{'terms': {'status': ['a', 'b']}}]}},
+                         self._es(term('status', ['a', 'b'], Term.SET % Term.EXACT_STRING)))
+        self.assertEqual({'bool': {'filter': [{'term': {'address.zip': 'AB1'}}]}},
+                         self._es(term(['address', 'zip'], 'AB1', Term.EXACT_STRING)))
+
+        self.assertRaises(ESCompilerError, self._es, term('age', 1, 'color'))
+        self.assertEqual({'match_all': {}}, self.compiler.compile(None))
+
+    def test_wildcard_escaping(self):
+        self.assertEqual('*a\\?b\\\\c*d*', wildcard_pattern('a?b\\c*d'))
+
+        compiler = ESCompiler(case_insensitive=False)
+        self.assertEqual({'bool': {'filter': [{'wildcard': {'name': {'value': '*pet*'}}}]}}, self._es('name:pet',
+                                                                                                       compiler))
+
+    def test_and(self):
+        self.assertEqual({'bool': {'filter': [{'term': {'a': 1}}, {'term': {'b': 2}}, {'term': {'c': 3}}]}},
+                         self._es('a:1 and (b:2 and c:3)'))
+        self.assertEqual({'bool': {'filter': [{'term': {'a': 1}}], 'must_not': [{'terms': {'c': [3, 4]}}]}},
+                         self._es('a:1 and -c:3 and -c:4'))
+        self.assertEqual({'bool': {'must_not': [{'term': {'a': 1}}, {'term': {'b': 2}}]}}, self._es('-a:1 and -b:2'))
+
+        # comparisons on the same field are a single range, unless they bound the same side
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'gt': 3, 'lte': 9}}}]}},
+                         self._es('age:>3 and age:<=9'))
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'gte': 1, 'lte': 5}}},
+                                              {'range': {'age': {'gte': 3, 'lte': 9}}}]}},
+                         self._es('age:1..5 and age:3..9'))
+
+    def test_ranges_bounding_the_same_side(self):
+        lower = self.qp.parse('age:>5 and age:>=3').query_as_tree
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'gt': 5}}}, {'range': {'age': {'gte': 3}}}]}},
+                         self._es(lower))
+
+        in_range = self.qp.parse('age:1..10 and age:>7').query_as_tree
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'gte': 1, 'lte': 10}}},
+                                              {'range': {'age': {'gt': 7}}}]}}, self._es(in_range))
+
+        upper = self.qp.parse('age:<8 and age:<=9 and age:>2').query_as_tree
+        self.assertEqual({'bool': {'filter': [{'range': {'age': {'lt': 8, 'gt': 2}}},
+                                              {'range': {'age': {'lte': 9}}}]}}, self._es(upper))
+
+        for tree, matching in [(lower, range(6, 15)), (in_range, range(8, 11)), (upper, range(3, 8))]:
+            es_query = self._es(tree)
+            self.assertEqual(list(matching), [age for age in range(15) if _matches(es_query, {'age': age})])
+
+        # one bound per side, the last one wins
+        self.assertTrue(_matches({'range': {'age': {'gt': 5, 'gte': 3}}}, {'age': 4}))
+
+    def test_or(self):
+        self.assertEqual({'bool': {'filter': [{'bool': {'should': [{'terms': {'status': ['open', 'new']}},
+                                                                   {'term': {'age': 3}}],
+                                                        'minimum_should_match': 1}}]}},
+                         self._es('status:"open" or (age:3 or status:"new")'))
+        self.assertEqual({'bool': {'filter': [{'terms': {'a': [1, 2]}}]}}, self._es('a:1 or a:2 or a:1'))
+        self.assertEqual({'bool': {'filter': [{'bool': {'should': [{'term': {'a': 1}},
+                                                                   {'bool': {'must_not': [{'term': {'b': 2}}]}}],
+                                                        'minimum_should_match': 1}}]}},
+                         self._es('a:1 or -b:2'))
+
+    def test_not(self):
+        self.assertEqual({'bool': {'must_not': [{'term': {'a': 1}}]}}, self._es('-a:1'))
+        self.assertEqual({'bool': {'filter': [{'term': {'a': 1}}]}}, self._es('--a:1'))
+        self.assertEqual({'bool': {'must_not': [{'terms': {'a': [1, 2]}}, {'term': {'b': 3}}]}},
+                         self._es('-(a:1 or a:2 or b:3)'))
+        self.assertEqual({'bool': {'must_not': [{'bool': {'filter': [{'term': {'a': 1}}, {'term': {'b': 2}}]}}]}},
+                         self._es('-(a:1 and b:2)'))
+
+    def test_fields(self):
+        compiler = ESCompiler(fields={'status': 'status.keyword', ('address', 'zip'): 'zip'},
+                              default_fields=['name', 'title'])
+
+        self.assertEqual({'bool': {'filter': [{'term': {'status.keyword': 'open'}}]}},
+                         self._es('status:"open"', compiler))
+        self.assertEqual({'bool': {'filter': [{'term': {'zip': 'AB1'}}]}},
+                         self._es(term(['address', 'zip'], 'AB1', Term.EXACT_STRING), compiler))
+        self.assertEqual({'bool': {'filter': [{'bool': {'should': [{'term': {'name': 'x'}}, {'term': {'title': 'x'}},
+                                                                   {'term': {'a': 1}}],
+                                                        'minimum_should_match': 1}}]}},
+                         self._es('"x" or a:1', compiler))
+
+        default_fields = build_parser(['name', 'title']).parse('-"x"').query_as_tree
+        self.assertEqual({'bool': {'must_not': [{'term': {'name': 'x'}}, {'term': {'title': 'x'}}]}},
+                         self._es(default_fields))
+
+    def test_no_default_fields(self):
+        qp = build_parser([])
+
+        self.assertEqual({'bool': {'filter': [{'match_none': {}}]}}, self._es(qp.parse('bar').query_as_tree))
+        self.assertEqual({'bool': {'must_not': [{'match_none': {}}]}}, self._es(qp.parse('-bar').query_as_tree))
+
+        either = self._es(qp.parse('bar or name:"x"').query_as_tree)
+        self.assertEqual({'bool': {'filter': [{'bool': {'should': [{'match_none': {}}, {'term': {'name': 'x'}}],
+                                                        'minimum_should_match': 1}}]}}, either)
+        self.assertFalse(_matches(either, {'name': 'y', 'bar': 'bar'}))
+        self.assertTrue(_matches(either, {'name': 'x'}))
+
+    def test_matches_predicates(self):
+        rnd = random.Random(7)
+        documents = [{'name': rnd.choice(['peter pan', 'mary', 'john', 'peterson']), 'age': rnd.randint(0, 50),
+                      'status': rnd.choice(['open', 'closed', 'new']), 'default': rnd.choice(['hello world', 'bye'])}
+                     for _ in range(300)]
+
+        for query_string in ['name:pet and -age:10..40', '-(name:"mary" or status:"open") or hello',
+                             '(age:3..9 or -status:"new") and (-hello or name:john)', '-hello and -name:pet',
+                             'status:"open" or status:"new" or -(status:"closed" and age:1..20)',
+                             '--(age:1..10 and age:5..30) or (-status:"new" and -status:"open")']:
+            query = self.qp.parse(query_string)
+            predicate = query.compile_predicate()
+            es_query = query.to_es()
+
+            self.assertEqual([d for d in documents if predicate(d)], [d for d in documents if _matches(es_query, d)],
+                             query_string)
+
+    def test_results_are_not_shared(self):
+        query = self.qp.parse('a:1 or a:2')
+        query.to_es()['bool']['filter'].append('x')
+        self.assertEqual({'bool': {'filter': [{'terms': {'a': [1, 2]}}]}}, query.to_es())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Query trees shared by the tests of the query compilers and evaluators
+"""
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+from plyse.query_tree import Operand
+from plyse.term_parser import Term, TermParser
+from plyse.expressions.primitives import IntegerComparison
+
+
+def build_parser(default_fields=None, engine=None):
+    """
+    Parser of the default grammar that also takes integer comparisons (age:>30)
+
+    :param default_fields: default fields of the terms without field, ['default'] if not given
+    :param engine: operator engine, see :class:plyse.grammar.Grammar
+    """
+    term_parser = TermParser(default_fields=default_fields if default_fields is not None else ['default'])
+    grammar = GrammarFactory.build_default(term_parser, engine=engine)
+    grammar.add_value_type(IntegerComparison(term_parser.integer_comparison_parse))
+
+    return QueryParser(grammar)
+
+
+def term(field, val, val_type, field_type=Term.ATTRIBUTE):
+    """
+    Term no query string parses into: value sets (see :class:plyse.normalizer.Normalizer), nested fields and unknown
+    value types
+    """
+    return Operand(field=field, field_type=field_type, val=val, val_type=val_type)
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import pickle
+import unittest
+from plyse.compact_tree import CompactAnd, CompactOperand
+from plyse.flat_tree import FlatTree, FlatTreeError, LEAF, AND, OR, NOT
+from plyse.grammar import GrammarFactory
+from plyse.parser import QueryParser
+from plyse.query import Query
+from plyse.query_tree import Operand, And, Or, Not
+
+
+class FlatTreeTester(unittest.TestCase):
+
+    queries = ['a', '-a', 'a:1 and (-b:"x y" or c:2..5) d', '-(a b) and -(c or -d) e', '(a or -b) and c']
+
+    def setUp(self):
+        self.qp = QueryParser(GrammarFactory.build_default())
+
+    def test_post_order_arrays(self):
+        a, b, c = [Operand(field='f', val=v) for v in 'abc']
+        flat = FlatTree.from_tree(Or([a, And([b, Not([c])])]))
+
+        self.assertEqual([LEAF, LEAF, LEAF, NOT, AND, OR], list(flat.kinds))
+        self.assertEqual(5, flat.root)
+        self.assertEqual([0, 4], list(flat.children(5)))
+        self.assertEqual([1, 3], list(flat.children(4)))
+        self.assertEqual([2], list(flat.children(3)))
+        self.assertEqual([], list(flat.children(0)))
+        self.assertEqual(('or', None), (flat.type(5), flat.type(0)))
+        self.assertEqual(c, flat.term(2))
+        self.assertEqual(None, flat.term(3))
+        self.assertTrue(flat.is_leaf(1))
+        self.assertTrue(all(t.is_frozen for t in flat.terms))
+        self.assertFalse(a.is_frozen)
+
+    def test_same_as_tree(self):
+        for query in self.queries:
+            q = self.qp.parse(query)
+            tree, flat = q.query_as_tree, q.flat_tree
+
+            self.assertEqual(tree.leaves(), flat.leaves())
+            self.assertEqual(tree.leaves(ignore_negated=True), flat.leaves(ignore_negated=True))
+
+            tree_nodes, flat_nodes = [], []
+            if not tree.is_leaf:
+                tree.traverse(node_callback=lambda n: tree_nodes.append(n.type), leaf_callback=tree_nodes.append,
+                              ignore_negated=True)
+            else:
+                tree_nodes.append(tree)
+
+            flat.traverse(node_callback=lambda i: flat_nodes.append(flat.type(i)), leaf_callback=flat_nodes.append,
+                          ignore_negated=True)
+            self.assertEqual(tree_nodes, flat_nodes)
+
+    def test_to_tree(self):
+        for query in self.queries:
+            q = self.qp.parse(query)
+            tree = q.flat_tree.to_tree()
+
+            self.assertTrue(tree.is_frozen)
+            self.assertEqual(q.query_as_tree.leaves(), tree.leaves())
+            self.assertEqual(self.qp.stringify(q), self.qp.stringify(Query(tree)))
+            self.assertEqual(q.flat_tree, FlatTree.from_tree(tree))
+
+            compact = q.flat_tree.to_tree(compact=True)
+            self.assertTrue(all(type(leaf) is CompactOperand for leaf in compact.leaves()))
+
+        self.assertTrue(isinstance(self.qp.parse('a and b').flat_tree.to_tree(compact=True), CompactAnd))
+
+    def test_empty_tree(self):
+        flat = FlatTree.from_tree(None)
+
+        self.assertEqual((0, None, None), (len(flat), flat.root, flat.to_tree()))
+        self.assertEqual([], flat.leaves(ignore_negated=True))
+
+    def test_long_chain(self):
+        tree = Operand(field='id', val=0)
+        for i in range(1, 5000):
+            tree = Or([tree, Not([Operand(field='id', val=i)])])
+
+        flat = FlatTree.from_tree(tree)
+        self.assertEqual(5000, len(flat.leaves()))
+        self.assertEqual([{'field': 'id', 'val': 0}], flat.leaves(ignore_negated=True))
+        self.assertEqual(flat, FlatTree.from_tree(flat.to_tree()))
+
+    def test_pickle(self):
+        flat = self.qp.parse(self.queries[2]).flat_tree
+        self.assertEqual(flat, pickle.loads(pickle.dumps(flat)))
+
+    def test_invalid_arrays(self):
+        self.assertRaises(FlatTreeError, FlatTree, [LEAF, LEAF], [0, 0], [], [0])
+
+if __name__ == '__main__':
+    unittest.main()
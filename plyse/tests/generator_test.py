@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import copy
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from .grammar_from_config_test import conf
+from plyse.generator import ParserGenerator, ParserGeneratorError
+from plyse.expressions.lexer import LexerError
+from plyse.expressions.primitives import ParseException
+from plyse.query import Query
+from plyse.query_tree import And, Or, Not
+
+
+class ParserGeneratorTester(unittest.TestCase):
+
+    words = ['a', 'b:c', '"q"', 'x:1..3', '7', '-z', 'not', '(', ')', 'and', 'or', '+', '!y', 'id:4', '-', '&&',
+             'has:notifications', 'is:x', '"a b*"', 'a:', '1..', 'AND', 'Or', '!', '((', '))', 'is:important']
+
+    def setUp(self):
+        self.generator = ParserGenerator(conf)
+        self.parser = ParserGenerator.load(self.generator.generate())
+
+    def test_parse(self):
+        query = self.parser.parse("name:foo and (bar or is:important)")
+
+        self.assertTrue(isinstance(query, Query))
+        self.assertEqual("name:foo and (bar or is:important)", query.raw_query)
+
+        tree = query.query_as_tree
+        self.assertEqual(And.type, tree.type)
+        self.assertEqual('foo', tree.inputs[0]['val'])
+        self.assertEqual(Or.type, tree.inputs[1].type)
+        self.assertEqual('important', tree.inputs[1].inputs[1]['val'])
+
+    def test_unary_chain(self):
+        tree = self.parser.parse("- - a").query_as_tree
+
+        self.assertEqual(Not.type, tree.type)
+        self.assertEqual(Not.type, tree.inputs[0].type)
+
+    def test_syntax_mismatch(self):
+        self.assertRaises(ParseException, self.parser.parse, ")")
+        self.assertRaises(ParseException, self.parser.parse, "a (", True)
+        self.assertEqual('a', self.parser.parse("a (").query_as_tree['val'])
+
+    def test_same_result_as_pyparsing_grammar(self):
+        rnd = random.Random(7)
+        queries = [" ".join(rnd.choice(self.words) for _ in range(rnd.randint(1, 6))) for _ in range(500)]
+
+        self.assertEqual([], self.generator.verify(self.parser, queries))
+        self.assertEqual([], self.generator.verify(self.parser, queries, fail_if_syntax_mismatch=True))
+
+    def test_default_term(self):
+        default_conf = copy.deepcopy(conf)
+        del default_conf['term']
+
+        generator = ParserGenerator(default_conf)
+        parser = ParserGenerator.load(generator.generate())
+
+        self.assertEqual([], generator.verify(parser, ['a:1..3 "b c"', 'x:4 -y', 'a:b:c']))
+
+    def test_write(self):
+        directory = tempfile.mkdtemp()
+
+        try:
+            self.generator.write(os.path.join(directory, 'my_query_parser.py'))
+            sys.path.insert(0, directory)
+
+            import my_query_parser
+            self.assertEqual('foo', my_query_parser.parse("name:foo").query_as_tree['val'])
+        finally:
+            sys.path.remove(directory)
+            sys.modules.pop('my_query_parser', None)
+            shutil.rmtree(directory)
+
+    def test_unsupported_value_type(self):
+        phrase_conf = copy.deepcopy(conf)
+        phrase_conf['term']['values'].append({'class': 'plyse.expressions.primitives.Phrase', 'precedence': 1,
+                                              'parse_method': 'partial_string_parse'})
+
+        with self.assertRaises(ParserGeneratorError) as ctx:
+            ParserGenerator(phrase_conf)
+
+        self.assertIn('plyse.expressions.primitives.Phrase', str(ctx.exception))
+        self.assertFalse(isinstance(ctx.exception, LexerError))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import unittest
 from .grammar_test import GrammarTester
-from plyse.grammar import GrammarFactory
+from plyse.grammar import GrammarFactory, GrammarError
 from plyse.term_parser import Term
 
 
@@ -137,5 +137,83 @@ class ConfigurableGrammarTester(GrammarTester):
         r = g.parse("is:something")
         self._check_values(r[0], 'is', 'something', Term.PARTIAL_STRING)
 
+    def test_compiled_on_first_parse(self):
+        g = self._build_grammar()
+        self.assertEqual((0, False), (g.build_info().builds, g.build_info().compiled))
+
+        g.parse("name:dummy")
+        g.parse("name:other")
+        self.assertEqual((1, True), (g.build_info().builds, g.build_info().compiled))
+        self.assertTrue(g.build_info().total_time > 0)
+
+        g.remove_keyword('is')
+        self.assertFalse(g.build_info().compiled)
+
+        g.parse("is:something")
+        self.assertEqual(2, g.build_info().builds)
+
+    def test_batch_modifications(self):
+        g = self._build_grammar()
+        g.compile()
+
+        with g.batch():
+            g.remove_keyword('is')
+            g.remove_type('integer')
+            g.remove_operator('not')
+
+            self.assertNotIn('integer', [v['type'] for v in g.value_types])
+            self.assertRaises(GrammarError, g.parse, "a")
+
+        self.assertEqual(1, g.build_info().builds)
+
+        r = g.parse("is:127 -x")[0]
+        self._check_values(r[0], 'is', '127', Term.PARTIAL_STRING)
+        self.assertEqual('-x', r[2]['val'])
+        self.assertEqual(2, g.build_info().builds)
+
+    def test_failed_batch_is_discarded(self):
+        g = self._build_grammar()
+        value_types, keywords, fingerprint = g.value_types, g.keywords, g.fingerprint
+        g.compile()
+
+        try:
+            with g.batch():
+                g.remove_type('integer')
+                g.remove_keyword('is')
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual(value_types, g.value_types)
+        self.assertEqual(keywords, g.keywords)
+        self.assertEqual(fingerprint, g.fingerprint)
+
+        r = g.parse("age:10")[0]
+        self._check_values(r, 'age', 10, Term.INT)
+
+        # the grammar is still usable in a batch afterwards
+        with g.batch():
+            g.remove_type('integer')
+        self.assertNotIn('integer', [v['type'] for v in g.value_types])
+
+
+class ConfigurablePrecedenceClimbingGrammarTester(ConfigurableGrammarTester):
+
+    def _build_grammar(self):
+        return GrammarFactory.build_from_conf(dict(conf, engine='precedence_climbing'))
+
+
+class ConfigurableRegexGrammarTester(ConfigurableGrammarTester):
+
+    def _build_grammar(self):
+        return GrammarFactory.build_from_conf(dict(conf, engine='regex'))
+
+    def test_caseless_keyword_values(self):
+        r = self._init_and_parse('HAS:Notifications')
+        self._check_values(r, "has", 'notifications', Term.KEYWORD_VALUE)
+
+        r = self._init_and_parse('has:notificationsxx')
+        self._check_values(r, "has", 'notificationsxx', Term.KEYWORD_VALUE)
+
 if __name__ == "__main__":
     unittest.main()
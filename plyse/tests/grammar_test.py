@@ -1,8 +1,10 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import pickle
 import unittest
-from plyse.grammar import GrammarFactory
+from plyse.grammar import GrammarFactory, Grammar, GrammarError
 from plyse.term_parser import Term
+from plyse.expressions.primitives import ParseException, ParserElement
 
 
 class GrammarTester(unittest.TestCase):
@@ -185,5 +187,100 @@ class GrammarTester(unittest.TestCase):
         self._check_values(r[4][2][0], expected_val="NOT")
         self._check_values(r[4][2][1], "e", 0, Term.INT)
 
+    def test_pickle(self):
+        grammar = self._build_grammar()
+        loaded = pickle.loads(pickle.dumps(grammar))
+
+        self.assertEqual(grammar.fingerprint, loaded.fingerprint)
+        self.assertIsNone(loaded._grammar_parser)
+
+        query = '-(a or b:"c d") and e:1..3'
+        self.assertEqual(grammar.parse(query, True).asList(), loaded.parse(query, True).asList())
+
+
+class PrecedenceClimbingGrammarTester(GrammarTester):
+
+    def _build_grammar(self):
+        return GrammarFactory.build_default(engine=Grammar.PRECEDENCE_CLIMBING)
+
+    def test_same_result_as_pyparsing_engine(self):
+        pyparsing_grammar = GrammarFactory.build_default()
+        grammar = self._build_grammar()
+
+        for query in ['a b c', '-(a or -b) and c:1..2', 'a + - - b', '- -', '(a or', 'or', 'a or', '((a) b)) c']:
+            for fail_if_syntax_mismatch in (False, True):
+                try:
+                    expected = pyparsing_grammar.parse(query, fail_if_syntax_mismatch).asList()
+                except ParseException:
+                    self.assertRaises(ParseException, grammar.parse, query, fail_if_syntax_mismatch)
+                else:
+                    self.assertEqual(expected, grammar.parse(query, fail_if_syntax_mismatch).asList())
+
+    def test_long_query(self):
+        query = " ".join("id:%s" % i for i in range(2000))
+        r = self._init_and_parse(query)
+
+        self.assertEqual(3999, len(r))
+        self._check_values(r[-1], "id", 1999, Term.INT)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(GrammarError):
+            GrammarFactory.build_default(engine='fake')
+
+
+class RegexGrammarTester(PrecedenceClimbingGrammarTester):
+
+    def _build_grammar(self):
+        return GrammarFactory.build_default(engine=Grammar.REGEX)
+
+    def test_longest_value_wins(self):
+        self._check_values(self._init_and_parse('1..5'), "default", [1, 5], Term.RANGE % 'int')
+        self._check_values(self._init_and_parse('1..5x'), "default", '1..5x', Term.PARTIAL_STRING)
+        self._check_values(self._init_and_parse('30abc'), "default", '30abc', Term.PARTIAL_STRING)
+        self._check_values(self._init_and_parse('30'), "default", 30, Term.INT)
+
+    def test_operator_symbols_as_words(self):
+        r = self._init_and_parse('- - not')
+
+        self._check_values(r[0], expected_val="NOT")
+        self._check_values(r[1][0], expected_val="NOT")
+        self._check_values(r[1][1], "default", "not", Term.PARTIAL_STRING)
+
+
+class PackratTester(unittest.TestCase):
+
+    def test_memo_owned_by_grammar(self):
+        global_memo, global_parse = ParserElement.packrat_cache, ParserElement._parse
+        g1 = GrammarFactory.build_default(packrat_cache_size=16)
+        g2 = GrammarFactory.build_default()
+
+        g1.parse('(a and -b) or c')
+        info = g1.packrat_info()
+
+        self.assertTrue(info.hits > 0 and info.misses > 0 and info.evictions > 0)
+        self.assertEqual((16, 0), (info.maxsize, info.currsize))
+        self.assertEqual(0, g2.packrat_info().misses)
+
+        # global pyparsing state is left as it was
+        self.assertIs(global_memo, ParserElement.packrat_cache)
+        self.assertIs(global_parse, ParserElement._parse)
+
+        g1.parse('a')
+        self.assertTrue(g1.packrat_info().misses > info.misses)
+
+    def test_packrat_disabled(self):
+        g = GrammarFactory.build_default(packrat_cache_size=0)
+
+        self.assertEqual('a', g.parse('(a)')[0]['val'])
+        self.assertEqual(0, g.packrat_info().misses)
+
+    def test_memo_restored_on_error(self):
+        global_parse = ParserElement._parse
+        g = GrammarFactory.build_default()
+
+        self.assertRaises(ParseException, g.parse, 'a (', True)
+        self.assertIs(global_parse, ParserElement._parse)
+        self.assertEqual(0, g.packrat_info().currsize)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from plyse.index import InvertedIndex, InvertedIndexError, gallop_intersect, intersect, union, difference
+from plyse.term_parser import Term, TermParser
+from .fixtures import build_parser, term
+
+
+class InvertedIndexTester(unittest.TestCase):
+
+    documents = [
+        {'name': 'Peter Pan', 'age': 30, 'status': 'open', 'tags': ['red', 'blue'], 'default': 'hello world',
+         'address': {'zip': 'AB1'}},
+        {'name': 'Mary', 'age': 50, 'status': 'closed', 'tags': [], 'default': 'bye'},
+        {'name': 'John Peterson', 'age': 45, 'status': None},
+        {'name': 'Paul', 'age': 7, 'status': 'open', 'default': 'hello'},
+    ]
+
+    def setUp(self):
+        self.qp = build_parser()
+        self.index = InvertedIndex()
+        self.index.add_many(self.documents)
+
+    def _search(self, query, index=None):
+        query = self.qp.parse(query) if isinstance(query, str) else query
+        return (index if index is not None else self.index).search(query)
+
+    def test_add(self):
+        index = InvertedIndex()
+
+        self.assertEqual(0, index.add({'a': 1}))
+        self.assertEqual([1, 2], index.add_many([{'a': 2}, {'b': 'x y x'}]))
+        self.assertEqual(3, len(index))
+        self.assertEqual(frozenset(['a', 'b']), index.fields)
+        self.assertEqual([2], index.postings(self.qp.parse('b:x').query_as_tree))
+
+    def test_value_types(self):
+        self.assertEqual([0, 2], self._search('name:pet'))
+        self.assertEqual([0], self._search('name:"p*r"'))
+        self.assertEqual([1], self._search('name:"Mary"'))
+        self.assertEqual([], self._search('name:"mary"'))
+        self.assertEqual([0, 2], self._search('age:30..45'))
+        self.assertEqual([3], self._search('age:7'))
+        self.assertEqual([0, 3], self._search('status:"open"'))
+        self.assertEqual([0], self._search('tags:"blue"'))
+
+        self.assertEqual([1, 2], self._search('age:>30'))
+        self.assertEqual([0, 1, 2], self._search('age:>=30'))
+        self.assertEqual([3], self._search('age:<30'))
+        self.assertEqual([0, 3], self._search('age:<=30'))
+
+        self.assertEqual([0, 3], self._search(term('age', [30, 7, 'x'], Term.SET % Term.INT)))
+        self.assertEqual([0], self._search(term(['address', 'zip'], 'ab', Term.PARTIAL_STRING)))
+
+        self.assertRaises(InvertedIndexError, self.index.search, term('age', 1, 'color'))
+
+    def test_mismatching_types(self):
+        self.assertEqual([], self._search('name:1..5'))
+        self.assertEqual([], self._search('age:"30"'))
+        self.assertEqual([], self._search('missing:1'))
+        self.assertEqual([], self._search('name:>3'))
+
+    def test_operators(self):
+        self.assertEqual([0, 3], self._search('hello'))
+        self.assertEqual([1, 2], self._search('-hello'))
+        self.assertEqual([0, 1, 3], self._search('hello or age:50'))
+        self.assertEqual([3], self._search('hello and -(name:peter or age:30)'))
+        self.assertEqual([0, 1, 2, 3], self._search('--age:0..100'))
+        self.assertEqual([1, 2], self._search('-hello and -status:"open"'))
+        self.assertEqual([0, 1, 2], self._search('-hello or age:30 or name:john'))
+        self.assertEqual([0, 1, 2, 3], self._search(None))
+
+    def test_default_fields(self):
+        default_fields = build_parser(['name', 'status']).parse('o')
+        self.assertEqual([0, 3], self._search(default_fields))
+
+        index = InvertedIndex.from_term_parser(TermParser(default_fields=['name', 'status']))
+        index.add_many(self.documents)
+
+        self.assertEqual([1], self._search('mary', index))
+        self.assertEqual([1], self._search('clo', index))
+        self.assertEqual([0, 1, 2, 3], self._search('-hello', index))
+
+    def test_matches_predicates(self):
+        rnd = random.Random(3)
+        documents = [{'name': rnd.choice(['peter pan', 'mary', 'john', 'peterson']), 'age': rnd.randint(0, 50),
+                      'tags': rnd.sample(['a', 'b', 'c'], 2), 'default': rnd.choice(['hello world', 'bye'])}
+                     for _ in range(500)]
+        index = InvertedIndex()
+        index.add_many(documents)
+
+        for query_string in ['name:pet and -age:10..40', '-(name:mary or tags:"a") or hello',
+                             '(age:3..9 or -tags:"b") and (-hello or name:john)', '-hello and -name:pet']:
+            query = self.qp.parse(query_string)
+            predicate = query.compile_predicate()
+
+            self.assertEqual([i for i, d in enumerate(documents) if predicate(d)], index.search(query), query_string)
+
+    def test_only_star_is_a_wildcard(self):
+        index = InvertedIndex()
+        documents = [{'name': name} for name in ['abcd', 'axcd', 'ab', 'a', 'bc']]
+        index.add_many(documents)
+
+        # the part before the first '*' is a plain prefix anyway, the ones after it are the ones to check
+        for query_string in ['name:"a?c*"', 'name:"[ab]*"', 'name:"a*?d"', 'name:"*[bc]d"', 'name:"a*[x]*"',
+                             'name:"a*d"', 'name:"?*"']:
+            query = self.qp.parse(query_string)
+            predicate = query.compile_predicate()
+
+            self.assertEqual([i for i, d in enumerate(documents) if predicate(d)], index.search(query), query_string)
+
+    def test_results_are_copies(self):
+        self.index.search(self.qp.parse('name:mary')).append(10)
+        self.assertEqual([1], self._search('name:mary'))
+
+    def test_posting_list_operations(self):
+        rnd = random.Random(5)
+
+        for _ in range(100):
+            small = sorted(rnd.sample(range(2000), rnd.randint(0, 20)))
+            large = sorted(rnd.sample(range(2000), rnd.randint(0, 1000)))
+            expected = sorted(set(small) & set(large))
+
+            self.assertEqual(expected, gallop_intersect(small, large))
+            self.assertEqual(expected, intersect([large, small]))
+
+        self.assertEqual([1, 2, 3], union([[1, 3], [2, 3]]))
+        self.assertEqual([1, 4], difference([1, 2, 3, 4], [2, 3, 5]))
+        self.assertEqual([], intersect([[1, 2], [], [2]]))
+
+if __name__ == '__main__':
+    unittest.main()
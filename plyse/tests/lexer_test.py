@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+from plyse.grammar import GrammarFactory, Grammar
+from plyse.term_parser import TermParser
+from plyse.expressions.lexer import Lexer, LexerError
+from plyse.expressions.operators import Operator
+from plyse.expressions.primitives import Field, Phrase, PartialString
+from plyse.expressions.terms import TermFactory
+
+
+class LexerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = TermParser()
+        self.term = TermFactory.build_default_term(self.parser)
+        self.operators = [Operator("not", ['!', '-', 'not']), Operator('and', ['+', 'and']), Operator('or', ['or'], True)]
+
+    def test_tokenize(self):
+        lexer = Lexer(self.term, [], self.operators)
+        tokens = lexer.tokenize('(a:1..3 AND -"b c") or d')
+
+        self.assertEqual(
+            ['lpar', 'field', 'value0', 'ws', 'op_and', 'ws', 'op_not', 'value3', 'rpar', 'ws', 'op_or', 'ws', 'value2'],
+            [tokens[loc].lastgroup for loc in sorted(tokens)]
+        )
+
+    def test_values_follow_term_precedence(self):
+        lexer = Lexer(self.term, [], self.operators)
+
+        self.assertEqual(['integer_range', 'integer', 'partial_string', 'quoted_string'],
+                         [lexer._values[g].name for g in sorted(lexer._values)])
+
+    def test_unsupported_value_type(self):
+        term = TermFactory.build_term(Field(), [PartialString(), Phrase()])
+
+        self.assertRaises(LexerError, Lexer, term, [], self.operators)
+        grammar = GrammarFactory.build(term, self.parser, self.operators, [], Grammar.REGEX)
+        self.assertRaises(LexerError, grammar.compile)
+
+    def test_mismatch_stops_parsing(self):
+        g = GrammarFactory.build_default(engine=Grammar.REGEX)
+
+        self.assertEqual(1, len(g.parse('aa* bb')))
+
+if __name__ == '__main__':
+    unittest.main()
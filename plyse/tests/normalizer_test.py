@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+from plyse.compact_tree import CompactOperand, CompactOr
+from plyse.grammar import GrammarFactory
+from plyse.normalizer import Normalizer, NormalizerError
+from plyse.parser import QueryParser
+from plyse.term_parser import Term
+
+
+class NormalizerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.qp = QueryParser(GrammarFactory.build_default())
+
+    def _shape(self, node):
+        if node.is_leaf:
+            return node['val']
+
+        return (node.type, [self._shape(child) for child in node.children])
+
+    def _normalize(self, query_string, **rules):
+        return self._shape(self.qp.parse(query_string).normalize(**rules).query_as_tree)
+
+    def test_flatten(self):
+        self.assertEqual(('or', ['a', 'b', ('and', ['c', 'd', 'e'])]), self._normalize('a or b or (c and d and e)'))
+        self.assertEqual(('or', [('or', ['a', 'b']), ('and', [('and', ['c', 'd']), 'e'])]),
+                         self._normalize('a or b or (c and d and e)', flatten=False))
+
+    def test_deduplicate(self):
+        self.assertEqual('a', self._normalize('a or a'))
+        self.assertEqual(('and', ['a', 'b']), self._normalize('a and (b and a) and b'))
+        self.assertEqual(('or', [('and', ['a', 'b']), 'c']), self._normalize('(a and b) or c or (a and b)'))
+        self.assertEqual(('or', ['a', 'a']), self._normalize('a or a', deduplicate=False))
+
+    def test_double_negation(self):
+        self.assertEqual('x', self._normalize('--x'))
+        self.assertEqual(('not', ['x']), self._normalize('---x'))
+        self.assertEqual(('not', [('not', ['x'])]), self._normalize('--x', double_negation=False))
+
+    def test_de_morgan(self):
+        self.assertEqual(('and', ['a', 'b']), self._normalize('-(-a or -b)'))
+        self.assertEqual(('or', ['a', 'b', ('not', ['c'])]), self._normalize('-(-a and -b and c)'))
+        self.assertEqual(('not', [('or', ['a', 'b'])]), self._normalize('-(a or b)'))  # wouldn't help
+        self.assertEqual(('not', [('or', [('not', ['a']), ('not', ['b'])])]),
+                         self._normalize('-(-a or -b)', de_morgan=False))
+
+    def test_value_sets(self):
+        q = self.qp.parse('id:1 or name:x or id:2 or id:3 or id:2 or id:"a" or tag:"t" or part')
+        n = q.normalize()
+        ids = n.query_as_tree.children[0]
+
+        self.assertEqual([1, 2, 3], ids[Term.VAL])
+        self.assertEqual(Term.SET % Term.INT, ids[Term.VAL_TYPE])
+        self.assertEqual('id', ids[Term.FIELD])
+        self.assertEqual(['name', 'id', 'tag', 'default'], [t.field for t in n.terms()[1:]])
+        self.assertEqual('(id:1 or id:2 or id:3) or name:x or id:a or tag:t or default:part', self.qp.stringify(n))
+
+        self.assertEqual(('or', [1, 'x', 2]), self._normalize('id:1 or name:x or id:2', min_set_size=3))
+        self.assertEqual(('or', [1, 2]), self._normalize('id:1 or id:2', value_sets=False))
+        self.assertEqual(('and', [1, 2]), self._normalize('id:1 and id:2'))
+        self.assertRaises(NormalizerError, Normalizer, min_set_size=1)
+
+    def test_equivalent_terms(self):
+        q = self.qp.parse('(name:a or name:a) and --age:3 and -(-x or -y) and (b or c or b)')
+        n = q.normalize()
+
+        self.assertEqual(('and', ['a', 3, 'x', 'y', ('or', ['b', 'c'])]), self._shape(n.query_as_tree))
+        self.assertEqual(q.raw_query, n.raw_query)
+        self.assertTrue(n.query_as_tree.is_frozen)
+
+    def test_unchanged_subtrees_are_shared(self):
+        q = self.qp.parse('(a and -b) or c')
+        n = q.normalize()
+
+        self.assertIs(q.query_as_tree, n.query_as_tree)
+        self.assertIs(q.query_as_tree.children[0], q.normalize(value_sets=False).query_as_tree.children[0])
+
+    def test_compact_trees(self):
+        qp = QueryParser(GrammarFactory.build_default(), compact=True)
+        tree = qp.parse('id:1 or id:2 or --a').normalize().query_as_tree
+
+        self.assertEqual(CompactOr, type(tree))
+        self.assertEqual([CompactOperand, CompactOperand], [type(child) for child in tree.children])
+        self.assertEqual([1, 2], tree.children[0].val)
+
+    def test_long_chains(self):
+        term = {'field': 'id', 'field_type': 'attribute', 'val_type': Term.INT}
+        elements = [dict(term, val=0)]
+        for i in range(1, 5000):
+            elements += ['OR', dict(term, val=i % 100)]
+
+        tree = Normalizer().normalize(self.qp.parse_elements(elements))
+
+        self.assertTrue(tree.is_leaf)
+        self.assertEqual(list(range(100)), tree[Term.VAL])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import unittest
 from plyse.expressions.primitives import ParseException
 from plyse.grammar import GrammarFactory
 from plyse.parser import QueryParser
+from plyse.query import Query
 from plyse.term_parser import Term
 from plyse.query_tree import Operand, And, Or, Not
 
@@ -134,5 +135,135 @@ class QueryParserTester(unittest.TestCase):
         with self.assertRaises(ParseException):
             self.init_and_parse('aa*', True)
 
+    def test_parse_elements_long_chain(self):
+        qp = QueryParser(GrammarFactory.build_default())
+        term = {'field': 'id', 'field_type': 'attribute', 'val': 1, 'val_type': Term.INT}
+
+        elements = [term]
+        for _ in range(5000):
+            elements += ['OR', term]
+
+        node, depth = qp.parse_elements(elements), 0
+        while not node.is_leaf:
+            self.assertTrue(isinstance(node, Or))
+            self.assertEqual(term, node.inputs[1])
+            node, depth = node.inputs[0], depth + 1
+
+        self.assertEqual(5000, depth)
+
+    def test_parse_elements_deeply_nested_groups(self):
+        qp = QueryParser(GrammarFactory.build_default())
+        term = {'field': 'id', 'field_type': 'attribute', 'val': 1, 'val_type': Term.INT}
+
+        elements = [term]
+        for _ in range(5000):
+            elements = [['NOT', elements]]
+
+        node, depth = qp.parse_elements(elements), 0
+        while not node.is_leaf:
+            self.assertTrue(isinstance(node, Not))
+            node, depth = node.inputs[0], depth + 1
+
+        self.assertEqual(5000, depth)
+        self.assertEqual(None, qp.parse_elements([]))
+
+    def test_parse_cache_returns_shared_query(self):
+        qp = QueryParser(GrammarFactory.build_default(), cache_size=10)
+
+        q = qp.parse('a:test or b:otro')
+        self.assertIs(q, qp.parse('a:test or b:otro'))
+        self.assertIsNot(q, qp.parse('a:test or b:otro', True))
+
+        info = qp.cache_info()
+        self.assertEqual(1, info.hits)
+        self.assertEqual(2, info.misses)
+        self.assertEqual(2, info.currsize)
+
+    def test_parse_cache_lru_eviction(self):
+        qp = QueryParser(GrammarFactory.build_default(), cache_size=2)
+
+        a = qp.parse('a')
+        qp.parse('b')
+        qp.parse('a')  # 'a' becomes the most recently used, so 'b' gets evicted
+        qp.parse('c')
+
+        self.assertEqual(1, qp.cache_info().evictions)
+        self.assertIs(a, qp.parse('a'))
+        self.assertEqual(2, qp.cache_info().hits)
+
+        qp.cache_clear()
+        self.assertEqual((0, 0, 0, 2, 0), tuple(qp.cache_info()))
+
+    def test_parse_cache_keyed_by_grammar(self):
+        g = GrammarFactory.build_default()
+        qp = QueryParser(g, cache_size=10)
+
+        q = qp.parse('-name:dummy')
+        self.assertTrue(isinstance(q.query_as_tree, Not))
+
+        g.remove_operator('not')
+        q = qp.parse('-name:dummy')
+        self.assertEqual('-name', q.query_as_tree.field)
+        self.assertEqual(0, qp.cache_info().hits)
+
+    def test_parse_cache_disabled_by_default(self):
+        qp = QueryParser(GrammarFactory.build_default())
+
+        self.assertIsNot(qp.parse('a'), qp.parse('a'))
+        self.assertEqual(0, qp.cache_info().currsize)
+
+    def test_parse_many(self):
+        qp = QueryParser(GrammarFactory.build_default())
+        queries = ['name:a', ')', 'b or c', 'name:a', 'x and (y']
+
+        results = list(qp.parse_many(iter(queries), chunksize=2, fail_if_syntax_mismatch=True))
+
+        self.assertEqual(len(queries), len(results))
+        self.assertEqual(['name:a', None, 'b or c', 'name:a', None],
+                         [r.raw_query if not isinstance(r, Exception) else None for r in results])
+        self.assertTrue(isinstance(results[1], ParseException))
+        self.assertTrue(isinstance(results[4], ParseException))
+
+    def test_parse_many_dedups_inside_chunk(self):
+        qp = QueryParser(GrammarFactory.build_default())
+
+        results = list(qp.parse_many(['a', 'b', 'a', 'a'], chunksize=3))
+
+        self.assertIs(results[0], results[2])
+        self.assertIsNot(results[0], results[3])
+
+    def test_parse_many_with_workers(self):
+        qp = QueryParser(GrammarFactory.build_default())
+        queries = ['name:q%s and -age:%s' % (i, i) for i in range(50)] + [')'] + ['a', 'a']
+
+        results = list(qp.parse_many(queries, workers=2, chunksize=7, fail_if_syntax_mismatch=True))
+
+        self.assertEqual([qp.parse(q).query_as_tree.leaves() for q in queries[:50]],
+                         [r.query_as_tree.leaves() for r in results[:50]])
+        self.assertTrue(isinstance(results[50], ParseException))
+        self.assertIs(results[51], results[52])
+
+    def test_nary(self):
+        qp, nary_qp = QueryParser(GrammarFactory.build_default()), QueryParser(GrammarFactory.build_default(), nary=True)
+
+        q = nary_qp.parse('a or b or c and d and -e f')
+        tree = q.query_as_tree
+
+        self.assertTrue(isinstance(tree, Or))
+        self.assertEqual(4, len(tree.inputs))
+        self.assertTrue(isinstance(tree.inputs[2], And))
+        self.assertEqual(3, len(tree.inputs[2].inputs))
+        self.assertEqual(qp.parse(q.raw_query).terms(), q.terms())
+        self.assertEqual('default:a or default:b or (default:c and default:d and not default:e) or default:f',
+                         nary_qp.stringify(q))
+        self.assertEqual(qp.stringify(qp.parse(q.raw_query)), qp.stringify(Query(tree.binarize())))
+
+        term = {'field': 'id', 'field_type': 'attribute', 'val': 1, 'val_type': Term.INT}
+        elements = [term]
+        for _ in range(5000):
+            elements += ['OR', term]
+
+        self.assertEqual(5001, len(nary_qp.parse_elements(elements).inputs))
+
 if __name__ == "__main__":
     unittest.main(verbosity=3)
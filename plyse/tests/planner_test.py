@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from plyse.planner import Planner, PlannerError, Statistics, SketchStatistics, CountMinSketch, HyperLogLog
+from plyse.query_tree import binarize_tree
+from plyse.term_parser import Term
+from .fixtures import build_parser, term
+
+
+class PlannerTester(unittest.TestCase):
+
+    def setUp(self):
+        self.qp = build_parser()
+        self.statistics = Statistics(1000, fields={'name': 0.3}, values={('status', 'open'): 0.6, ('id', 7): 0.001,
+                                                                         ('status', 'new'): 0.05})
+
+    def _order(self, node):
+        return [child.get(Term.VAL) if child.is_leaf else child.type for child in node.children]
+
+    def test_and_puts_most_selective_first(self):
+        plan = self.qp.parse('status:"open" and id:7').plan(self.statistics)
+
+        self.assertEqual([7, 'open'], self._order(plan.tree))
+        selectivity, cardinality, cost = plan.estimate(plan.tree)
+        self.assertAlmostEqual(0.0006, selectivity)
+        self.assertEqual(1, cardinality)
+        self.assertAlmostEqual(1.001, cost)  # status only gets checked for the records with id 7
+
+    def test_or_puts_most_likely_first(self):
+        plan = self.qp.parse('id:7 or status:"new" or status:"open"').plan(self.statistics)
+        estimate = plan.estimate(plan.tree)
+
+        self.assertEqual(['open', 'new', 7], self._order(plan.tree))
+        self.assertAlmostEqual(1 - 0.4 * 0.95 * 0.999, estimate.selectivity)
+        self.assertEqual(620, estimate.cardinality)
+
+    def test_costs(self):
+        # a partial string costs more than an exact value that is a bit less selective
+        plan = self.qp.parse('name:pete and status:"new"').plan(Statistics(100, fields={'name': 0.04},
+                                                                            values={('status', 'new'): 0.05}))
+        self.assertEqual(['new', 'pete'], self._order(plan.tree))
+
+        plan = self.qp.parse('name:pete and status:"new"').plan(Statistics(100, fields={'name': 0.001},
+                                                                            values={('status', 'new'): 0.9}))
+        self.assertEqual(['pete', 'new'], self._order(plan.tree))
+
+    def test_nested_operators(self):
+        q = self.qp.parse('(status:"open" or name:x) and -status:"new" and (id:7 or status:"new")')
+        plan = q.plan(self.statistics)
+
+        # the NOT is the least likely to be false
+        self.assertEqual(['or', 'or', 'not'], self._order(plan.tree))
+        self.assertEqual(['new', 7], self._order(plan.tree.children[0]))
+        self.assertEqual(['open', 'x'], self._order(plan.tree.children[1]))
+        self.assertAlmostEqual(0.95, plan.estimate(plan.tree.children[2]).selectivity)
+        self.assertEqual(9, len(plan.explain().splitlines()))
+        self.assertTrue(plan.explain().startswith('AND  (rows='))
+        self.assertIn('\n    id:7  (rows=1 ', plan.explain())
+
+        binary = binarize_tree(plan.tree)
+        self.assertEqual(2, len(binary.children))
+
+    def test_unchanged_trees_are_shared(self):
+        q = self.qp.parse('id:7 and status:"open"')
+        self.assertIs(q.query_as_tree, q.plan(self.statistics).tree)
+
+    def test_terms_and_empty_trees(self):
+        plan = Planner(self.statistics).plan(self.qp.parse('id:7').query_as_tree)
+        self.assertEqual(1, plan.estimate(plan.tree).cardinality)
+
+        self.assertIs(None, Planner(self.statistics).plan(None).tree)
+        self.assertEqual('', Planner(self.statistics).plan(None).explain())
+
+    def test_selectivity(self):
+        def _selectivity(query, default_fields=None):
+            return self.statistics.selectivity(build_parser(default_fields).parse(query).query_as_tree)
+
+        value_set = term('status', ['open', 'new'], Term.SET % Term.KEYWORD_VALUE)
+
+        self.assertAlmostEqual(0.65, self.statistics.selectivity(value_set))
+        self.assertAlmostEqual(0.1, _selectivity('status:"closed"'))
+        self.assertAlmostEqual(0.3, _selectivity('name:x'))
+        self.assertAlmostEqual(1 - 0.7 * 0.9, _selectivity('x', ['name', 'other']))
+
+    def test_sketch_statistics(self):
+        rnd = random.Random(1)
+        statistics = SketchStatistics()
+        statistics.observe_many({'id': i, 'status': rnd.choice(['open', 'open', 'open', 'closed']),
+                                 'age': rnd.randint(0, 99), 'address': {'zip': 'z%d' % (i % 10)}}
+                                for i in range(5000))
+
+        def _selectivity(query_string):
+            return statistics.selectivity(self.qp.parse(query_string).query_as_tree)
+
+        self.assertEqual(5000, statistics.total)
+        self.assertAlmostEqual(0.75, _selectivity('status:"open"'), delta=0.03)
+        self.assertAlmostEqual(0.2, _selectivity('age:10..29'), delta=0.01)
+        self.assertLess(_selectivity('id:123'), 0.005)
+        self.assertEqual(0, _selectivity('missing:3'))
+        self.assertEqual(0, _selectivity('status:1..3'))
+        self.assertAlmostEqual(0.1, statistics.selectivity(term(['address', 'zip'], 'z3', Term.EXACT_STRING)),
+                               delta=0.01)
+
+        plan = self.qp.parse('status:"open" and age:10..29 and id:123').plan(statistics)
+        self.assertEqual([123, [10, 29], 'open'], self._order(plan.tree))
+
+    def test_sketches(self):
+        counts = CountMinSketch(width=64, depth=4)
+        for i in range(1000):
+            counts.add(i % 10)
+
+        self.assertTrue(all(counts.estimate(i) >= 100 for i in range(10)))
+        self.assertEqual(0, CountMinSketch().estimate('x'))
+
+        distinct = HyperLogLog(12)
+        for i in range(20000):
+            distinct.add(i % 5000)
+
+        self.assertAlmostEqual(5000, distinct.count(), delta=250)
+        self.assertEqual(0, HyperLogLog().count())
+        self.assertRaises(PlannerError, HyperLogLog, 20)
+        self.assertRaises(PlannerError, CountMinSketch, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+from plyse.predicate import PredicateCompiler, PredicateError, compile_predicate
+from plyse.query_tree import And, Or, Not
+from plyse.term_parser import Term
+from .fixtures import build_parser, term
+
+
+class PredicateTester(unittest.TestCase):
+
+    records = [
+        {'name': 'Peter Pan', 'age': 30, 'status': 'open', 'tags': ['red', 'blue'], 'default': 'hello world',
+         'address': {'zip': 'AB1'}},
+        {'name': 'Mary', 'age': 'unknown', 'status': 'closed', 'tags': [], 'default': 'bye'},
+        {'name': 'John', 'age': 45},
+    ]
+
+    def setUp(self):
+        self.qp = build_parser()
+
+    def _matches(self, query, schema=None):
+        if not isinstance(query, str):
+            predicate = compile_predicate(query, schema)
+        else:
+            predicate = self.qp.parse(query).compile_predicate(schema)
+
+        return [r['name'] for r in self.records if predicate(r)]
+
+    def test_value_types(self):
+        self.assertEqual(['Peter Pan'], self._matches('name:peter'))
+        self.assertEqual(['Peter Pan'], self._matches('name:"p*pan"'))
+        self.assertEqual(['Mary'], self._matches('name:"Mary"'))
+        self.assertEqual([], self._matches('name:"mary"'))
+        self.assertEqual(['Peter Pan', 'John'], self._matches('age:20..50'))
+        self.assertEqual(['John'], self._matches('age:45'))
+        self.assertEqual(['John'], self._matches('age:>40'))
+        self.assertEqual(['Peter Pan', 'John'], self._matches('age:>=30'))
+        self.assertEqual([], self._matches('age:<30'))
+        self.assertEqual(['Peter Pan'], self._matches('age:<=30'))
+
+        self.assertEqual(['Peter Pan', 'John'], self._matches(term('age', [45, 30, 7], Term.SET % Term.INT)))
+        self.assertEqual(['Mary'], self._matches(term('status', 'closed', Term.KEYWORD_VALUE)))
+
+        self.assertRaises(PredicateError, compile_predicate, term('age', 'x', 'color'))
+
+    def test_operators(self):
+        self.assertEqual(['Peter Pan', 'Mary'], self._matches('name:peter or status:"closed"'))
+        self.assertEqual(['Peter Pan'], self._matches('name:peter and age:30'))
+        self.assertEqual(['Mary', 'John'], self._matches('-name:peter'))
+        self.assertEqual(['Peter Pan', 'John'], self._matches('--age:0..100'))
+        self.assertEqual(['John'], self._matches('-(name:peter or status:"closed") and age:40..50'))
+
+    def test_fields(self):
+        self.assertEqual(['Peter Pan'], self._matches('hello'))
+        self.assertEqual(['Peter Pan'], self._matches('tags:"blue"'))
+        self.assertEqual([], self._matches('missing:"x"'))
+        self.assertEqual(['Peter Pan'], self._matches(term(['address', 'zip'], 'ab', Term.PARTIAL_STRING)))
+
+        default_fields = build_parser(['name', 'status']).parse('o').query_as_tree
+        self.assertEqual(['Peter Pan', 'Mary', 'John'], self._matches(default_fields))
+
+    def test_no_default_fields(self):
+        # terms without field match nothing when there are no default fields
+        query = build_parser([]).parse('peter or name:mary')
+
+        self.assertEqual('False', PredicateCompiler()._term_expression(query.query_as_tree.inputs[0], [], []))
+        self.assertIs(False, compile_predicate(query.query_as_tree.inputs[0])(self.records[0]))
+        self.assertEqual(['Mary'], self._matches(query.query_as_tree))
+        self.assertEqual(['Peter Pan', 'Mary', 'John'], self._matches(Not([query.query_as_tree.inputs[0]])))
+
+    def test_schema(self):
+        schema = {'default': ['name', 'status'], 'years': 'age', 'initial': lambda r: r['name'][0]}
+
+        self.assertEqual(['Peter Pan', 'John'], self._matches('n', schema))
+        self.assertEqual(['Peter Pan', 'Mary'], self._matches('e', schema))
+        self.assertEqual(['John'], self._matches('years:45', schema))
+        self.assertEqual(['Mary'], self._matches('initial:"M"', schema))
+
+    def test_empty_query(self):
+        self.assertTrue(compile_predicate(None)({}))
+
+    def test_code_shared_between_query_shapes(self):
+        PredicateCompiler._factories.clear()
+
+        self.qp.parse('name:peter and age:3').compile_predicate()
+        self.qp.parse('age:30 + name:"mary"').compile_predicate()
+        self.qp.parse('name:a or age:3').compile_predicate()
+
+        self.assertEqual((1, 2), PredicateCompiler._factories.info()[:2])
+
+    def test_predicate_kept_with_query(self):
+        q = self.qp.parse('name:peter')
+
+        self.assertIs(q.compile_predicate(), q.compile_predicate())
+        self.assertIsNot(q.compile_predicate(), q.compile_predicate({'name': 'status'}))
+
+    def test_long_queries(self):
+        # built by hand, parsing thousands of terms would take most of the test
+        tree = term('age', 0, Term.INT)
+        for i in range(1, 3000):
+            tree = And([Not([term('age', i, Term.INT)]), tree])
+
+        predicate = compile_predicate(tree)
+
+        self.assertTrue(predicate({'age': 0}))
+        self.assertFalse(predicate({'age': 5}))
+
+        for i in range(400):  # alternating operators can't be flattened
+            tree = (And if i % 2 else Or)([term('age', i, Term.INT), tree])
+
+        self.assertRaises(PredicateError, compile_predicate, tree)
+
+if __name__ == '__main__':
+    unittest.main()
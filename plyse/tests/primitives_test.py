@@ -1,5 +1,7 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import re
+import pickle
 import unittest
 from plyse.expressions.primitives import *
 
@@ -18,6 +20,10 @@ class PrimitiveTester(unittest.TestCase):
     def test_base_word(self):
         bw = BaseWord("abc", 1)
         self.assertEqual(1, bw.precedence)
+        # newer pyparsing versions swap the class of regex backed words
+        self.assertTrue(isinstance(bw, BaseWord))
+        self.assertTrue(isinstance(BaseWord("abc", 1), type(bw)))
+        self.assertEqual('[abc]+', bw.lexer_pattern)
         self.assert_parsed_output(bw, {'abc': ['abc'], 'ad': ['a'], 'a b': ['a'], 'd': None})
 
     def test_simple_word(self):
@@ -27,6 +33,11 @@ class PrimitiveTester(unittest.TestCase):
         sw = SimpleWord(extra_chars=":;")
         self.assert_parsed_output(sw, {'a:b:c': ['a:b:c'], 'ab;c': ['ab;c']})
 
+        # the lexer pattern matches the same words as the pyparsing expression
+        self.assertEqual(SimpleWord.char_class(SimpleWord.CHARS + ':;') + '+', sw.lexer_pattern)
+        for text in ['a:b:c', 'ab;c', 'ab-c.d_e', 'ab c', 'a"b']:
+            self.assertEqual(sw.parseString(text)[0], re.match(sw.lexer_pattern, text).group())
+
     def test_fieldname(self):
         fn = FieldName()
         self.assert_parsed_output(fn, {'abc': ['abc'], 'ab-c': ['ab-c'], 'ab_c': ['ab_c']})
@@ -83,5 +94,16 @@ class PrimitiveTester(unittest.TestCase):
         sp = StringProximity()
         self.assert_parsed_output(sp, {"'hello world'~3": ['hello world', '~', '3']})
 
+    def test_pickle(self):
+        # words are the expressions pyparsing swaps the class of, the others keep it on every version
+        for primitive, text in [(BaseWord("abc", 1), 'abc'), (SimpleWord(extra_chars=':'), 'a:b'),
+                                (FieldName(), 'first_name'), (PartialString(), 'ab-c'), (Field(), 'name:test'),
+                                (IntegerRange(), '1..10'), (QuotedString(), '"abc"')]:
+            loaded = pickle.loads(pickle.dumps(primitive))
+
+            self.assertIs(type(primitive), type(loaded))
+            self.assertEqual(primitive.lexer_pattern, loaded.lexer_pattern)
+            self.assertEqual(list(primitive.parseString(text)), list(loaded.parseString(text)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,11 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import pickle
 import unittest
 from plyse.grammar import GrammarFactory
 from plyse.parser import QueryParser
+from plyse.query import TermIndex
+from plyse.term_parser import Term
 from plyse.query_tree import Operand, And, Operator
 
 
@@ -23,6 +26,48 @@ class QueryParserTester(unittest.TestCase):
         self.assertEqual('name', q.terms()[0].field)
         self.assertEqual('plyse', q.terms()[0].val)
 
+    def test_iter_terms(self):
+        q = self.qp.parse("name:plyse and -ask:gently or size:3")
+
+        terms = q.iter_terms()
+        self.assertEqual('name', next(terms).field)
+        self.assertEqual(['ask', 'size'], [t.field for t in terms])
+        self.assertEqual(q.terms(ignore_negated=True), list(q.iter_terms(ignore_negated=True)))
+
+    def test_term_index(self):
+        q = self.qp.parse('name:plyse and -name:pyparsing or age:3 or age:1..5 or is:fast or text')
+        index = q.term_index()
+
+        self.assertIs(index, q.term_index())
+        self.assertEqual(['plyse', 'pyparsing'], [t.val for t in q.terms_by_field('name')])
+        self.assertEqual(['plyse'], [t.val for t in q.terms_by_field('name', ignore_negated=True)])
+        self.assertEqual((), q.terms_by_field('missing'))
+        self.assertEqual(['text'], [t.val for t in q.terms_by_field_type(Term.DEFAULT)])
+        self.assertEqual([3], [t.val for t in q.terms_by_val_type(Term.INT)])
+        self.assertEqual([[1, 5]], [t.val for t in q.terms_by_val_type(Term.RANGE % Term.INT)])
+        self.assertEqual(frozenset(['name', 'age', 'is', 'default']), q.fields())
+        self.assertEqual(q.terms(), [t for t in q.terms() if t in index.by_field_type(t.field_type)])
+
+    def test_term_index_merged_on_stack_and_combine(self):
+        q1, q2 = self.qp.parse('name:a or -age:1'), self.qp.parse('name:b')
+        q1.term_index()
+
+        stacked = q1.stack(q2)
+        self.assertNotIn(('term_index', False), q2._derived)
+        self.assertEqual(['a', 'b'], [t.val for t in stacked.terms_by_field('name')])
+        self.assertIn(('term_index', False), q2._derived)  # built for q2 alone, q1's one was reused
+
+        combined = stacked.combine(self.qp.parse('age:2'))
+        self.assertEqual([1, 2], [t.val for t in combined.terms_by_field('age')])
+        self.assertEqual([2], [t.val for t in combined.terms_by_field('age', ignore_negated=True)])
+        self.assertEqual(frozenset(['name', 'age']), combined.fields())
+
+        for field in ['name', 'age']:
+            self.assertEqual(TermIndex.build(combined.terms()).by_field(field), combined.terms_by_field(field))
+
+        loaded = pickle.loads(pickle.dumps(combined))
+        self.assertEqual(combined.terms_by_field('age'), loaded.terms_by_field('age'))
+
     def test_stack_query(self):
         q = self.qp.parse("name:plyse")
         q2 = q.stack(self.qp.parse("ask:gently"))
@@ -71,5 +116,70 @@ class QueryParserTester(unittest.TestCase):
         self.assertTrue(isinstance(q2.query_from_stack(1)[0], Operator))
         self.assertEqual('-ask:gently', q2.query_from_stack(1)[1])
 
+    def test_stack_shares_trees(self):
+        q = self.qp.parse("name:plyse or name:other")
+        q2 = self.qp.parse("ask:gently")
+        q3 = q.stack(q2)
+
+        self.assertTrue(q.query_as_tree.is_frozen)
+        self.assertTrue(q3.query_as_tree.is_frozen)
+        self.assertIs(q.query_as_tree, q3.query_as_tree.inputs[0])
+        self.assertIs(q2.query_as_tree, q3.query_as_tree.inputs[1])
+        self.assertIs(q.query_as_tree, q3.query_from_stack(0)[0])
+        self.assertIs(q2.query_as_tree, q3.query_from_stack(1)[0])
+
+    def test_long_stack_and_combine_chains(self):
+        q = self.qp.parse("name:plyse")
+        parts = [self.qp.parse("id:%s" % i) for i in range(2000)]
+
+        for i, part in enumerate(parts):
+            q = q.stack(part) if i % 2 else q.combine(part)
+
+        self.assertEqual(1001, len(q._stack_map))
+        self.assertEqual(1001, len(q._combine_map))
+        self.assertEqual('id:1', q.query_from_stack(1)[1])
+        self.assertIs(parts[-1].query_as_tree, q.query_from_stack(1000)[0])
+        self.assertEqual('id:0', q._combine_map[1][1])
+
+    def test_deep_history(self):
+        base = self.qp.parse("name:plyse")
+        parts = [self.qp.parse("id:%s" % i) for i in range(10)]
+        q = base
+        for i in range(5000):
+            q = q.stack(parts[i % 10])
+
+        # every level of the stack, lookups are constant time
+        self.assertEqual(['id:%s' % (i % 10) for i in range(5000)],
+                         [q.query_from_stack(level)[1] for level in range(1, 5001)])
+        self.assertEqual(5001, len(q._stack_map.items()))
+
+        # queries derived from the same one keep their own history
+        first, second = base.stack(self.qp.parse("a")), base.stack(self.qp.parse("b"))
+        self.assertEqual('a', first.query_from_stack(1)[1])
+        self.assertEqual('b', second.query_from_stack(1)[1])
+        self.assertEqual(2, len(first._stack_map))
+        self.assertEqual(1, len(base._stack_map))
+        self.assertRaises(KeyError, base.query_from_stack, 1)
+
+    def test_pickle(self):
+        q = self.qp.parse("name:plyse or -name:other").stack(self.qp.parse("id:1..3")).combine(self.qp.parse("a"))
+        loaded = pickle.loads(pickle.dumps(q))
+
+        self.assertEqual(q.raw_query, loaded.raw_query)
+        self.assertEqual(q.terms(), loaded.terms())
+        self.assertTrue(loaded.query_as_tree.is_frozen)
+        self.assertEqual(2, len(loaded._stack_map))
+        self.assertEqual(2, len(loaded._combine_map))
+        self.assertEqual('id:1..3', loaded.query_from_stack(1)[1])
+
+        # trees shared between the query and its history are still shared after loading
+        self.assertIs(loaded.query_from_stack(1)[0], loaded.query_as_tree.inputs[0].inputs[1])
+
+    def test_pickle_long_query(self):
+        q = self.qp.parse(" ".join("id:%s" % i for i in range(3000)))
+        loaded = pickle.loads(pickle.dumps(q))
+
+        self.assertEqual(2999, loaded.query_as_tree.inputs[1]['val'])
+
 if __name__ == "__main__":
     unittest.main(verbosity=3)
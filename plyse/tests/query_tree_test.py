@@ -1,7 +1,10 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import pickle
 import unittest
-from plyse.query_tree import Operand, And, Or, Not, NotOperatorError
+from copy import copy, deepcopy
+from plyse.query_tree import (Operand, And, Or, Not, NotOperatorError, FrozenNodeError, TreeNodeError, flatten_tree,
+                              PRE_ORDER, POST_ORDER)
 
 
 class QueryTreeTester(unittest.TestCase):
@@ -55,5 +58,179 @@ class QueryTreeTester(unittest.TestCase):
 
         self.assert_node(not_op)
 
+    def test_frozen_nodes_are_immutable(self):
+        o1 = Operand(**self.o1)
+        tree = And([o1, Not([Operand(**self.o2)])]).freeze()
+
+        self.assertTrue(tree.is_frozen)
+        self.assertTrue(all(n.is_frozen for n in [o1, tree.children[1], tree.children[1].children[0]]))
+
+        self.assertRaises(FrozenNodeError, tree.add_input, Operand(**self.o1))
+        self.assertRaises(FrozenNodeError, tree.children[1].add_input, Operand(**self.o1))
+        self.assertRaises(FrozenNodeError, o1.__setitem__, 'val', 'other')
+        self.assertRaises(FrozenNodeError, setattr, o1, 'val', 'other')
+        self.assertRaises(FrozenNodeError, o1.update, {'val': 'other'})
+        self.assertRaises(FrozenNodeError, o1.pop, 'val')
+        self.assertEqual(self.o1, o1)
+
+    def test_copies_of_frozen_nodes_are_mutable(self):
+        tree = Or([Operand(**self.o1), Operand(**self.o2)]).freeze()
+
+        tree_copy = deepcopy(tree)
+        self.assertFalse(tree_copy.is_frozen)
+        self.assertFalse(tree_copy.children[0].is_frozen)
+        self.assertEqual(self.o1, tree_copy.children[0])
+        self.assertIsNot(tree.children[0], tree_copy.children[0])
+
+        tree_copy.add_input(Operand(**self.o1))
+        self.assertEqual(3, len(tree_copy.leaves()))
+        self.assertEqual(2, len(tree.leaves()))
+
+        shallow = copy(tree)
+        self.assertFalse(shallow.is_frozen)
+        self.assertIs(tree.children[0], shallow.children[0])
+
+    def test_frozen_list_values_are_immutable(self):
+        operand = Operand(field=['name', 'alias'], field_type='default', val=[1, 5], val_type='int_range').freeze()
+
+        self.assertEqual([1, 5], operand['val'])
+        self.assertTrue(isinstance(operand.field, list))
+        self.assertRaises(FrozenNodeError, operand['val'].append, 6)
+        self.assertRaises(FrozenNodeError, operand['val'].__setitem__, 0, 2)
+        self.assertRaises(FrozenNodeError, operand.field.remove, 'alias')
+        self.assertRaises(FrozenNodeError, operand.field.sort)
+
+        for mutable in (copy(operand), deepcopy(operand)):
+            mutable['val'].append(6)
+            mutable.field[0] = 'other'
+            self.assertEqual([1, 5], operand['val'])
+            self.assertEqual(['name', 'alias'], operand.field)
+
+        loaded = pickle.loads(pickle.dumps(operand))
+        self.assertEqual(operand, loaded)
+        self.assertRaises(FrozenNodeError, loaded['val'].append, 6)
+
+    def test_pickle_keeps_frozen_state(self):
+        tree = Or([Operand(**self.o1), Not([Operand(**self.o2)])])
+        tree.children[1].freeze()
+
+        loaded = pickle.loads(pickle.dumps(tree))
+        self.assertFalse(loaded.is_frozen)
+        self.assertFalse(loaded.children[0].is_frozen)
+        self.assertTrue(loaded.children[1].is_frozen)
+        self.assertTrue(loaded.children[1].children[0].is_frozen)
+        self.assertEqual(self.o2, loaded.children[1].children[0])
+
+        operand = pickle.loads(pickle.dumps(Operand(**self.o1).freeze()))
+        self.assertTrue(operand.is_frozen)
+        self.assertEqual(self.o1, operand)
+
+    def _shape(self, node):
+        return node['val'] if node.is_leaf else (node.type, [self._shape(child) for child in node.children])
+
+    def _chain(self, op_class, values):
+        tree = Operand(val=values[0])
+        for value in values[1:]:
+            tree = op_class([tree, Operand(val=value)])
+
+        return tree
+
+    def test_flatten(self):
+        tree = Or([self._chain(And, 'abc'), Or([Operand(val='d'), Not([self._chain(Or, 'ef')])])]).freeze()
+        flat = tree.flatten()
+
+        self.assertEqual(('or', [('and', ['a', 'b', 'c']), 'd', ('not', [('or', ['e', 'f'])])]), self._shape(flat))
+        self.assertEqual(tree.leaves(), flat.leaves())
+        self.assertEqual(tree.leaves(ignore_negated=True), flat.leaves(ignore_negated=True))
+        self.assertIs(tree.children[1].children[1], flat.children[2])  # unchanged subtrees are shared
+        self.assertIs(tree.children[0].children[1], flat.children[0].children[2])
+        self.assertIs(flat, flat.flatten())
+
+        leaf = Operand(**self.o1)
+        self.assertIs(leaf, leaf.flatten())
+        self.assertIs(None, flatten_tree(None))
+
+    def test_binarize(self):
+        tree = self._chain(Or, 'abcd')
+        flat = tree.flatten()
+
+        self.assertEqual(('or', ['a', 'b', 'c', 'd']), self._shape(flat))
+        self.assertEqual(self._shape(tree), self._shape(flat.binarize()))
+        self.assertIs(tree, tree.binarize())
+
+    def test_balance(self):
+        tree = self._chain(Or, 'abcdefg')
+        balanced = tree.balance()
+
+        self.assertEqual(('or', [('or', [('or', ['a', 'b']), ('or', ['c', 'd'])]),
+                                 ('or', [('or', ['e', 'f']), 'g'])]), self._shape(balanced))
+        self.assertEqual(self._shape(balanced), self._shape(tree.flatten().balance()))
+
+        tree = And([Not([self._chain(And, 'ab')]), self._chain(Or, 'cde')])
+        self.assertEqual(('and', [('not', [('and', ['a', 'b'])]), ('or', [('or', ['c', 'd']), 'e'])]),
+                         self._shape(tree.balance()))
+
+    def test_long_chains(self):
+        tree = self._chain(Or, list(range(20000)))
+
+        flat = tree.flatten()
+        self.assertEqual(20000, len(flat.children))
+        self.assertEqual(list(range(20000)), [leaf['val'] for leaf in flat.leaves()])
+
+        node, depth = tree.balance(), 0
+        while not node.is_leaf:
+            node, depth = node.children[0], depth + 1
+
+        self.assertEqual(15, depth)
+        self.assertEqual(20000, len(flat.binarize().flatten().children))
+
+    def test_walk(self):
+        a, b, c = [Operand(val=v) for v in 'abc']
+        not_b = Not([b])
+        tree = Or([And([a, not_b]), c])
+
+        self.assertEqual([tree, tree.children[0], a, not_b, b, c], list(tree.walk()))
+        self.assertEqual([a, b, not_b, tree.children[0], c, tree], list(tree.walk(POST_ORDER)))
+        self.assertEqual([tree, tree.children[0], a, c], list(tree.walk(PRE_ORDER, ignore_negated=True)))
+        self.assertEqual([a], list(a.walk()))
+        self.assertRaises(TreeNodeError, list, tree.walk('in'))
+
+    def test_iter_leaves_and_find(self):
+        tree = Or([And([Operand(val='a'), Not([Operand(val='b')])]), Operand(val='c')])
+
+        self.assertEqual(['a', 'b', 'c'], [leaf['val'] for leaf in tree.iter_leaves()])
+        self.assertEqual(['a', 'c'], [leaf['val'] for leaf in tree.iter_leaves(ignore_negated=True)])
+        self.assertEqual(tree.leaves(), list(tree.iter_leaves()))
+
+        self.assertIs(tree.children[1], tree.find(lambda node: node.is_leaf and node['val'] == 'c'))
+        self.assertIs(None, tree.find(lambda node: node.is_leaf and node['val'] == 'b', ignore_negated=True))
+        self.assertEqual(Not.type, tree.find(lambda node: not node.is_leaf and node.type == Not.type).type)
+
+    def test_walk_stops_early(self):
+        visited = []
+
+        class Recording(Operand):
+            @property
+            def is_leaf(self):
+                visited.append(self['val'])
+                return True
+
+        tree = self._chain(Or, 'ab')
+        tree = Or([tree, Recording(val='late')])
+
+        self.assertEqual('a', next(tree.iter_leaves())['val'])
+        self.assertEqual('a', tree.find(lambda node: node.is_leaf)['val'])
+        self.assertEqual([], visited)
+
+    def test_walk_deep_trees(self):
+        tree = self._chain(Or, list(range(20000)))
+
+        self.assertEqual(list(range(20000)), [leaf['val'] for leaf in tree.leaves()])
+        self.assertEqual(39999, sum(1 for _ in tree.walk(POST_ORDER)))
+
+        operators = []
+        tree.traverse(node_callback=operators.append)
+        self.assertEqual(19999, len(operators))
+
 if __name__ == '__main__':
     unittest.main()
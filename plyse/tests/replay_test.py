@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from plyse.__main__ import main
+from plyse.replay import ReplayError, ReplayResult, ReplayStats, load_conf, percentile, read_log, replay
+
+
+class ReplayTester(unittest.TestCase):
+
+    log = ['name:peter and age:1..5\n', '\n', 'hello or world\n', 'a:(\n', '-status:"open"\r\n']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _file(self, name, content):
+        path = os.path.join(self.directory, name)
+
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+        return path
+
+    def test_read_log(self):
+        self.assertEqual([(1, 'name:peter and age:1..5'), (3, 'hello or world'), (4, 'a:('), (5, '-status:"open"')],
+                         list(read_log(self.log)))
+
+    def test_replay(self):
+        results = list(replay(read_log(self.log), chunksize=2))
+
+        self.assertEqual([1, 3, 4, 5], [r.line for r in results])
+        self.assertEqual([{'field': 'name', 'field_type': 'attribute', 'val': 'peter', 'val_type': 'partial_string'},
+                          {'field': 'age', 'field_type': 'attribute', 'val': [1, 5], 'val_type': 'int_range'}],
+                         results[0].terms)
+        self.assertIsNone(results[0].error)
+        self.assertIsNone(results[2].terms)
+        self.assertTrue(results[2].error.startswith('ParseException: '))
+        self.assertTrue(all(r.latency >= 0 for r in results))
+
+    def test_replay_workers(self):
+        log = list(read_log(self.log * 10))
+        results = list(replay(log, workers=2, chunksize=3))
+
+        self.assertEqual([line for line, _ in log], [r.line for r in results])
+        self.assertEqual([r[:4] for r in replay(log)], [r[:4] for r in results])
+
+    def test_stats(self):
+        stats = ReplayStats(slowest=2)
+
+        for i, latency in enumerate([0.003, 0.001, 0.004, 0.002]):
+            stats.add(ReplayResult(i, 'q%d' % i, None if i == 1 else [], 'ParseException: x' if i == 1 else None,
+                                   latency))
+        stats.finish()
+        report = stats.report()
+
+        self.assertEqual(4, report.queries)
+        self.assertEqual(1, report.failures)
+        self.assertEqual({'ParseException': 1}, report.errors)
+        self.assertEqual(0.002, report.p50)
+        self.assertEqual(0.004, report.p99)
+        self.assertEqual([(0.004, 2, 'q2'), (0.003, 0, 'q0')], report.slowest)
+        self.assertEqual(report.elapsed, stats.report().elapsed)
+
+        self.assertEqual(0.0, ReplayStats().report().p95)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(7, percentile([7], 99))
+
+    def test_load_conf(self):
+        conf = {'term_parser': {'class': 'plyse.term_parser.TermParser', 'default_fields': ['name'], 'aliases': {}}}
+
+        self.assertEqual(conf, load_conf(self._file('conf.json', json.dumps({'grammar': conf}))))
+        self.assertEqual(conf, load_conf(self._file('plain.json', json.dumps(conf))))
+        self.assertRaises(ReplayError, load_conf, self._file('list.json', '[1]'))
+
+        results = list(replay([(1, 'hello')], conf=conf))
+        self.assertEqual('name', results[0].terms[0]['field'])
+
+    def test_main(self):
+        log = self._file('queries.log', u''.join(self.log))
+        terms = os.path.join(self.directory, 'terms.jsonl')
+        stdout = io.StringIO()
+
+        self.assertEqual(0, main([log, '--output', terms, '--slowest', '1'], stdout=stdout))
+        report = stdout.getvalue()
+        self.assertIn('queries     4\n', report)
+        self.assertIn('failures    1 (ParseException: 1)\n', report)
+        self.assertEqual(1, len(report.split('slowest\n')[1].splitlines()))
+
+        with io.open(terms, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([1, 3, 4, 5], [line['line'] for line in lines])
+        self.assertEqual('hello', lines[1]['terms'][0]['val'])
+
+        self.assertEqual(1, main([log, '--max-failures', '0'], stdout=io.StringIO()))
+
+        # terms to stdout and the report to stderr
+        stdout, stderr = io.StringIO(), io.StringIO()
+        self.assertEqual(0, main(['-', '--output', '-'], stdin=io.StringIO(u'a:1\n'), stdout=stdout, stderr=stderr))
+        self.assertEqual(1, json.loads(stdout.getvalue())['terms'][0]['val'])
+        self.assertIn('queries     1\n', stderr.getvalue())
+
+        stderr = io.StringIO()
+        self.assertEqual(2, main([log, '--conf', self._file('bad.json', '[')], stderr=stderr))
+        self.assertIn("Can't load the configuration", stderr.getvalue())
+
+        stderr = io.StringIO()
+        self.assertEqual(2, main([os.path.join(self.directory, 'missing.log')], stderr=stderr))
+        self.assertIn("Can't open the query log", stderr.getvalue())
+
+        stderr = io.StringIO()
+        self.assertEqual(2, main([log, '--output', self.directory], stdout=io.StringIO(), stderr=stderr))
+        self.assertIn("Can't open the output", stderr.getvalue())
+
+        stderr = io.StringIO()
+        conf = self._file('conf.json', u'{"term_parser": {"class": "plyse.missing.TermParser"}}')
+        self.assertEqual(2, main([log, '--conf', conf], stderr=stderr))
+        self.assertIn("Can't build the grammar", stderr.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sqlite3
+import unittest
+from plyse.sql_compiler import SQLCompiler, SQLCompilerError, like_pattern
+from plyse.term_parser import Term
+from .fixtures import build_parser, term
+
+
+class SQLCompilerTester(unittest.TestCase):
+
+    rows = [
+        ('Peter Pan', 30, 'open', 'hello world', 'AB1'),
+        ('Mary', 50, 'closed', 'bye', '10%'),
+        ('Jo_hn', 45, 'new', 'hi', 'CD2'),
+    ]
+
+    def setUp(self):
+        self.qp = build_parser()
+        self.compiler = SQLCompiler()
+
+        self.db = sqlite3.connect(':memory:')
+        self.db.execute('CREATE TABLE people (name TEXT, age INT, status TEXT, body TEXT, zip TEXT)')
+        self.db.executemany('INSERT INTO people VALUES (?, ?, ?, ?, ?)', self.rows)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _sql(self, query, compiler=None):
+        tree = self.qp.parse(query).query_as_tree if isinstance(query, str) else query
+        return (compiler or self.compiler).compile(tree)
+
+    def _names(self, query, compiler=None):
+        sql, params = self._sql(query, compiler)
+        return [row[0] for row in self.db.execute('SELECT name FROM people WHERE ' + sql, params)]
+
+    def test_value_types(self):
+        self.assertEqual(("\"name\" LIKE ? ESCAPE '!'", ['%pet%']), self._sql('name:pet'))
+        self.assertEqual(('"name" = ?', ['Mary']), self._sql('name:"Mary"'))
+        self.assertEqual(('"age" = ?', [30]), self._sql('age:30'))
+        self.assertEqual(('"age" BETWEEN ? AND ?', [40, 50]), self._sql('age:40..50'))
+        self.assertEqual(('"age" >= ?', [45]), self._sql('age:>=45'))
+        self.assertEqual(('"age" < ?', [45]), self._sql('age:<45'))
+        self.assertEqual(('"status" IN (?, ?)', ['open', 'new']),
+                         self._sql(term('status', ['open', 'new'], Term.SET % Term.EXACT_STRING)))
+
+        self.assertEqual(['Peter Pan'], self._names('name:pet'))
+        self.assertEqual(['Peter Pan'], self._names('name:"p*n"'))
+        self.assertEqual(['Mary', 'Jo_hn'], self._names('age:40..50'))
+        self.assertEqual(['Mary', 'Jo_hn'], self._names('age:>30'))
+
+        self.assertRaises(SQLCompilerError, self._sql, term('age', 1, 'color'))
+        self.assertRaises(SQLCompilerError, self._sql, term('age', [], Term.SET % Term.INT))
+
+    def test_operators(self):
+        self.assertEqual(("(\"age\" = ? OR \"age\" = ?) AND NOT (\"status\" = ? OR \"name\" LIKE ? ESCAPE '!')",
+                          [30, 45, 'closed', '%x%']), self._sql('(age:30 or age:45) and -(status:"closed" or name:x)'))
+        self.assertEqual(('NOT ("age" = ?)', [30]), self._sql('-age:30'))
+        self.assertEqual(('NOT (NOT ("age" = ?))', [30]), self._sql('--age:30'))
+
+        self.assertEqual(['Mary', 'Jo_hn'], self._names('-age:30'))
+        self.assertEqual(['Jo_hn'], self._names('hi or (age:50 and -status:"closed")', SQLCompiler(default_columns=['body'])))
+        self.assertEqual(('1 = 1', []), self.compiler.compile(None))
+
+    def test_like_escaping(self):
+        self.assertEqual('%a!%b!_c!!d%e%', like_pattern('a%b_c!d*e'))
+        self.assertEqual(['Mary'], self._names('zip:"0%*"'))
+        self.assertEqual(['Jo_hn'], self._names('name:o_'))
+
+    def test_columns(self):
+        compiler = SQLCompiler(columns={'who': 'name', ('address', 'zip'): 'zip'}, default_columns=['name', 'status'])
+
+        self.assertEqual(['Mary'], self._names('who:"Mary"', compiler))
+        self.assertEqual(['Peter Pan'], self._names(term(['address', 'zip'], 'ab', Term.PARTIAL_STRING), compiler))
+        self.assertEqual(("(name LIKE ? ESCAPE '!' OR status LIKE ? ESCAPE '!')", ['%ne%', '%ne%']),
+                         self._sql('ne', compiler))
+        self.assertEqual(['Jo_hn'], self._names('ne', compiler))
+
+        default_fields = build_parser(['name', 'body']).parse('h')
+        self.assertEqual(['Peter Pan', 'Jo_hn'], self._names(default_fields.query_as_tree))
+
+    def test_no_default_fields(self):
+        query = build_parser([]).parse('bar name:pet')
+
+        self.assertEqual(('1 = 0 OR "name" LIKE ? ESCAPE \'!\'', ['%pet%']), self._sql(query.query_as_tree))
+        self.assertEqual(['Peter Pan'], self._names(query.query_as_tree))
+        self.assertEqual(['Peter Pan', 'Mary', 'Jo_hn'], self._names(build_parser([]).parse('-bar').query_as_tree))
+
+    def test_invalid_columns(self):
+        # no query string parses into these fields
+        self.assertRaises(SQLCompilerError, self._sql, term('age; DROP TABLE people', 1, Term.INT))
+        self.assertRaises(SQLCompilerError, self._sql, term('a b', 1, Term.INT))
+        self.assertEqual(('"people"."age" = ?', [1]), self._sql(term('people.age', 1, Term.INT)))
+        self.assertEqual(('"address_zip" = ?', [1]), self._sql(term(['address', 'zip'], 1, Term.INT)))
+
+    def test_quoted_columns(self):
+        # reserved words are columns too
+        self.db.execute('CREATE TABLE orders ("order" INT, "group" TEXT, "is" TEXT)')
+        self.db.execute('INSERT INTO orders VALUES (5, ?, ?)', ['abc', 'x'])
+        sql, params = self._sql('order:5 and group:b and is:"x"')
+
+        self.assertEqual('("order" = ? AND "group" LIKE ? ESCAPE \'!\') AND "is" = ?', sql)
+        self.assertEqual([(5,)], list(self.db.execute('SELECT "order" FROM orders WHERE ' + sql, params)))
+
+        self.assertEqual(('`people`.`age` = ?', [1]), self._sql(term('people.age', 1, Term.INT), SQLCompiler(quote='`')))
+        self.assertEqual(('age = ?', [1]), self._sql('age:1', SQLCompiler(quote=None)))
+        self.assertRaises(SQLCompilerError, SQLCompiler, quote="'")
+
+    def test_paramstyles(self):
+        query = 'a:1 or -b:2..3'
+
+        self.assertEqual(('"a" = %s OR NOT ("b" BETWEEN %s AND %s)', [1, 2, 3]),
+                         self._sql(query, SQLCompiler(paramstyle='format')))
+        self.assertEqual(('"a" = :1 OR NOT ("b" BETWEEN :2 AND :3)', [1, 2, 3]),
+                         self._sql(query, SQLCompiler(paramstyle='numeric')))
+        self.assertEqual(('"a" = :p0 OR NOT ("b" BETWEEN :p1 AND :p2)', {'p0': 1, 'p1': 2, 'p2': 3}),
+                         self._sql(query, SQLCompiler(paramstyle='named')))
+        self.assertEqual(('"a" = %(p0)s OR NOT ("b" BETWEEN %(p1)s AND %(p2)s)', {'p0': 1, 'p1': 2, 'p2': 3}),
+                         self._sql(query, SQLCompiler(paramstyle='pyformat')))
+        self.assertRaises(SQLCompilerError, SQLCompiler, paramstyle='dollar')
+
+    def test_templates_cache(self):
+        first = self._sql('name:peter and age:3..5')
+        second = self._sql('name:mary and age:1..2')
+
+        self.assertIs(first[0], second[0])
+        self.assertEqual(['%mary%', 1, 2], second[1])
+        self.assertEqual((1, 1), self.compiler.cache_info()[:2])
+
+        # a different amount of values is a different shape
+        self._sql(term('status', ['a', 'b'], Term.SET % Term.EXACT_STRING))
+        self._sql(term('status', ['a', 'b', 'c'], Term.SET % Term.EXACT_STRING))
+        self.assertEqual((1, 3), self.compiler.cache_info()[:2])
+
+        self.compiler.cache_clear()
+        self.assertEqual(0, self.compiler.cache_info().currsize)
+
+    def test_query_to_sql(self):
+        query = self.qp.parse('name:pet and age:30')
+
+        self.assertEqual(("\"name\" LIKE ? ESCAPE '!' AND \"age\" = ?", ['%pet%', 30]), query.to_sql())
+        self.assertEqual(("\"name\" LIKE :1 ESCAPE '!' AND \"age\" = :2", ['%pet%', 30]),
+                         query.to_sql(SQLCompiler(paramstyle='numeric')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@ from plyse.expressions.primitives import IntegerComparison
 
 class TermParserTester(unittest.TestCase):
 
+    engine = None
+
     def _init_and_parse(self, input_str):
         conf = {
             'class': 'plyse.term_parser.TermParser',
@@ -20,7 +22,7 @@ class TermParserTester(unittest.TestCase):
         }
 
         term_parser = TermParserFactory.build_from_conf(conf)
-        g = GrammarFactory.build_default(term_parser)
+        g = GrammarFactory.build_default(term_parser, engine=self.engine)
         g.add_value_type(IntegerComparison(term_parser.integer_comparison_parse))
         self.assertTrue(g.parse(input_str, True))
 
@@ -79,5 +81,10 @@ class TermParserTester(unittest.TestCase):
         r = self._init_and_parse("age:<=18")
         self._check_values(r, 'age', 18, Term.LOWER_EQUAL_THAN)
 
+
+class RegexTermParserTester(TermParserTester):
+
+    engine = 'regex'
+
 if __name__ == '__main__':
     unittest.main()
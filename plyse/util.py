@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import multiprocessing
+from collections import OrderedDict, namedtuple, deque
+from itertools import islice
+from threading import Lock
 
 
 def load_module(class_path):
@@ -11,3 +15,180 @@ def load_module(class_path):
 
     return m
 
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+    Thread safe, size bounded mapping that evicts the least recently used entry once it's full.
+    A maxsize of 0 disables the cache (nothing gets stored) and None leaves it unbounded.
+    """
+
+    _missing = object()
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self._hits = self._misses = self._evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.pop(key, self._missing)
+
+            if value is self._missing:
+                self._misses += 1
+                return default
+
+            # re-inserting moves the key to the most recently used end
+            self._data[key] = value
+            self._hits += 1
+
+            return value
+
+    def set(self, key, value):
+        if self._maxsize == 0:
+            return
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+
+            while self._maxsize is not None and len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions, self._maxsize, len(self._data))
+
+    def __reduce__(self):
+        # the lock can't be pickled, caches are pickled empty
+        return self.__class__, (self._maxsize,)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class PackratCache(object):
+    """
+    Size bounded packrat memo with the interface pyparsing expects (see ParserElement._parseCache), evicting the
+    oldest entries first like pyparsing's own one does. It has no lock of its own, it's meant to be used while
+    holding ParserElement.packrat_cache_lock. pyparsing clears the memo at the beginning of each parse, the
+    statistics are kept so they add up over all the parses.
+    """
+
+    not_in_cache = object()
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._hits = self._misses = self._evictions = 0
+
+    def get(self, key):
+        value = self._data.get(key, self.not_in_cache)
+
+        if value is self.not_in_cache:
+            self._misses += 1
+        else:
+            self._hits += 1
+
+        return value
+
+    def set(self, key, value):
+        self._data[key] = value
+
+        if self._maxsize is not None and len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def reset(self):
+        self._data.clear()
+        self._hits = self._misses = self._evictions = 0
+
+    def info(self):
+        return CacheInfo(self._hits, self._misses, self._evictions, self._maxsize, len(self._data))
+
+    def __reduce__(self):
+        return PackratCache, (self._maxsize,)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def chunks(iterable, size):
+    """
+    Lists of up to :size consecutive items of :iterable, consumed lazily
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def map_chunks(function, iterable, chunksize=100, workers=1, setup=None, setup_args=()):
+    """
+    Applies :function to chunks of :iterable, yielding the items of every result in the same order as the input.
+    The input is consumed lazily, with more than 1 worker only a few chunks per worker are in flight so it's never
+    read far ahead of the output.
+
+    :param function: module level function taking the state and a chunk (list), returning a list of results
+    :param chunksize: amount of items per chunk
+    :param workers: amount of processes to apply :function in
+    :param setup: module level function building the state out of :setup_args, called once in each process. None
+                  uses :setup_args as the state
+    :return: generator of results
+    """
+    if workers <= 1:
+        state = setup(*setup_args) if setup is not None else setup_args
+
+        for chunk in chunks(iterable, chunksize):
+            for result in function(state, chunk):
+                yield result
+
+        return
+
+    pool = multiprocessing.Pool(workers, _init_chunk_worker, (setup, setup_args))
+
+    try:
+        pending = deque()
+
+        for chunk in chunks(iterable, chunksize):
+            pending.append(pool.apply_async(_run_chunk_worker, (function, chunk)))
+
+            if len(pending) >= workers * 2:
+                for result in pending.popleft().get():
+                    yield result
+
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# state of each map_chunks worker process, set once when the pool starts
+_chunk_worker = {}
+
+
+def _init_chunk_worker(setup, setup_args):
+    _chunk_worker['state'] = setup(*setup_args) if setup is not None else setup_args
+
+
+def _run_chunk_worker(function, chunk):
+    return function(_chunk_worker['state'], chunk)
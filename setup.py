@@ -19,6 +19,9 @@ setup(
     install_requires=[
         'pyparsing',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     version=get_version('plyse'),
     url='https://github.com/sebastiandev/plyse',
     author='Sebastian Packmann',